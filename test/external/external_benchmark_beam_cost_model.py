@@ -0,0 +1,46 @@
+import os, time
+from tinygrad import Tensor, Device
+from tinygrad.helpers import getenv, diskcache_put
+from tinygrad.codegen.linearizer import Linearizer
+from tinygrad.engine import search
+from tinygrad.ops import LoadOps
+
+# fit the default cost model on the kernels of some nets, then compare BEAM with and without it on the kernels of others
+# run with a fresh CACHEDB, the searches and the samples are cached
+def kernels(out:Tensor): return [si.ast for si in out.schedule() if si.ast[0].op not in LoadOps]
+def train_kernels():
+  ret = []
+  for b,cin,cout,hw,k in [(4,16,32,32,3), (1,32,32,28,3), (8,3,16,32,3), (1,64,64,14,3), (1,16,64,16,1)]:
+    ret += kernels(Tensor.rand(b, cin, hw, hw).conv2d(Tensor.rand(cout, cin, k, k)).relu())
+  for m,k,n in [(128,256,64), (64,512,64), (512,64,512), (32,32,32), (1,1024,1024), (1024,1024,1)]: ret += kernels(Tensor.rand(m, k) @ Tensor.rand(k, n))
+  return ret + kernels((Tensor.rand(256, 512).softmax() * 2).sum(0)) + kernels(Tensor.rand(64, 64, 64).max(1).exp()) + \
+         kernels(Tensor.rand(4096, 256).sum(1)) + kernels(Tensor.rand(256, 4096).sum(0)) + kernels(Tensor.rand(128, 128, 16).permute(2, 0, 1) * 2)
+def test_kernels():
+  x = Tensor.rand(2, 8, 48, 48)
+  return kernels(x.conv2d(Tensor.rand(16, 8, 5, 5)).relu()) + kernels(Tensor.rand(256, 128) @ Tensor.rand(128, 256)) + \
+         kernels(Tensor.rand(1024, 64).mean(1).sqrt()) + kernels(Tensor.rand(96, 96).T.contiguous() + 1)
+
+def search_all(asts, amt):
+  tm, ret = time.perf_counter(), []
+  for ast in asts:
+    lin = Linearizer(*ast, opts=Device[Device.DEFAULT].renderer)
+    ret.append(search.time_linearizer(search.beam_search(lin, bufs:=search.bufs_from_lin(lin), amt), bufs, disable_cache=True))
+  return time.perf_counter()-tm, ret
+
+def with_env(**kwargs):
+  os.environ.update({k:str(v) for k,v in kwargs.items()})
+  getenv.cache_clear()
+
+if __name__ == "__main__":
+  AMT = getenv("AMT", 2)
+  with_env(IGNORE_BEAM_CACHE=1, BEAM_COST_MIN_SAMPLES=1<<30)
+  full_tm, full = search_all(test_kernels(), AMT)
+  # only the training kernels are samples of the model
+  diskcache_put("beam_cost_samples", {"device": Device.DEFAULT, "suffix": Device[Device.DEFAULT].renderer.suffix}, None)
+  train_tm, _ = search_all(train_kernels(), AMT)
+  print(f"timed every candidate of the training kernels in {train_tm:.2f}s")
+  with_env(BEAM_COST_MIN_SAMPLES=0)
+  model_tm, pruned = search_all(test_kernels(), AMT)
+  for a,b in zip(full, pruned): print(f"{a*1e6:10.2f} us -> {b*1e6:10.2f} us  {b/a:5.2f}x")
+  print(f"{Device.DEFAULT} BEAM={AMT}: {full_tm:.2f}s without the cost model, {model_tm:.2f}s with it, {full_tm/model_tm:.1f}x faster search")
+  if search.beam_pool is not None: search.beam_pool.terminate()
@@ -0,0 +1,22 @@
+import time
+from tinygrad import Tensor, Device
+from tinygrad.helpers import getenv
+from tinygrad.codegen.linearizer import Linearizer
+from tinygrad.engine import search
+from tinygrad.ops import LoadOps
+
+# BEAM a few kernels of a small conv net on a CPU device, compile and timing stats are reported separately
+# on CPU devices the compile workers default to one less than the cores, the last core times. run with IGNORE_BEAM_CACHE=1
+if __name__ == "__main__":
+  AMT = getenv("AMT", 2)
+  x, w1, w2 = Tensor.rand(1, 16, 32, 32), Tensor.rand(32, 16, 3, 3), Tensor.rand(10, 32*30*30)
+  out = (x.conv2d(w1).relu().flatten(1) @ w2.T).softmax()
+  asts = [si.ast for si in out.schedule() if si.ast[0].op not in LoadOps][:getenv("CNT", 4)]
+  st = time.perf_counter()
+  for ast in asts:
+    lin = Linearizer(*ast, opts=Device[Device.DEFAULT].renderer)
+    kst = time.perf_counter()
+    search.beam_search(lin, search.bufs_from_lin(lin), AMT)
+    print(f"{time.perf_counter()-kst:7.2f}s {lin.colored_shape():60s} {search.beam_stats}")
+  print(f"{Device.DEFAULT} BEAM={AMT}: {len(asts)} kernels in {time.perf_counter()-st:.2f}s, pool: {search.beam_pool}")
+  if search.beam_pool is not None: search.beam_pool.terminate()
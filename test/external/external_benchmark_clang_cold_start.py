@@ -0,0 +1,22 @@
+import os
+os.environ["DISABLE_COMPILER_CACHE"] = "1" # measure the compiles, not the disk cache
+from tinygrad import Tensor, Device
+from tinygrad.ops import BufferOps
+from tinygrad.helpers import Timing, getenv
+from tinygrad.engine.realize import method_cache, get_runner, precompile_schedule
+from extra.models.resnet import ResNet50
+
+# the time from a ResNet-50 schedule to runnable kernels: one clang call per kernel vs batches of kernels in one shared object
+if __name__ == "__main__":
+  BS, WORKERS = getenv("BS", 1), getenv("WORKERS", os.cpu_count())
+  model = ResNet50()
+  sched = model(Tensor.empty(BS, 3, 224, 224)).schedule()
+  kernels = [si for si in sched if si.ast[0].op is BufferOps.STORE]
+  print(f"{Device.DEFAULT}: {len(kernels)} kernels in the ResNet-50 schedule")
+  method_cache.clear()
+  with Timing("one clang call per kernel:  "):
+    for si in kernels: get_runner(si.outputs[0].device, si.ast)
+  for batch in [1, 16, 64]:
+    method_cache.clear()
+    with Timing(f"COMPILE_BATCH={batch:<3d} {WORKERS:2d} workers: "): precompile_schedule(sched, workers=WORKERS, batch=batch)
+    print(f"  {len(set(r.lib for r in method_cache.values()))} shared objects")
@@ -0,0 +1,23 @@
+import os, time
+from tinygrad import Tensor, Device
+from tinygrad.helpers import Context, getenv
+from tinygrad.engine.realize import run_schedule
+
+# GEMM GFLOPS on the CPU backends as the number of threads grows
+if __name__ == "__main__":
+  N, CNT = getenv("N", 1024), getenv("CNT", 5)
+  print(f"{Device.DEFAULT}: {N}x{N} GEMM on {os.cpu_count()} cores")
+  a, b = Tensor.rand(N, N).realize(), Tensor.rand(N, N).realize()
+  base = None
+  for threads in [t for t in [1, 2, 4, 8, 16, 32, 64] if t <= (os.cpu_count() or 1)]:
+    with Context(CPU_THREADS=threads):
+      tms = []
+      for _ in range(CNT):
+        sched = (a @ b).schedule()
+        st = time.perf_counter()
+        run_schedule(sched)
+        Device[Device.DEFAULT].synchronize()
+        tms.append(time.perf_counter() - st)
+    tm = min(tms)
+    base = base or tm
+    print(f"CPU_THREADS={threads:2d}: {tm*1e3:8.2f} ms {2*N**3/tm*1e-9:8.2f} GFLOPS {base/tm:5.2f}x")
@@ -0,0 +1,30 @@
+import time
+import numpy as np
+from tinygrad import Tensor, Device
+from tinygrad.helpers import getenv
+from tinygrad.engine.realize import lower_schedule_item
+
+# GFLOPS of the hand coded CPU tiles for GEMM and conv shapes, against numpy for the GEMMs
+def bench(name:str, t:Tensor, flops:int, cnt:int):
+  ei = lower_schedule_item(t.schedule()[-1])
+  ei.run()
+  tms = []
+  for _ in range(cnt):
+    st = time.perf_counter()
+    ei.run()
+    tms.append(time.perf_counter() - st)
+  print(f"{name:30s} {flops/min(tms)*1e-9:8.2f} GFLOPS  {ei.prg.p.name}")
+
+if __name__ == "__main__":
+  CNT, renderer = getenv("CNT", 10), Device[Device.DEFAULT].renderer
+  print(f"{Device.DEFAULT}: {renderer.cpu}, vector widths {renderer.vector_widths}")
+  for n in [256, 512, 1024]:
+    a, b = Tensor.rand(n, n).realize(), Tensor.rand(n, n).realize()
+    bench(f"gemm {n}", a @ b, 2*n**3, CNT)
+    na, nb = a.numpy(), b.numpy()
+    st = time.perf_counter()
+    for _ in range(CNT): na @ nb
+    print(f"{f'numpy gemm {n}':30s} {2*n**3*CNT/(time.perf_counter()-st)*1e-9:8.2f} GFLOPS")
+  for cin,cout,hw in [(64, 64, 58), (128, 128, 30), (256, 256, 16)]:
+    x, w = Tensor.rand(1, cin, hw, hw).realize(), Tensor.rand(cout, cin, 3, 3).realize()
+    bench(f"conv {cin}->{cout} {hw}x{hw}", x.conv2d(w), 2*cin*cout*9*(hw-2)**2, CNT)
@@ -0,0 +1,42 @@
+import gc, sys, time, tracemalloc
+from tinygrad import Tensor, dtypes
+from tinygrad.helpers import getenv
+from tinygrad.lazy import LazyBuffer
+from tinygrad.shape.shapetracker import ShapeTracker
+from tinygrad.shape.view import View
+from tinygrad.shape.symbolic import Node
+from tinygrad.codegen.uops import UOp
+from tinygrad.codegen.linearizer import Linearizer
+from extra.models.transformer import Transformer
+
+# time and trace the memory of building the forward and backward lazy graph of a big transformer, without realizing it
+def build(layers:int):
+  model = Transformer(syms=10, maxlen=32, layers=layers, embed_dim=128, num_heads=4, ff_dim=256)
+  loss = model.forward(Tensor.zeros(4, 32, dtype=dtypes.int32)).mean()
+  loss.backward()
+  return model, loss
+
+def sizeof(x) -> int: return sys.getsizeof(x) + (sys.getsizeof(x.__dict__) if hasattr(x, "__dict__") else 0)
+
+if __name__ == "__main__":
+  LAYERS = getenv("LAYERS", 24)
+  build(1)
+  tms = []
+  for _ in range(getenv("CNT", 3)):
+    gc.collect()
+    st = time.perf_counter()
+    graph = build(LAYERS)
+    tms.append(time.perf_counter() - st)
+    del graph
+  gc.collect()
+  tracemalloc.start()
+  graph = build(LAYERS)
+  mem = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  print(f"built the graph of {LAYERS} layers in {min(tms)*1e3:.2f} ms best, holding {mem/1e6:.2f} MB")
+  # and the symbolic nodes and uops of a linearized kernel
+  (lin:=Linearizer(*Tensor.empty(64, 64, 3, 3).conv2d(Tensor.empty(64, 64, 3, 3), padding=1).schedule()[-1].ast)).hand_coded_optimizations()
+  lin.linearize()
+  objs = gc.get_objects()
+  for t in [LazyBuffer, ShapeTracker, View, Node, UOp]:
+    if len(xs:=[x for x in objs if isinstance(x, t)]): print(f"{len(xs):8d} {t.__name__:12s} {sum(sizeof(x) for x in xs)/len(xs):7.1f} bytes each")
@@ -0,0 +1,44 @@
+import time
+from tinygrad import Tensor, Device, dtypes
+from tinygrad.helpers import getenv
+from tinygrad.codegen.kernel import Opt, OptOps
+from tinygrad.codegen.linearizer import Linearizer
+from tinygrad.codegen.uops import UOpGraph
+from tinygrad.renderer.cstyle import CUDARenderer
+
+# time Linearizer.linearize() and the UOpGraph.linearize() of it on big upcasted kernels, the share of graph_rewrite is reported
+rewrite_tm = 0.0
+def timed_graph_rewrite(self, sink, pm):
+  global rewrite_tm
+  st = time.perf_counter()
+  ret = graph_rewrite(self, sink, pm)
+  rewrite_tm += time.perf_counter() - st
+  return ret
+graph_rewrite, UOpGraph.graph_rewrite = UOpGraph.graph_rewrite, timed_graph_rewrite  # type: ignore
+
+def bench(name:str, t:Tensor, opts, renderer, cnt:int):
+  global rewrite_tm
+  ast = t.schedule()[-1].ast
+  tms, rewrite_tms = [], []
+  for _ in range(cnt):
+    lin = Linearizer(*ast, opts=renderer)
+    if opts is None: lin.hand_coded_optimizations()
+    else:
+      for o in opts: lin.apply_opt(o)
+    rewrite_tm, st = 0.0, time.perf_counter()
+    lin.linearize().uops.linearize()
+    tms.append(time.perf_counter() - st)
+    rewrite_tms.append(rewrite_tm)
+  print(f"{name:40s} {min(tms)*1e3:9.2f} ms linearize, {min(rewrite_tms)*1e3:9.2f} ms graph_rewrite, {len(lin.uops.uops):6d} uops")
+
+if __name__ == "__main__":
+  CNT, renderer = getenv("CNT", 3), Device[Device.DEFAULT].renderer
+  a, b = Tensor.empty(512, 512), Tensor.empty(512, 512)
+  bench("gemm 512, hand coded", a @ b, None, renderer, CNT)
+  bench("gemm 512, 8x16 tile unroll 4", a @ b, [Opt(OptOps.UPCAST, 0, 8), Opt(OptOps.UPCAST, 1, 16), Opt(OptOps.UNROLL, 0, 4)], renderer, CNT)
+  x, w = Tensor.empty(1, 64, 34, 34), Tensor.empty(64, 64, 3, 3)
+  bench("conv 3x3, hand coded", x.conv2d(w), None, renderer, CNT)
+  bench("conv 3x3, unrolled filter", x.conv2d(w), [Opt(OptOps.UPCAST, 0, 4), Opt(OptOps.UPCAST, 2, 4), Opt(OptOps.UNROLL, 2, 0),
+                                                   Opt(OptOps.UNROLL, 1, 0)], renderer, CNT)
+  bench("gemm 1024, CUDA tensor cores", Tensor.empty(1024, 1024, dtype=dtypes.half) @ Tensor.empty(1024, 1024, dtype=dtypes.half),
+        [Opt(OptOps.TC, 0, 0), Opt(OptOps.UPCAST, 0, 4), Opt(OptOps.UPCAST, 1, 4), Opt(OptOps.UNROLL, 0, 4)], CUDARenderer("sm_80"), CNT)
@@ -0,0 +1,28 @@
+import time
+from tinygrad import Tensor, Device
+from tinygrad.helpers import getenv
+from tinygrad.engine.realize import lower_schedule, method_cache
+
+# reduce heavy kernels on CLANG, and on LLVM with and without LLVM_FASTMATH (FMA contraction and reassociation of reduces)
+def bench(t:Tensor, cnt:int) -> float:
+  eis = list(lower_schedule(t.schedule()))
+  for ei in eis: ei.run()
+  tms = []
+  for _ in range(cnt):
+    st = time.perf_counter()
+    for ei in eis: ei.run()
+    tms.append(time.perf_counter() - st)
+  return min(tms)
+
+if __name__ == "__main__":
+  CNT, N = getenv("CNT", 10), getenv("N", 2048)
+  kernels = {"sum": lambda x,y: x.sum(), "row sum": lambda x,y: x.sum(1), "dot": lambda x,y: (x*y).sum(), "row dot": lambda x,y: (x*y).sum(1),
+             "matvec": lambda x,y: x @ y[0], "gemm 512": lambda x,y: x[:512, :512] @ y[:512, :512]}
+  for name, fxn in kernels.items():
+    ret = []
+    for device, fastmath in [("CLANG", False), ("LLVM", False), ("LLVM", True)]:
+      if device == "LLVM": Device[device].renderer.fastmath = fastmath
+      method_cache.clear()
+      x, y = Tensor.rand(N, N, device=device).realize(), Tensor.rand(N, N, device=device).realize()
+      ret.append(f"{device}{' fastmath' if fastmath else ''} {bench(fxn(x, y), CNT)*1e3:7.3f} ms")
+    print(f"{name:10s}", "   ".join(ret))
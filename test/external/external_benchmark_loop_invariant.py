@@ -0,0 +1,34 @@
+from tinygrad import Tensor, Device, dtypes
+from tinygrad.helpers import getenv
+from tinygrad.codegen.linearizer import Linearizer
+from tinygrad.codegen.uops import UOp, UOps, uop_alu_resolve
+from tinygrad.engine.search import bufs_from_lin, time_linearizer
+
+# count the int ALUs the loops of a kernel run and time it, with the hand coded optimizations and without any
+def trips(rng:UOp) -> int:
+  start, end = uop_alu_resolve(rng.vin[0]), uop_alu_resolve(rng.vin[1])
+  return (end if isinstance(end, int) else end.max) - (start if isinstance(start, int) else start.min)
+
+def index_alus(lin:Linearizer) -> int:
+  ret, mults = 0, [1]
+  for u in lin.linearize().uops:
+    if u.uop is UOps.RANGE: mults.append(mults[-1] * trips(u))
+    elif u.uop is UOps.ENDRANGE: mults.pop()
+    elif u.uop is UOps.ALU and u.dtype is not None and dtypes.is_int(u.dtype): ret += mults[-1]
+  return ret
+
+def bench(name:str, t:Tensor, cnt:int):
+  ast = t.schedule()[-1].ast
+  for hand_coded in [False, True]:
+    lin = Linearizer(*ast, opts=Device[Device.DEFAULT].renderer)
+    if hand_coded: lin.hand_coded_optimizations()
+    tm = time_linearizer(lin, bufs_from_lin(lin), allow_test_size=False, cnt=cnt, disable_cache=True)
+    print(f"{name:24s} {'hand coded' if hand_coded else 'unoptimized':12s} {index_alus(lin):10d} int ALUs {tm*1e6:10.2f} us")
+
+if __name__ == "__main__":
+  CNT = getenv("CNT", 10)
+  bench("conv 3x3 16->16 32x32", Tensor.empty(4, 16, 34, 34).conv2d(Tensor.empty(16, 16, 3, 3)), CNT)
+  bench("conv 5x5 8->32 28x28", Tensor.empty(2, 8, 32, 32).conv2d(Tensor.empty(32, 8, 5, 5)), CNT)
+  bench("gemm 256", Tensor.empty(256, 256) @ Tensor.empty(256, 256), CNT)
+  bench("permute 4d", Tensor.empty(32, 16, 24, 40).permute(2, 0, 3, 1).contiguous(), CNT)
+  bench("pooling 2x2 on a pad", Tensor.empty(8, 16, 62, 62).pad2d((1, 1, 1, 1)).max_pool2d(), CNT)
@@ -0,0 +1,30 @@
+import time
+from tinygrad import Tensor
+from tinygrad.nn.state import get_parameters
+from tinygrad.helpers import getenv
+from tinygrad.ops import BufferOps
+from tinygrad.engine.realize import lower_schedule_item
+from tinygrad.engine.schedule import create_schedule
+from extra.models.resnet import ResNet18
+
+# time lower_schedule_item on the kernels of a ResNet18 forward once they are all in the method_cache
+# every round schedules the net again, so the ASTs are fresh objects like they are in a training loop
+def schedule(model, x): return [si for si in create_schedule([model(x).lazydata]) if si.ast[0].op is BufferOps.STORE]
+
+if __name__ == "__main__":
+  CNT, BS = getenv("CNT", 5), getenv("BS", 2)
+  model, x = ResNet18(), Tensor.empty(BS, 3, 224, 224)
+  Tensor.realize(*get_parameters(model))
+  st = time.perf_counter()
+  for si in (sched:=schedule(model, x)): lower_schedule_item(si)
+  print(f"compiled {len(sched)} kernels in {time.perf_counter()-st:.2f} s")
+  tms, sched_tms = [], []
+  for _ in range(CNT):
+    st = time.perf_counter()
+    sched = schedule(model, x)
+    sched_tms.append(time.perf_counter() - st)
+    st = time.perf_counter()
+    for si in sched: lower_schedule_item(si)
+    tms.append(time.perf_counter() - st)
+  print(f"scheduled in {min(sched_tms)*1e3:.2f} ms best")
+  print(f"lowered {len(sched)} kernels in {min(tms)*1e3:.2f} ms best, {min(tms)/len(sched)*1e6:.2f} us per lower_schedule_item")
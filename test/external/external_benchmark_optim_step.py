@@ -0,0 +1,24 @@
+from tinygrad import Tensor, nn
+from tinygrad.ops import LoadOps
+from tinygrad.helpers import Context, Timing, getenv
+from tinygrad.engine.realize import run_schedule
+
+# the parameters of a small transformer, 12 per layer
+def make_params(layers:int, dim:int):
+  shapes = [(dim, 3*dim), (3*dim,), (dim, dim), (dim,), (dim, 4*dim), (4*dim,), (4*dim, dim), (dim,), (dim,), (dim,), (dim,), (dim,)]
+  params = [Tensor.randn(*shape).realize() for _ in range(layers) for shape in shapes]
+  for p in params: p.grad = Tensor.randn(*p.shape).realize()
+  return params
+
+if __name__ == "__main__":
+  LAYERS, DIM, CNT = getenv("LAYERS", 24), getenv("DIM", 64), getenv("CNT", 5)
+  for fuse in [0, 1]:
+    Tensor.manual_seed(0)
+    params = make_params(LAYERS, DIM)
+    opt = nn.optim.AdamW(params, lr=1e-3)
+    with Tensor.train(), Context(FUSE_HORIZONTAL=fuse):
+      for i in range(CNT):
+        with Timing(f"FUSE_HORIZONTAL={fuse} schedule ", enabled=i==CNT-1): sched = Tensor.empty(1).schedule(*opt.schedule_step())
+        kernels = len([si for si in sched if si.ast[0].op not in LoadOps])
+        with Timing(f"FUSE_HORIZONTAL={fuse} run      ", enabled=i==CNT-1): run_schedule(sched)
+    print(f"FUSE_HORIZONTAL={fuse}: {len(params)} params, {kernels} kernels in AdamW step")
@@ -0,0 +1,20 @@
+from tinygrad import Tensor, Device
+from tinygrad.helpers import Context, Timing, getenv
+from tinygrad.engine.realize import run_schedule
+from tinygrad.engine.schedule import schedule_dag
+
+# a multi-branch network, like an inception block: the branches only share the input and the concat at the end
+def multi_branch(x:Tensor, branches:list) -> Tensor: return Tensor.cat(*[(x @ w1).relu() @ w2 for w1,w2 in branches], dim=1)
+
+if __name__ == "__main__":
+  BRANCHES, DIM, CNT = getenv("BRANCHES", 8), getenv("DIM", 256), getenv("CNT", 5)
+  print(f"{Device.DEFAULT}: {BRANCHES} branches of two {DIM}x{DIM} matmuls")
+  Tensor.manual_seed(0)
+  x = Tensor.randn(DIM, DIM).realize()
+  branches = [(Tensor.randn(DIM, DIM).realize(), Tensor.randn(DIM, DIM).realize()) for _ in range(BRANCHES)]
+  for threads in [0, 2, 4, 8]:
+    with Context(RUN_THREADS=threads):
+      for i in range(CNT):
+        sched = multi_branch(x, branches).schedule()
+        critical_path = schedule_dag(sched).critical_path
+        with Timing(f"RUN_THREADS={threads}: {len(sched)} items, critical path {critical_path:3d} ", enabled=i==CNT-1): run_schedule(sched)
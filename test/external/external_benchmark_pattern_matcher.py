@@ -0,0 +1,41 @@
+import itertools, time
+from typing import Dict
+from tinygrad import Tensor, Device, dtypes
+from tinygrad.helpers import getenv
+from tinygrad.codegen.kernel import Opt, OptOps
+from tinygrad.codegen.linearizer import Linearizer
+from tinygrad.codegen.uops import UOp, _match, constant_folder
+from tinygrad.renderer.cstyle import CUDARenderer
+
+# constant_folder.rewrite on every UOp of big linearized kernels, against trying each pattern with _match
+def interpreted_rewrite(uop:UOp):
+  for p,fxn in itertools.chain(constant_folder.pdict[(uop.uop, uop.arg)], constant_folder.pdict[(uop.uop, None)]):
+    store: Dict[str, UOp] = {}
+    if _match(uop, p, store): return fxn(**store)
+  return None
+
+def bench(name:str, t:Tensor, opts, renderer, cnt:int):
+  lin = Linearizer(*t.schedule()[-1].ast, opts=renderer)
+  if opts is None: lin.hand_coded_optimizations()
+  else:
+    for o in opts: lin.apply_opt(o)
+  uops = list(lin.linearize().uops.nodes.values())
+  tms = {}
+  for fxn_name,fxn in [("interpreted", interpreted_rewrite), ("compiled", constant_folder.rewrite)]:
+    tms[fxn_name] = []
+    for _ in range(cnt):
+      st = time.perf_counter()
+      for u in uops: fxn(u)
+      tms[fxn_name].append(time.perf_counter() - st)
+  print(f"{name:40s} {len(uops):6d} uops, {min(tms['interpreted'])*1e3:8.2f} ms interpreted, {min(tms['compiled'])*1e3:8.2f} ms compiled, "
+        f"{min(tms['interpreted'])/min(tms['compiled']):5.2f}x")
+
+if __name__ == "__main__":
+  CNT, renderer = getenv("CNT", 10), Device[Device.DEFAULT].renderer
+  a, b = Tensor.empty(512, 512), Tensor.empty(512, 512)
+  bench("gemm 512, hand coded", a @ b, None, renderer, CNT)
+  bench("gemm 512, 8x16 tile unroll 4", a @ b, [Opt(OptOps.UPCAST, 0, 8), Opt(OptOps.UPCAST, 1, 16), Opt(OptOps.UNROLL, 0, 4)], renderer, CNT)
+  x, w = Tensor.empty(1, 64, 34, 34), Tensor.empty(64, 64, 3, 3)
+  bench("conv 3x3, hand coded", x.conv2d(w), None, renderer, CNT)
+  bench("gemm 1024, CUDA tensor cores", Tensor.empty(1024, 1024, dtype=dtypes.half) @ Tensor.empty(1024, 1024, dtype=dtypes.half),
+        [Opt(OptOps.TC, 0, 0), Opt(OptOps.UPCAST, 0, 4), Opt(OptOps.UPCAST, 1, 4), Opt(OptOps.UNROLL, 0, 4)], CUDARenderer("sm_80"), CNT)
@@ -0,0 +1,66 @@
+import contextlib, os, random, time, unittest
+from tinygrad.helpers import getenv
+from tinygrad.shape.shapetracker import ShapeTracker
+from tinygrad.shape.symbolic import Variable
+
+# time the symbolic tests, the expr_idxs and real_size of random movement op chains, and random expressions like fuzz_symbolic
+def movement_ops(st:ShapeTracker) -> ShapeTracker:
+  for _ in range(8):
+    op, c = random.randint(0, 5), random.randint(0, len(st.shape)-1)
+    if op == 0: st = st.permute(tuple(random.sample(range(len(st.shape)), len(st.shape))))
+    elif op == 1: st = st.pad(tuple((random.randint(0, 2), random.randint(0, 2)) if i == c else (0, 0) for i in range(len(st.shape))))
+    elif op == 2:
+      start = random.randint(0, st.shape[c]-1)
+      st = st.shrink(tuple((start, random.randint(start+1, s)) if i == c else (0, s) for i,s in enumerate(st.shape)))
+    elif op == 3:
+      spl = random.choice([n for n in [1, 2, 3, 4, 5] if st.shape[c] % n == 0])
+      st = st.reshape(st.shape[:c] + (st.shape[c]//spl, spl) + st.shape[c+1:])
+    elif op == 4 and len(st.shape) >= 2 and c < len(st.shape)-1: st = st.reshape(st.shape[:c] + (st.shape[c]*st.shape[c+1],) + st.shape[c+2:])
+    elif op == 5: st = st.stride(tuple(random.choice([-2, -1, 2]) if i == c else 1 for i in range(len(st.shape))))
+  return st
+
+def expression_ops(cnt:int):
+  ret = []
+  for _ in range(cnt):
+    ops = [(random.randint(0, 4), random.randint(0, 2), random.randint(-4, 4), random.randint(1, 9)) for _ in range(random.randint(1, 10))]
+    ret.append((random.randint(0, 2), ops, random.randint(-4, 4)))
+  return ret
+
+def expressions(exprs):
+  vs = [Variable("a", 0, 8), Variable("b", 0, 8), Variable("c", 0, 8)]
+  for v,ops,lt in exprs:
+    expr = vs[v]
+    for op,v,num,den in ops:
+      if op == 0: expr = expr + vs[v]
+      elif op == 1: expr = expr * num
+      elif op == 2: expr = expr // den
+      elif op == 3: expr = expr % den
+      else: expr = expr + num
+    (expr < lt).render()
+
+def timeit(name:str, fxn, cnt:int):
+  tms = []
+  for _ in range(cnt):
+    st = time.perf_counter()
+    fxn()
+    tms.append(time.perf_counter() - st)
+  print(f"{name:40s} {tms[0]*1e3:9.2f} ms first, {min(tms)*1e3:9.2f} ms best")
+
+def test_symbolic():
+  suite = unittest.defaultTestLoader.loadTestsFromName("test.unit.test_symbolic")
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): unittest.TextTestRunner(stream=devnull).run(suite)
+
+def shapetrackers(sts):
+  for st in sts:
+    st.expr_idxs()
+    st.real_size()
+
+if __name__ == "__main__":
+  CNT = getenv("CNT", 3)
+  random.seed(42)
+  sts = [movement_ops(ShapeTracker.from_shape((random.randint(2, 10), random.randint(2, 10), random.randint(2, 10))))
+         for _ in range(getenv("SHAPES", 1000))]
+  exprs = expression_ops(getenv("EXPRS", 2000))
+  timeit("test/unit/test_symbolic.py", test_symbolic, CNT)
+  timeit("expr_idxs and real_size", lambda: shapetrackers(sts), CNT)
+  timeit("random expressions", lambda: expressions(exprs), CNT)
@@ -0,0 +1,28 @@
+import os, time, unittest
+from tinygrad.helpers import getenv
+from tinygrad.codegen.uops import UOpGraph
+
+# time UOpGraph.linearize on every kernel the tests in test/test_linearizer.py linearize, split in graph_rewrite and the toposort
+stats = []
+linearize, graph_rewrite = UOpGraph.linearize, UOpGraph.graph_rewrite
+def timed_linearize(self, *args, **kwargs):
+  self.rewrite_tm, st = 0.0, time.perf_counter()
+  ret = linearize(self, *args, **kwargs)
+  stats.append((time.perf_counter() - st, self.rewrite_tm, len(self._uops)))
+  return ret
+def timed_graph_rewrite(self, sink, pm):
+  st = time.perf_counter()
+  ret = graph_rewrite(self, sink, pm)
+  self.rewrite_tm += time.perf_counter() - st
+  return ret
+UOpGraph.linearize, UOpGraph.graph_rewrite = timed_linearize, timed_graph_rewrite  # type: ignore
+
+if __name__ == "__main__":
+  suite = unittest.defaultTestLoader.loadTestsFromName(getenv("TESTS", "test.test_linearizer"))
+  with open(os.devnull, "w") as devnull: unittest.TextTestRunner(stream=devnull).run(suite)
+  tm, rewrite_tm = sum(x[0] for x in stats), sum(x[1] for x in stats)
+  print(f"{len(stats)} kernels linearized in {tm*1e3:.2f} ms, {rewrite_tm*1e3:.2f} ms graph_rewrite, {(tm-rewrite_tm)*1e3:.2f} ms toposort")
+  for lo,hi in [(0, 100), (100, 500), (500, 2000), (2000, 1<<31)]:
+    if len(b:=[x for x in stats if lo <= x[2] < hi]) == 0: continue
+    print(f"{lo:5d}-{hi:<10d} uops: {len(b):4d} kernels, {sum(x[0]-x[1] for x in b)/sum(x[2] for x in b)*1e6:8.2f} us toposort per uop")
+  for t,r,n in sorted(stats, reverse=True)[:getenv("CNT", 5)]: print(f"{t*1e3:9.2f} ms {r*1e3:9.2f} ms graph_rewrite {n:6d} uops")
@@ -1,7 +1,15 @@
 #!/usr/bin/env python
-import unittest
+import unittest, random
+from dataclasses import replace
+from unittest.mock import patch
+import numpy as np
 from tinygrad.tensor import Tensor
 from tinygrad import Device
+from tinygrad.helpers import Context, BEAM, CACHELEVEL, diskcache_get
+from tinygrad.codegen.kernel import Opt, OptOps
+from tinygrad.codegen.linearizer import Linearizer
+from tinygrad.engine.schedule import create_schedule
+from tinygrad.engine.realize import lower_schedule, method_cache, precompile, precompile_schedule, CompiledRunner
 
 class TestKernelCache(unittest.TestCase):
   def test_kernel_cache_in_action(self):
@@ -23,5 +31,120 @@ class TestKernelCache(unittest.TestCase):
 
     Device['CLANG'].compiler = orig_compile_func
 
+class TestCompileAhead(unittest.TestCase):
+  # different shapes, so the kernels aren't fused horizontally
+  def _schedule(self, n:int): return [Tensor.full((i+1, 4), i).contiguous() for i in range(n)]
+
+  def test_lower_in_order(self):
+    outs = self._schedule(6)
+    expected = [ei.prg.display_name for ei in lower_schedule(create_schedule([t.lazydata for t in outs]))]
+    assert len(expected) == 6
+    sched = create_schedule([t.lazydata for t in self._schedule(6)])
+    with Context(COMPILE_AHEAD=3): eis = list(lower_schedule(sched))
+    assert len(sched) == 0, "the schedule is consumed"
+    self.assertEqual([ei.prg.display_name for ei in eis], expected)
+
+  def test_run_compile_ahead(self):
+    outs = self._schedule(6)
+    with Context(COMPILE_AHEAD=2): Tensor.realize(*outs)
+    for i,t in enumerate(outs): np.testing.assert_equal(t.numpy(), np.full((i+1, 4), i))
+
+  def test_compile_ahead_beam(self):
+    outs = self._schedule(4)
+    # BEAM searches in order on this thread
+    with Context(COMPILE_AHEAD=2, BEAM=1), patch("tinygrad.engine.realize._lower_schedule_ahead", side_effect=AssertionError("lowered ahead")), \
+         patch("tinygrad.engine.search.beam_search", side_effect=lambda lin, *args: lin) as beam:
+      Tensor.realize(*outs)
+    assert beam.call_count == 4
+    for i,t in enumerate(outs): np.testing.assert_equal(t.numpy(), np.full((i+1, 4), i))
+
+class TestPrecompile(unittest.TestCase):
+  def _outs(self): return [Tensor.full((i+1, 4), i).contiguous() for i in range(3)]
+
+  def test_precompile_schedule(self):
+    method_cache.clear()
+    assert precompile_schedule(create_schedule([t.lazydata for t in self._outs()]), workers=2) == 3
+    assert len(method_cache) == 3*2
+    # already compiled
+    assert precompile_schedule(create_schedule([t.lazydata for t in self._outs()]), workers=2) == 0
+
+  @unittest.skipUnless(Device.DEFAULT == "CLANG", "swaps out the CLANG compiler")
+  def test_run_precompiled(self):
+    method_cache.clear()
+    precompile(self._outs, workers=2)
+    orig_compiler, Device["CLANG"].compiler = Device["CLANG"].compiler, None # making it not callable
+    try:
+      outs = self._outs()
+      Tensor.realize(*outs)
+    finally: Device["CLANG"].compiler = orig_compiler
+    for i,t in enumerate(outs): np.testing.assert_equal(t.numpy(), np.full((i+1, 4), i))
+
+  @unittest.skipUnless(Device.DEFAULT == "CLANG", "CLANG compiles in batches")
+  def test_precompile_batched(self):
+    method_cache.clear()
+    assert precompile(self._outs, workers=1) == 3
+    assert len(set(r.lib for r in method_cache.values())) == 1
+    # the kernels are in the disk cache on their own too
+    if (cachekey:=Device["CLANG"].compiler.cachekey) is not None and CACHELEVEL >= 1:
+      assert all(diskcache_get(cachekey, r.p.src) == r.lib for r in method_cache.values())
+    outs = self._outs()
+    Tensor.realize(*outs)
+    for i,t in enumerate(outs): np.testing.assert_equal(t.numpy(), np.full((i+1, 4), i))
+
+class TestTuneLocalSize(unittest.TestCase):
+  def setUp(self):
+    # a new const every time, even when another test seeded random, so the program isn't in the disk cache yet
+    self.si = create_schedule([(Tensor.empty(16, 8, device="PYTHON") + random.SystemRandom().random()).lazydata])[-1]
+    self.bufs = [b.ensure_allocated() for b in self.si.bufs]
+  def _runner(self) -> CompiledRunner:
+    (lin:=Linearizer(*self.si.ast, opts=Device["PYTHON"].renderer)).apply_opt(Opt(OptOps.NOLOCALS))
+    runner = CompiledRunner(replace(lin.to_program(), dname="PYTHON"))
+    assert runner.p.global_size is not None and runner.p.local_size is None
+    return runner
+
+  def test_local_size_in_disk_cache(self):
+    runner = self._runner()
+    runner(self.bufs, {})
+    assert runner.p.local_size is not None
+    # a new runner of the same program doesn't time them again
+    with patch("tinygrad.engine.search.optimize_local_size", side_effect=AssertionError("local size wasn't cached")):
+      runner2 = self._runner()
+      runner2(self.bufs, {})
+    self.assertEqual((runner2.p.global_size, runner2.p.local_size), (runner.p.global_size, runner.p.local_size))
+
+  def test_local_size_per_arch(self):
+    self._runner()(self.bufs, {})
+    # another GPU of the same backend times them again
+    with patch.object(Device["PYTHON"], "arch", "other", create=True), \
+         patch("tinygrad.engine.search.optimize_local_size", return_value=[1, 1, 1]) as opt:
+      self._runner()(self.bufs, {})
+    opt.assert_called_once()
+
+  def test_precompile_tune(self):
+    method_cache[("PYTHON", self.si.ast, BEAM.value, False)] = runner = self._runner()
+    try:
+      assert precompile_schedule([self.si], tune=True) == 0
+      assert runner.p.local_size is not None
+    finally: del method_cache[("PYTHON", self.si.ast, BEAM.value, False)]
+
+class TestClangLoad(unittest.TestCase):
+  @unittest.skipUnless(Device.DEFAULT == "CLANG", "needs clang")
+  def test_load_same_name(self):
+    from tinygrad.runtime.ops_clang import ClangProgram
+    # the libs are loaded from memfds, a reused fd mustn't give back the previous lib
+    for i in range(3):
+      prg = ClangProgram("f", Device["CLANG"].compiler.compile(f"int f() {{ return {i}; }}"))
+      assert prg.fxn() == i
+
+  @unittest.skipUnless(Device.DEFAULT == "CLANG", "needs clang")
+  def test_lib_shared_and_unloaded(self):
+    from tinygrad.runtime.ops_clang import ClangProgram, _libs
+    lib = Device["CLANG"].compiler.compile("int f() { return 1; }\nint g() { return 2; }")
+    f, g = ClangProgram("f", lib), ClangProgram("g", lib)
+    assert f.clib is g.clib and (f.fxn(), g.fxn()) == (1, 2)
+    cnt = len(_libs)
+    del f, g
+    assert len(_libs) == cnt - 1
+
 if __name__ == "__main__":
   unittest.main()
@@ -11,7 +11,7 @@ from tinygrad.shape.shapetracker import ShapeTracker
 from tinygrad.shape.view import View
 from tinygrad.shape.symbolic import Variable
 import numpy as np
-import time
+import pickle, time
 inf, nan = float('inf'), float('nan')
 
 class TestLazyOp(unittest.TestCase):
@@ -22,6 +22,20 @@ class TestLazyOp(unittest.TestCase):
     ast_remade = eval(str(ast))
     self.assertEqual(ast, ast_remade)
 
+  def test_lazyop_interned(self):
+    ast = create_schedule([(Tensor.rand(10) + Tensor.rand(10)).lazydata])[-1].ast
+    self.assertIs(ast[0], eval(str(ast[0])))
+    self.assertIs(ast[0], pickle.loads(pickle.dumps(ast[0])))
+    c = LazyOp(BufferOps.CONST, (), ConstBuffer(1.0, dtypes.float, ShapeTracker.from_shape((10,))))
+    self.assertIs(c, LazyOp(BufferOps.CONST, (), ConstBuffer(1.0, dtypes.float, ShapeTracker.from_shape((10,)))))
+    self.assertIsNot(c, LazyOp(BufferOps.CONST, (), ConstBuffer(2.0, dtypes.float, ShapeTracker.from_shape((10,)))))
+
+  def test_lazyop_interned_negative_zero(self):
+    st = ShapeTracker.from_shape((10,))
+    zero, neg_zero = LazyOp(BufferOps.CONST, (), ConstBuffer(0.0, dtypes.float, st)), LazyOp(BufferOps.CONST, (), ConstBuffer(-0.0, dtypes.float, st))
+    self.assertNotEqual(zero, neg_zero)
+    self.assertEqual(str(neg_zero.arg.val), "-0.0")
+
   def test_selfreferential_speed(self):
     st = time.monotonic()
     for i in range(25):
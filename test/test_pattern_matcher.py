@@ -1,7 +1,7 @@
 import unittest
 from tinygrad.dtype import dtypes
 from tinygrad.ops import BinaryOps, TernaryOps, UnaryOps
-from tinygrad.codegen.uops import UOpGraph, UOps, PatternMatcher, UOp, UPat
+from tinygrad.codegen.uops import UOpGraph, UOps, PatternMatcher, UOp, UPat, _match, constant_folder
 
 class TestPatternMatcher(unittest.TestCase):
   def assert_equiv_uops(self, uop1:UOp, uop2:UOp):
@@ -138,6 +138,36 @@ class TestPatternMatcher(unittest.TestCase):
     self.assertEqual(matcher.rewrite(c6), None)
     self.assertEqual(matcher.rewrite(c7), c7)
 
+  def test_dispatch_on_arg_and_vin(self):
+    # the candidates are cached per (uop, arg, dtype, uops of the vin), the arg of the same shape still picks the pattern
+    matcher = PatternMatcher([(UPat(UOps.ALU, BinaryOps.MUL, [UPat(UOps.CONST, 1), UPat(name="x")]), lambda x: x)])
+    c1 = UOp(UOps.CONST, dtypes.float, arg=1.0)
+    c2 = UOp(UOps.CONST, dtypes.float, arg=2.0)
+    self.assertIs(matcher.rewrite(UOp(UOps.ALU, dtypes.float, (c2, c1), BinaryOps.MUL)), c2)
+    self.assertIsNone(matcher.rewrite(UOp(UOps.ALU, dtypes.float, (c2, c1), BinaryOps.ADD)))
+    self.assertIsNone(matcher.rewrite(UOp(UOps.ALU, dtypes.float, (c2, c2), BinaryOps.MUL)))
+    self.assertIs(matcher.rewrite(UOp(UOps.ALU, dtypes.float, (c1, c2), BinaryOps.MUL)), c2)
+
+  def test_dispatch_bounded(self):
+    matcher = PatternMatcher([(UPat(UOps.CONST, 0, name="x"), lambda x: x), (UPat(UOps.CONST, name="x"), lambda x: None)])
+    for i in range(100): matcher.rewrite(UOp(UOps.CONST, dtypes.int, arg=i))
+    # only the args a pattern matches on get their own entry, and each pattern is a candidate once
+    self.assertEqual(len(matcher.dispatch), 2)
+    self.assertEqual([len(x) for x in matcher.dispatch.values()], [2, 1])
+
+  def test_compiled_same_as_match(self):
+    from tinygrad import Tensor, Device
+    from tinygrad.codegen.linearizer import Linearizer
+    lin = Linearizer(*(Tensor.empty(16, 16) @ Tensor.empty(16, 16)).sum(0).schedule()[-1].ast, opts=Device[Device.DEFAULT].renderer)
+    lin.hand_coded_optimizations()
+    uops = list(lin.linearize().uops.nodes.values())
+    uops += [x for u in uops for x in u.vin]
+    for p,_ in constant_folder.patterns:
+      for u in uops:
+        s1, s2 = {}, {}
+        self.assertEqual(ok:=constant_folder.matchers[id(p)](u, s1), _match(u, p, s2))
+        if ok: self.assertEqual(s1, s2)
+
   @unittest.skip("no longer supported")
   def test_rewrite_graph_folds(self):
     uops = UOpGraph()
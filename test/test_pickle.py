@@ -2,6 +2,9 @@ import unittest, pickle
 import numpy as np
 from tinygrad import Tensor, TinyJit
 from tinygrad.engine.schedule import create_schedule
+from tinygrad.shape.shapetracker import ShapeTracker
+from tinygrad.shape.symbolic import Variable
+from tinygrad.codegen.linearizer import Linearizer
 
 class TestPickle(unittest.TestCase):
   def test_pickle_realized_tensor(self):
@@ -56,5 +59,15 @@ class TestPickle(unittest.TestCase):
     sched_pk = pickle.loads(pk)
     assert sched_pk[-1].ast == sched[-1].ast
 
+  def test_pickle_slots(self):
+    v = Variable("a", 1, 10).bind(3)
+    st = ShapeTracker.from_shape((v*2, 4)).pad(((1, 1), (0, 0)))
+    for x in [v, v*2+1, st, st.views[0]]:
+      assert not hasattr(x, "__dict__")
+      self.assertEqual(pickle.loads(pickle.dumps(x)), x)
+    self.assertEqual(pickle.loads(pickle.dumps(v)).val, 3)
+    uops = Linearizer(*Tensor.empty(4, 4).sum(1).schedule()[-1].ast).linearize().uops.uops
+    self.assertEqual([u.tuple()[::3] for u in pickle.loads(pickle.dumps(uops))], [u.tuple()[::3] for u in uops])
+
 if __name__ == '__main__':
   unittest.main()
@@ -1,14 +1,16 @@
-import unittest
+import unittest, multiprocessing, os
+from unittest.mock import patch
 
 from tinygrad.codegen.kernel import Opt, OptOps
 from tinygrad.codegen.linearizer import Linearizer
 from tinygrad.engine.schedule import create_schedule
+from tinygrad.engine import search
 from tinygrad.engine.search import time_linearizer, bufs_from_lin, actions, beam_search
 from tinygrad.device import Device, Buffer
 from tinygrad.ops import LazyOp, LoadOps, BufferOps, ReduceOps, BinaryOps, MemBuffer, ConstBuffer
 from tinygrad.tensor import Tensor
 from tinygrad.dtype import dtypes
-from tinygrad.helpers import Context, GlobalCounters, getenv
+from tinygrad.helpers import Context, GlobalCounters, getenv, CPU_THREADS, diskcache_get, diskcache_put
 from tinygrad.engine.realize import capturing
 from tinygrad.shape.shapetracker import ShapeTracker
 from tinygrad.shape.view import View
@@ -45,6 +47,10 @@ class TestTimeLinearizer(unittest.TestCase):
 
 @unittest.skipIf(getenv("RUN_PROCESS_REPLAY"), "TODO: run process replay for BEAM=2")
 class TestBEAM(unittest.TestCase):
+  # getenv is cached, the tests patch the environment
+  def setUp(self): getenv.cache_clear()
+  def tearDown(self): getenv.cache_clear()
+
   def test_dynamic_beam(self):
     # TODO: make this infra globally usable
     class Capture:
@@ -98,5 +104,79 @@ class TestBEAM(unittest.TestCase):
     tm = time_linearizer(best_lin, bufs, allow_test_size=False, cnt=2, disable_cache=True)
     assert tm
 
+  def test_beam_stats(self):
+    lin = Linearizer(*create_schedule([Tensor.empty(16, 16).sum(1).lazydata])[-1].ast)
+    with patch.dict(os.environ, {"IGNORE_BEAM_CACHE": "1"}): beam_search(lin, bufs_from_lin(lin), 2)
+    stats = search.beam_stats
+    assert stats.candidates >= stats.compiled >= stats.timed > 0
+    assert stats.compile_tm > 0 and stats.time_tm > 0
+
+  def test_parallel_compile(self):
+    # compile in a worker process, the compiler is sent to it
+    lin = Linearizer(*create_schedule([Tensor.empty(16, 16).sum(0).lazydata])[-1].ast)
+    search.beam_pool = multiprocessing.get_context("spawn").Pool(1, search._init_worker, (None,))
+    try:
+      with patch.dict(os.environ, {"IGNORE_BEAM_CACHE": "1"}): beam_search(lin, bufs_from_lin(lin), 2)
+    finally:
+      search.beam_pool.terminate()
+      search.beam_pool = None
+    assert search.beam_stats.timed > 0
+
+  def test_budget_and_resume(self):
+    lin = Linearizer(*create_schedule([Tensor.empty(32, 16).sum(1).lazydata])[-1].ast)
+    key = {"ast": lin.ast[0].key, "amt": 2, "allow_test_size": True, "device": lin.opts.device, "suffix": lin.opts.suffix}
+    diskcache_put("beam_search", key, None)
+    diskcache_put("beam_search_checkpoint", key, None)
+    # out of time after the first candidate, the best so far is returned and only the checkpoint is written
+    with patch.dict(os.environ, {"BEAM_KERNEL_BUDGET": "1e-9"}): beam_search(lin, bufs_from_lin(lin), 2)
+    first = search.beam_results[-1]
+    assert not first.complete and first.best_tm <= first.start_tm
+    assert diskcache_get("beam_search", key) is None
+    assert (ckpt:=diskcache_get("beam_search_checkpoint", key)) is not None and len(ckpt["beam"]) > 0
+    # the next search resumes from it
+    getenv.cache_clear()
+    beam_search(lin, bufs_from_lin(lin), 2)
+    second = search.beam_results[-1]
+    assert second.complete and second.start_tm == first.start_tm and second.search_tm > first.search_tm and second.best_tm <= first.best_tm
+    assert diskcache_get("beam_search", key) is not None
+
+  def test_total_budget(self):
+    lin = Linearizer(*create_schedule([Tensor.empty(16, 32).sum(0).lazydata])[-1].ast)
+    with patch.dict(os.environ, {"IGNORE_BEAM_CACHE": "1", "BEAM_TOTAL_BUDGET": "1e-9"}):
+      beam_search(lin, bufs_from_lin(lin), 2)
+      # the budget is spent, the next search doesn't start
+      cnt = len(search.beam_results)
+      assert beam_search(lin, bufs_from_lin(lin), 2) is lin and len(search.beam_results) == cnt
+
+  def test_cost_model(self):
+    class UpcastModel:
+      def fit(self, samples): pass
+      def predict(self, features): return [-f[4] for f in features]  # bigger upcasts are faster
+    lin = Linearizer(*create_schedule([Tensor.empty(32, 32).sum(1).lazydata])[-1].ast)
+    search.cost_model = UpcastModel()
+    try:
+      # every candidate runs as fast, the first one timed is the fastest and the chunks after it are pruned
+      with patch.dict(os.environ, {"IGNORE_BEAM_CACHE": "1", "BEAM_COST_TOP": "0.1"}), patch.object(search, "_time_program", lambda *_, **__: [1.0]):
+        beam_search(lin, bufs_from_lin(lin), 2)
+    finally: search.cost_model = None
+    stats = search.beam_stats
+    assert stats.pruned > 0 and stats.compiled + stats.pruned <= stats.candidates
+    # the timed candidates are samples for the default model
+    samples = diskcache_get("beam_cost_samples", {"device": lin.opts.device, "suffix": lin.opts.suffix})
+    assert samples is not None and all(len(x) == len(search.lin_features(lin, {})) for x,_ in samples)
+
+  def test_ridge_cost_model(self):
+    x = [[a/4, b/4] for a in range(32) for b in range(32)]
+    (model:=search.RidgeCostModel()).fit([(f, (f[0]-3)**2 + f[0]*f[1]) for f in x])
+    pred = model.predict([[3, 0], [0, 0], [3, 4]])
+    assert pred[0] < pred[1] < pred[2]
+
+  @unittest.skipUnless(hasattr(os, "sched_setaffinity"), "needs sched_setaffinity")
+  def test_pinned_timing(self):
+    cores = os.sched_getaffinity(0)
+    with Context(CPU_THREADS=4), search._pinned(min(cores)):
+      assert os.sched_getaffinity(0) == {min(cores)} and CPU_THREADS.value == 1
+    assert os.sched_getaffinity(0) == cores
+
 if __name__ == '__main__':
   unittest.main()
@@ -2,7 +2,7 @@ import unittest
 from tinygrad import dtypes, Variable
 from tinygrad.dtype import PtrDType
 from tinygrad.ops import BinaryOps, TernaryOps, UnaryOps
-from tinygrad.codegen.uops import UOpGraph, UOps
+from tinygrad.codegen.uops import UOpGraph, UOps, UOp, PatternMatcher, constant_folder
 
 class TestUOpGraph(unittest.TestCase):
   def test_add_constant_fold(self):
@@ -78,5 +78,64 @@ class TestUOpGraph(unittest.TestCase):
     self.assertEqual(out.vin[1].uop, UOps.CONST)
     self.assertEqual(out.vin[1].arg, 6)
 
+  def test_deep_graph_rewrite(self):
+    # the worklist doesn't recurse, (((v*1)+v)*1+v)... is deeper than the recursion limit
+    g = UOpGraph()
+    out = v = g.add(UOps.DEFINE_VAR, dtypes.int, arg=Variable('tmp', 0, 1))
+    c1 = g.add(UOps.CONST, dtypes.int, arg=1)
+    for _ in range(5000): out = g.add(UOps.ALU, dtypes.int, (g.add(UOps.ALU, dtypes.int, (out, c1), BinaryOps.MUL), v), BinaryOps.ADD)
+    sink = g.graph_rewrite(UOp(UOps.SINK, None, (out,)), constant_folder)
+    self.assertEqual(sink.vin[0].vin, (sink.vin[0].vin[0], v))
+    self.assertEqual(len([u for u in g.nodes.values() if u.arg is BinaryOps.MUL]), 0)
+
+  def test_graph_rewrite_copies(self):
+    # copies of the same UOp are merged, each UOp is matched once
+    class CountingMatcher(PatternMatcher):
+      cnt = 0
+      def rewrite(self, uop):
+        CountingMatcher.cnt += 1
+        return super().rewrite(uop)
+    g = UOpGraph()
+    v = g.add(UOps.DEFINE_VAR, dtypes.int, arg=Variable('tmp', 0, 1))
+    copies = [UOp.alu(BinaryOps.MUL, UOp.alu(BinaryOps.ADD, v, UOp.const(dtypes.int, 2)), v) for _ in range(10)]
+    sink = g.graph_rewrite(UOp(UOps.SINK, None, tuple(copies)), CountingMatcher(constant_folder.patterns))
+    self.assertEqual(len(set(sink.vin)), 1)
+    self.assertEqual(CountingMatcher.cnt, 5)
+
+  def test_loop_invariant_add(self):
+    g = UOpGraph()
+    buf = g.add(UOps.DEFINE_GLOBAL, PtrDType(dtypes.int), (), (0, True))
+    v = g.add(UOps.DEFINE_VAR, dtypes.int, arg=Variable('tmp', 0, 8))
+    c0, c4 = g.add(UOps.CONST, dtypes.int, arg=0), g.add(UOps.CONST, dtypes.int, arg=4)
+    r0, r1 = g.add(UOps.RANGE, dtypes.int, (c0, c4), (0, 0)), g.add(UOps.RANGE, dtypes.int, (c0, c4), (0, 1))
+    # (r0+r1)+v -> (r0+v)+r1, r0+v is out of the r1 loop
+    idx = g.add(UOps.ALU, dtypes.int, (g.add(UOps.ALU, dtypes.int, (r0, r1), BinaryOps.ADD), v), BinaryOps.ADD)
+    g.add(UOps.STORE, None, (buf, idx, c0))
+    uops = g.uops
+    idx = [u for u in uops if u.uop is UOps.STORE][0].vin[1]
+    self.assertIs(idx.vin[1], r1)
+    self.assertEqual(idx.vin[0].vin, (r0, v))
+    self.assertLess(uops.index(idx.vin[0]), uops.index(r1))
+
+  def test_loop_invariant_add_float(self):
+    g = UOpGraph()
+    buf = g.add(UOps.DEFINE_GLOBAL, PtrDType(dtypes.float), (), (0, True))
+    c0, c4 = g.add(UOps.CONST, dtypes.int, arg=0), g.add(UOps.CONST, dtypes.int, arg=4)
+    r0, r1 = g.add(UOps.RANGE, dtypes.int, (c0, c4), (0, 0)), g.add(UOps.RANGE, dtypes.int, (c0, c4), (0, 1))
+    f0, f1 = g.add(UOps.CAST, dtypes.float, (r0,)), g.add(UOps.CAST, dtypes.float, (r1,))
+    v = g.add(UOps.ALU, dtypes.float, (g.add(UOps.ALU, dtypes.float, (f0, f1), BinaryOps.ADD), f0), BinaryOps.ADD)
+    g.add(UOps.STORE, None, (buf, r0, v))
+    # floats don't reassociate
+    self.assertEqual([u for u in g.uops if u.uop is UOps.STORE][0].vin[2].vin[1], f0)
+
+  def test_deep_linearize(self):
+    # the toposort doesn't recurse either
+    g = UOpGraph()
+    out = v = g.add(UOps.DEFINE_VAR, dtypes.int, arg=Variable('tmp', 0, 1))
+    for _ in range(20000): out = g.add(UOps.ALU, dtypes.int, (out, v), BinaryOps.ADD)
+    g.add(UOps.SINK, None, (out,))
+    self.assertEqual(len(g.uops), 20001)
+    self.assertIs(g.uops[-1].vin[0], g.uops[-2])
+
 if __name__ == '__main__':
   unittest.main(verbosity=2)
@@ -9,7 +9,7 @@ from tinygrad.ops import UnaryOps, BinaryOps, TernaryOps, exec_alu
 from tinygrad.renderer import Program
 from tinygrad.engine.schedule import create_schedule
 from tinygrad.engine.realize import CompiledRunner, lower_schedule_item
-from tinygrad.codegen.linearizer import UOps, UOp
+from tinygrad.codegen.linearizer import UOps, UOp, Linearizer
 from tinygrad.codegen.uops import UOpGraph
 from test.helpers import is_dtype_supported
 
@@ -245,6 +245,68 @@ class TestLocalAccess(unittest.TestCase):
     sres = uop(uops, UOps.LOAD, dtypes.int32, (smem, ofs))
     self.assertEqual(_test_uops_result(dtypes.int32, uops, sres), 42)
 
+class TestPythonVectorized(unittest.TestCase):
+  def test_exec_alu(self):
+    from tinygrad.runtime.ops_python import exec_alu_np
+    rng = np.random.default_rng(0)
+    for dtype in [dtypes.bool, dtypes.int8, dtypes.uint8, dtypes.int32, dtypes.uint32, dtypes.int64, dtypes.float32, dtypes.float64]:
+      vals = [rng.integers(-200, 200, 64).astype(dtype.np) if dtypes.is_int(dtype) else rng.integers(0, 2, 64).astype(bool) if dtype == dtypes.bool
+              else rng.normal(0, 8, 64).astype(dtype.np) for _ in range(2)]
+      if dtype != dtypes.bool: vals[1][np.abs(vals[1].astype(np.float64)) < 1] = 3
+      for op in [UnaryOps.NEG, BinaryOps.ADD, BinaryOps.SUB, BinaryOps.MUL, BinaryOps.DIV, BinaryOps.MAX, BinaryOps.MOD, BinaryOps.CMPLT,
+                 BinaryOps.CMPNE, BinaryOps.XOR, UnaryOps.LOG2, UnaryOps.EXP2, UnaryOps.SQRT, UnaryOps.SIN]:
+        if (op in {UnaryOps.LOG2, UnaryOps.EXP2, UnaryOps.SQRT, UnaryOps.SIN} and not dtypes.is_float(dtype)) or \
+           (op in {BinaryOps.DIV, BinaryOps.MOD} and dtype == dtypes.bool) or (op is BinaryOps.XOR and dtypes.is_float(dtype)): continue
+        out_dtype = dtypes.bool if op in {BinaryOps.CMPLT, BinaryOps.CMPNE} else dtype
+        inp = vals[:1] if op in UnaryOps else vals
+        expected = [exec_alu(op, out_dtype, [x.item() for x in p]) for p in zip(*inp)]
+        # numpy's transcendentals can be off from math's in the last bit of a float64
+        if op in UnaryOps and op is not UnaryOps.NEG and dtype == dtypes.float64:
+          np.testing.assert_allclose(exec_alu_np(op, out_dtype, inp), np.array(expected, dtype=out_dtype.np), rtol=1e-14, err_msg=f"{op} {dtype}")
+        else: np.testing.assert_equal(exec_alu_np(op, out_dtype, inp), np.array(expected, dtype=out_dtype.np), err_msg=f"{op} {dtype}")
+
+  def test_matches_python_emulator(self):
+    from tinygrad.codegen.kernel import Opt, OptOps
+    from tinygrad.runtime.ops_python import PythonProgram, PythonRenderer, PythonCompiler
+    # locals, a group reduce with barriers, loops and gated loads from the padding
+    a, b = Tensor.rand(16, 30).realize(), Tensor.rand(30, 9).realize()
+    lin = Linearizer(*create_schedule([(a @ b).relu().lazydata])[-1].ast, opts=PythonRenderer())
+    for opt in [Opt(OptOps.PADTO, 1, 32), Opt(OptOps.LOCAL, 0, 2), Opt(OptOps.GROUPTOP, 0, 2), Opt(OptOps.UPCAST, 1, 4)]: lin.apply_opt(opt)
+    p = lin.to_program()
+    outs = []
+    for vectorized in [False, True]:
+      (prg:=PythonProgram("test", PythonCompiler().compile(p.src))).vectorized = vectorized
+      bufs = [memoryview(bytearray(16*9*4)), memoryview(bytearray(a.numpy().tobytes())), memoryview(bytearray(b.numpy().tobytes()))]
+      prg(*bufs, global_size=tuple(p.global_size), local_size=tuple(p.local_size))
+      outs.append(bytes(bufs[0]))
+    self.assertEqual(outs[0], outs[1])
+    np.testing.assert_allclose(np.frombuffer(outs[1], dtype=np.float32).reshape(16, 9), np.maximum(a.numpy() @ b.numpy(), 0), atol=1e-5)
+
+@unittest.skipUnless(Device.DEFAULT == "LLVM", "This only tests the LLVM backend")
+class TestLLVM(unittest.TestCase):
+  def _render(self, t:Tensor, fastmath=False) -> str:
+    from tinygrad.renderer.llvmir import LLVMRenderer
+    k = Linearizer(*create_schedule([t.lazydata])[-1].ast, opts=LLVMRenderer(fastmath=fastmath))
+    k.hand_coded_optimizations()
+    return k.to_program().src
+
+  def test_vector_load_store(self):
+    x = Tensor.rand(64, 64).realize()
+    src = self._render(x + 1)
+    assert "x float>*" in src and "store <" in src, "upcasted axes load and store vectors"
+    np.testing.assert_allclose((x + 1).numpy(), x.numpy() + 1)
+
+  def test_fastmath_is_opt_in(self):
+    x = Tensor.rand(64, 64).realize()
+    src = self._render(x.sum(1))
+    assert "reassoc" not in src and "contract" not in src
+
+  def test_fastmath_reduce(self):
+    x, y = Tensor.rand(64, 64).realize(), Tensor.rand(64, 64).realize()
+    src = self._render((x*y).sum(1), fastmath=True)
+    assert all("reassoc" in l for l in src.splitlines() if " = fadd" in l), "every accumulate in the reduce can reassociate"
+    assert all("contract" in l for l in src.splitlines() if " = fmul" in l), "the multiplies can contract to FMAs"
+
 @unittest.skipUnless(Device.DEFAULT in {"CUDA"} and getenv("PTX"), "This only tests assembly backends")
 class TestAssembly(unittest.TestCase):
   def test_bitshift_left(self):
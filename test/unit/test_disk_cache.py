@@ -37,6 +37,13 @@ class DiskCache(unittest.TestCase):
     p.join()
     self.assertEqual(diskcache_get(table, "k"), "remote")
 
+  def test_putgetotherthread(self):
+    table = "test_putgetotherthread"
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(4) as pool:
+      list(pool.map(lambda i: diskcache_put(table, i, i*2), range(32)))
+      self.assertEqual(list(pool.map(lambda i: diskcache_get(table, i), range(32))), [i*2 for i in range(32)])
+
   def test_no_table(self):
     self.assertIsNone(diskcache_get("faketable", "k"))
 
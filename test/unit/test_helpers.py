@@ -1,7 +1,9 @@
 import unittest
 from PIL import Image
 from tinygrad.helpers import Context, ContextVar, merge_dicts, strip_parens, prod, round_up, fetch, fully_flatten, from_mv, to_mv, get_contraction
+from tinygrad.helpers import cache, cache_stats, clear_caches
 from tinygrad.shape.symbolic import Variable, NumNode
+from tinygrad.shape.view import View
 
 VARIABLE = ContextVar("VARIABLE", 0)
 
@@ -108,6 +110,20 @@ with Context(VARIABLE=1):
       ...
     assert D.value == 2, f"Expected D to be 2, but was {D.value}. Indicates that Context.__exit__ did not restore to the correct value."
 
+class TestCaches(unittest.TestCase):
+  def test_bounded(self):
+    @cache(maxsize=2)
+    def double(x): return x*2
+    for x in [1, 2, 1, 3, 1]: double(x)
+    info = cache_stats()[f"{__name__}.TestCaches.test_bounded.<locals>.double"]
+    self.assertEqual((info.hits, info.misses, info.currsize, info.maxsize), (2, 3, 2, 2))
+
+  def test_clear_caches(self):
+    View.create((4, 4))
+    self.assertGreater(cache_stats()["tinygrad.shape.view.View.create"].currsize, 0)
+    clear_caches()
+    self.assertTrue(all(info.currsize == 0 for info in cache_stats().values()))
+
 class TestMergeDicts(unittest.TestCase):
   def test_merge_dicts(self):
     a = {"a": 1, "b": 2}
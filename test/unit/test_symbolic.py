@@ -304,6 +304,36 @@ class TestSymbolicVars(unittest.TestCase):
     assert (a * a).vars() == {a}
     assert (a//4 + a//6).vars() == {a}
 
+class TestSymbolicKey(unittest.TestCase):
+  def test_key_from_children(self):
+    a, b = Variable("a", 0, 10), Variable("b", 0, 10)
+    expr = (a*3 + b) // 2
+    self.assertEqual(expr.key, "(((a[0-10]*3)+b[0-10])//2)")
+    self.assertEqual(expr, (b + a*3) // 2)
+    self.assertEqual(hash(expr), hash((b + a*3) // 2))
+
+  def test_bind_key(self):
+    a = Variable("a", 1, 10)
+    h = hash(a)
+    self.assertEqual(a, Variable("a", 1, 10))
+    a.bind(3)
+    self.assertEqual(hash(a), h)
+    self.assertEqual(a.key, "a[1-10=3]")
+    self.assertNotEqual(a, Variable("a", 1, 10))
+    self.assertEqual((a+1).key, "(1+a[1-10=3])")
+
+  def test_sum_memoized(self):
+    a, b = Variable("a", 0, 10), Variable("b", 0, 10)
+    self.assertIs(a*2 + b + 1, Variable("a", 0, 10)*2 + Variable("b", 0, 10) + 1)
+
+  def test_sum_after_bind(self):
+    a, b = Variable("a", 1, 10), Variable("b", 1, 10)
+    s1 = a + b
+    a.bind(3)
+    s2 = a + b
+    self.assertIsNot(s2, s1)
+    self.assertEqual(s2.key, "(a[1-10=3]+b[1-10])")
+
 class TestSymbolicMinMax(unittest.TestCase):
   def test_min_max_known(self):
     a = Variable("a", 1, 8)
@@ -2,9 +2,9 @@ from __future__ import annotations
 from collections import defaultdict
 import math, itertools
 from typing import DefaultDict, NamedTuple, Optional, List, Tuple, cast, Dict, Union
-from tinygrad.ops import LazyOp, UnaryOps, BinaryOps, ReduceOps, MemBuffer, ConstBuffer, BufferOps, UNSAFE_PAD_OPS
+from tinygrad.ops import LazyOp, UnaryOps, BinaryOps, TernaryOps, ReduceOps, MemBuffer, ConstBuffer, BufferOps, UNSAFE_PAD_OPS
 from tinygrad.device import Device
-from tinygrad.renderer import Renderer, TensorCore
+from tinygrad.renderer import Renderer, TensorCore, CPUInfo
 from tinygrad.dtype import dtypes, ImageDType, DType
 from tinygrad.helpers import all_same, colored, ansilen, dedup, flatten, getenv, prod, DEBUG, round_up, all_int, get_contraction
 from tinygrad.shape.shapetracker import ShapeTracker
@@ -51,6 +51,14 @@ class LocalBuffer(NamedTuple):
   realized: None = None
   def __str__(self): return f"localbuffer<{self.name}[{self.size}]>"
 
+# the padded part of a SUM must be zero. loads are masked, but a reduceop used in a later reduceop is broadcast into the padding
+def _zero_when_padded(op:LazyOp) -> bool:
+  if op.op in BufferOps: return True
+  if op.op in ReduceOps: return False
+  if op.op is BinaryOps.MUL: return any(_zero_when_padded(x) for x in op.src)
+  if op.op is TernaryOps.WHERE: return all(_zero_when_padded(x) for x in op.src[1:])
+  return all(_zero_when_padded(x) for x in op.src)
+
 class Kernel:
   def __init__(self, *ast:LazyOp, opts:Optional[Renderer]=None):
     self.opts = opts if opts is not None else Device[Device.DEFAULT].renderer
@@ -59,13 +67,12 @@ class Kernel:
     self.ast = ast
     self.lazyops = flatten([op.lazyops for op in self.ast])
 
-    # there's only allowed to be one reduceop
+    # reduceops are ordered so that a reduceop comes after the reduceops it depends on
     cached_ordered_lazyops: Dict[LazyOp, List[LazyOp]] = {}
     def ordered_lazyops(op):
       if op not in cached_ordered_lazyops: cached_ordered_lazyops[op] = dedup([item for x in op.src for item in ordered_lazyops(x)] + [op])
       return cached_ordered_lazyops[op]
     self.reduceops = dedup([x for out in self.ast for x in ordered_lazyops(out) if x.op in ReduceOps])
-    assert len(self.reduceops) < 2, "Only one reduceop allowed"
 
     self.outbufs, self.vars = [x.arg for x in self.ast], flatten([x.vars() for x in self.ast])
     loadops = [BufferOps.LOAD, BufferOps.CONST]
@@ -360,7 +367,7 @@ class Kernel:
     return TensorCoreOptions(axes=[s0, s1, s2], axes_exist=[True, True], axis_pads=axis_pads)
 
   def _apply_tc_opt(self, use_tensor_cores:int, axis:int, opt_level:int) -> bool:
-    if use_tensor_cores and self.opts.has_local and self.reduceop is not None and self.reduceop.op is ReduceOps.SUM:
+    if use_tensor_cores and self.opts.has_local and len(self.reduceops) == 1 and self.reduceops[0].op is ReduceOps.SUM:
       for tc in self.opts.tensor_cores:
         tensor_core_opts = [self._create_tc_opts(reduceop, tc, axis, opt_level) for reduceop in self.reduceops]
         # can only fuse reduces with the same tc options
@@ -432,6 +439,7 @@ class Kernel:
       check(len(self.applied_opts) == 0, "tensor core opts must be first") # TODO: things like PADTO might be fine
       check(opt.axis is not None and opt.amt is not None, "tensor core opts must have an axis and amt")
       check((use_tensor_cores:=getenv("TC", 1)) == 2 or len(self.opts.tensor_cores) > 0, "must have tensor cores or TC=2")
+      check(len(self.reduceops) == 1, "tensor cores can't be applied to a kernel with multiple reduceops")
       check(self._apply_tc_opt(use_tensor_cores, cast(int, opt.axis), cast(int, opt.amt)), "no tensor core available")
       self.applied_opts.append(opt)
       return
@@ -461,6 +469,7 @@ class Kernel:
       check(self.opts.has_local and self.opts.has_shared, "target does not support local or shared mem")
       check(axis >= self.first_reduce + self.group_for_reduces and axis < self.shape_len-self.upcasted, "must be reduce axis to group")
       check(not self.tensor_core, "can't group with tensor cores")
+      check(len(self.reduceops) == 1, "can't group with multiple reduceops")
       self.shift_to(axis, amt, top=(opt.op is OptOps.GROUPTOP), insert_before=self.first_reduce + self.group_for_reduces)
       self.group_for_reduces += 1
     elif opt.op is OptOps.UNROLL:                     # purple
@@ -476,7 +485,7 @@ class Kernel:
     elif opt.op is OptOps.UPCAST:                     # yellow
       check(axis < self.first_reduce, "upcast is for non-reduce")
       check(not(self.tensor_core and self.global_dims <= axis < self.global_dims+len(self.tensor_core.threads)), "can't upcast TC locals")
-      check(amt <= 8, "don't upcast more than 8")
+      check(amt <= max(8, *self.opts.vector_widths), "don't upcast more than 8 or the vector width")
       self.shift_to(axis, amt, insert_before=None)
       self.upcast()
     elif opt.op is OptOps.UPCASTMID:                  # white
@@ -496,8 +505,8 @@ class Kernel:
       check(axis < self.shape_len - self.upcasted, "cannot pad upcasted")
       # ok to pad SUM if all parent ops have f(0) = 0
       if self.first_reduce <= axis:
-        check((r:=cast(LazyOp, self.reduceop)).op is ReduceOps.SUM and \
-            all(op.op not in UNSAFE_PAD_OPS for ops in r.src for op in ops.lazyops), "cannot pad")
+        check(all(r.op is ReduceOps.SUM and all(op.op not in UNSAFE_PAD_OPS for ops in r.src for op in ops.lazyops) and _zero_when_padded(r.src[0])
+                  for r in self.reduceops), "cannot pad")
       padded = False
       for i,st in enumerate(self.sts):
         if self.sts[i].shape[axis] == 1: continue  # reduced
@@ -519,13 +528,44 @@ class Kernel:
       if len(unit_stride_axes_mul_4) and all(x < (self.shape_len-self.upcasted) for x in unit_stride_axes_mul_4) and unit_stride_axes_mul_4[0] not in self.upcast_in_mid_reduce_axes:  # noqa: E501
         self.apply_opt(Opt(OptOps.UPCAST, unit_stride_axes_mul_4[0], 4))
 
+  def cpu_tile(self) -> bool:
+    """Tiles a GEMM or conv shaped reduce for a CPU: the output tile is the outer product of vectors of one input and rows of the other."""
+    if not (len(self.reduceops) == 1 and (r:=self.reduceop) is not None and r.op is ReduceOps.SUM and (mulop:=r.src[0]).op is BinaryOps.MUL and
+            all(x.op is BufferOps.LOAD for x in mulop.src) and all_int(self.full_shape) and self.upcasted == 0): return False
+    cpu, out_strides = cast(CPUInfo, self.opts.cpu), self.sts[0].real_strides()
+    strides = [self.sts[self.bufs.index(x.arg)].real_strides() for x in mulop.src]
+    # the vector axis is unit stride in the output and one input, the other input is broadcast on it. the row axis is the other way around
+    for a,b in [(0,1),(1,0)]:
+      ns = [i for i in range(self.first_reduce) if out_strides[i] == 1 and strides[a][i] == 1 and strides[b][i] == 0]
+      ms = [i for i in range(self.first_reduce) if strides[a][i] == 0 and strides[b][i] not in (0, None)]
+      if ns and ms: break
+    else: return False
+    n, m = ns[0], ms[-1]
+    sz, k = self.bufs[0].dtype.itemsize, prod(self.full_shape[self.first_reduce:])
+    width = cpu.vector_width * 4 // sz
+    # the K long panel of the vector input stays in L2, the rows of the other input in L1. a quarter of the registers are accumulators
+    nr = next((w for w in [2*width, width] + [w for w in (8, 4) if w < width] if self.full_shape[n] % w == 0 and k*w*sz <= cpu.l2_size//2), 0)
+    if nr == 0: return False
+    mr = next((x for x in (8, 6, 4, 3, 2) if self.full_shape[m] % x == 0 and x*nr <= cpu.registers*width//4 and x*k*sz <= cpu.l1_size//2), 1)
+    if DEBUG >= 4: print(f"CPU tile: {nr=} on axis {n}, {mr=} on axis {m}")
+    # upcast the later axis first, an axis that is upcasted completely goes away
+    for axis,amt in sorted([(n, nr), (m, mr)], reverse=True):
+      while amt > 1:
+        self.apply_opt(Opt(OptOps.UPCAST, axis, step:=max(d for d in range(1, min(amt, max(8, *self.opts.vector_widths))+1) if amt % d == 0)))
+        amt //= step
+    return True
+
   def hand_coded_optimizations(self):
     self.required_optimizations()
 
+    # CPUs have no locals, tile the output in registers
+    if self.opts.cpu is not None and not self.opts.has_local and self.cpu_tile(): return
+
     # should use matvec - TODO: adjust/tune based on the wide vs tall/large vs small mat
     MV_BLOCKSIZE, MV_THREADS_PER_ROW, MV_ROWS_PER_THREAD = getenv("MV_BLOCKSIZE", 4), getenv("MV_THREADS_PER_ROW", 8), getenv("MV_ROWS_PER_THREAD", 4)
     if self.opts.has_local and getenv("MV",1) != 0 and (MV_BLOCKSIZE > 1 or MV_THREADS_PER_ROW > 1 or MV_ROWS_PER_THREAD > 1) and  \
-        self.reduceop is not None and self.reduceop.op is ReduceOps.SUM and len(self.full_shape) >= 2 and self.opts.has_shared and \
+        len(self.reduceops) == 1 and self.reduceop is not None and self.reduceop.op is ReduceOps.SUM and len(self.full_shape) >= 2 and \
+        self.opts.has_shared and \
         (mulop:=self.reduceop.src[0]).op is BinaryOps.MUL and mulop.src[0].op is BufferOps.LOAD and mulop.src[1].op is BufferOps.LOAD:
       st0, st1 = self.sts[self.bufs.index(mulop.src[0].arg)], self.sts[self.bufs.index(mulop.src[1].arg)]
       strides0, strides1 = st0.real_strides(), st1.real_strides()
@@ -618,9 +658,9 @@ class Kernel:
             self.apply_opt(Opt(OptOps.UNROLL, len(self.full_unupcasted_shape)-1-self.first_reduce, splits))
             break
 
-    # if nothing at all is upcasted and it's easy to, do an upcast
+    # if nothing at all is upcasted and it's easy to, do an upcast. the widest vector of the target first
     # TODO: this is breaking the tests
-    for splits in [4]:
+    for splits in [w for w in self.opts.vector_widths if w > 4 and self.opts.supports_float4] + [4]:
       if self.upcasted == 0 and self.full_unupcasted_shape and self.full_unupcasted_shape[-1] % splits == 0:
         self.apply_opt(Opt(OptOps.UPCAST, len(self.full_unupcasted_shape)-1, splits))
 
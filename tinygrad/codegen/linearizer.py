@@ -4,7 +4,7 @@ import itertools, math, functools
 from collections import defaultdict
 
 from tinygrad.dtype import ImageDType, dtypes, DType, PtrDType, ConstType
-from tinygrad.helpers import colored, DEBUG, dedup, diskcache_put, prod, getenv, to_function_name
+from tinygrad.helpers import colored, DEBUG, dedup, diskcache_put, prod, getenv, to_function_name, cache
 from tinygrad.ops import LazyOp, UnaryOps, BinaryOps, TernaryOps, ReduceOps, ConstBuffer, MemBuffer, BufferOps, get_lazyop_info
 from tinygrad.shape.shapetracker import ShapeTracker
 from tinygrad.shape.symbolic import Variable, NumNode, Node, SumNode, MulNode, DivNode, ModNode, LtNode, AndNode, create_lt_node
@@ -39,7 +39,7 @@ def to_image_idx(base_shape:Tuple[int, ...], idxy:Node, valid:Node) -> Tuple[Tup
 
 # expand a Node into List[Node] that enumerates the underlying Variables from min to max
 # expand increments earlier variables faster than later variables (as specified in the argument)
-@functools.lru_cache(maxsize=None)
+@cache()
 def expand_node(node:Node, idxs:Optional[Tuple[Union[Variable, NumNode], ...]]=None) -> List[Node]:
   if idxs is None: idxs = (expand_idx(node),)
   return [node.substitute({k:v for k,v in zip(idxs, (NumNode(x) for x in rep)) if isinstance(k, Variable)}) for rep in iter_idxs(idxs)]
@@ -79,7 +79,7 @@ class Linearizer(Kernel):
 
     dim, amt = None, 1
     # float 4 grouping
-    if len(upcast_dim := self.get_float4_upcast_dim(i)) == 1 and len(float4_expand := expand_node(idxs[upcast_dim[0]])) in [4,2]:
+    if len(upcast_dim := self.get_float4_upcast_dim(i)) == 1 and len(float4_expand := expand_node(idxs[upcast_dim[0]])) in self.opts.vector_widths:
       dim, amt = upcast_dim[0], len(float4_expand)
       g_idx, g_valid = self.sts[i].expr_idxs(idxs[:dim] + [float4_expand[0]] + idxs[dim+1:])
       # do not use float4 if idx is not aligned
@@ -142,18 +142,14 @@ class Linearizer(Kernel):
     store_offset = dict(zip(_idxs, store))
 
     # float4 grouping
-    if len(upcast_dim := self.get_float4_upcast_dim(i)) == 1 and len(float4_expand := expand_node(idxs[upcast_dim[0]])) in [2,4]:
+    if len(upcast_dim := self.get_float4_upcast_dim(i)) == 1 and len(float4_expand := expand_node(idxs[upcast_dim[0]])) in self.opts.vector_widths:
       grouped_store_offset = defaultdict(list)
       for k in store_offset:
         _idx = k[:upcast_dim[0]] + (float4_expand[0],) + k[upcast_dim[0]+1:]
         grouped_store_offset[_idx].append(store_offset[k])
-      store_offset_new = {}
-      for k,grouped in grouped_store_offset.items():
-        amt = len(grouped)
-        idx, valid = self.sts[i].expr_idxs(k)
-        assert idx == ((idx//amt)*amt), "float4 stores are always aligned"
-        store_offset_new[k] = self.uops.add(UOps.CAST, buf.dtype.vec(amt), tuple(grouped))
-      store_offset = store_offset_new
+      # do not use float4 if idx is not aligned
+      if all((idx:=self.sts[i].expr_idxs(k)[0]) == (idx//len(grouped))*len(grouped) for k,grouped in grouped_store_offset.items()):
+        store_offset = {k:self.uops.add(UOps.CAST, buf.dtype.vec(len(grouped)), tuple(grouped)) for k,grouped in grouped_store_offset.items()}
 
     stores = []
     for _idx, var in store_offset.items():
@@ -169,10 +165,11 @@ class Linearizer(Kernel):
     return stores
 
   # render loop
-  def render_loop(self, xx:List[Variable], depth:int) -> Tuple[UOp, ...]:
+  # NOTE: extra uops in after are added to the RANGE vin so the loop can't start before they are computed
+  def render_loop(self, xx:List[Variable], depth:int, after:Tuple[UOp, ...]=()) -> Tuple[UOp, ...]:
     new_loops = {x.expr:self.uops.add(UOps.RANGE, dtypes.int32, (
       self.const(x.min) if isinstance(x.min, int) else cast(Node, x.min).render(self.render_ops, self),
-      self.const(x.max+1) if isinstance(x.max, int) else cast(Node, x.max+1).render(self.render_ops, self)), arg=(depth,i)) for i,x in enumerate(xx) if not isinstance(x, NumNode) and x.expr is not None}  # noqa: E501
+      self.const(x.max+1) if isinstance(x.max, int) else cast(Node, x.max+1).render(self.render_ops, self))+after, arg=(depth,i)) for i,x in enumerate(xx) if not isinstance(x, NumNode) and x.expr is not None}  # noqa: E501
     self.loop_uops.update(new_loops)
     return tuple(new_loops.values())
 
@@ -219,8 +216,8 @@ class Linearizer(Kernel):
 
   def render_reduceop(self, reduceop:LazyOp, accs:Dict[LazyOp, List[UOp]], loaded_buffers:Dict[Union[MemBuffer, ConstBuffer, LocalBuffer], List[UOp]],
                       global_idxs, local_idxs, upcast_idxs, full_upcast_idxs, reduce_idxs, fake_reduce_idxs, alias_buf_idxs):
-    # reduce loop
-    loop_ctx = self.render_loop(reduce_idxs, 2)
+    # reduce loop, it runs after the reduceops rendered before this one are done
+    loop_ctx = self.render_loop(reduce_idxs, 2, tuple(dedup(u for acc in accs.values() for u in acc)))
 
     # define accumulator - modify idxs if necessary for TC
     out_buf = -1 if self.group_for_reduces else 0
@@ -378,6 +375,7 @@ class Linearizer(Kernel):
     # set global/local size
     self.global_size: Optional[List[int]] = None
     self.local_size: Optional[List[int]] = None
+    self.thread_vars: Optional[Tuple[Variable, Variable]] = None
     if self.dont_use_locals:
       self.global_size = [x.max+1 for x in loop_global_idxs][::-1]
       self.loop_uops.update({x.expr:self.uops.add(UOps.SPECIAL, dtypes.int32, (), (len(loop_global_idxs)-1-i, x.expr.replace("gidx", "idx"), x.max+1)) for i,x in enumerate(loop_global_idxs)})  # noqa: E501
@@ -386,7 +384,11 @@ class Linearizer(Kernel):
       self.loop_uops.update({x.expr:self.uops.add(UOps.SPECIAL, dtypes.int32, (), (len(loop_global_idxs)-1-i, x.expr, x.max+1)) for i,x in enumerate(loop_global_idxs)})  # noqa: E501
       self.loop_uops.update({x.expr:self.uops.add(UOps.SPECIAL, dtypes.int32, (), (i, x.expr, x.max+1)) for i,x in enumerate(loop_local_idxs)})
     else:
-      self.render_loop(loop_global_idxs+loop_local_idxs, 1)
+      # on CPUs, each thread runs a slice of the outermost global loop that is passed in as two vars
+      if self.opts.has_threads and (tx:=next((x for x in loop_global_idxs if isinstance(x, Variable)), None)) is not None and isinstance(tx.max, int):
+        self.thread_vars = (Variable("core_start", 0, tx.max), Variable("core_end", 1, tx.max+1))
+        self.loop_uops[tx.expr] = self.uops.add(UOps.RANGE, dtypes.int32, tuple(self.const(v) for v in self.thread_vars), arg=(1, -1))
+      self.render_loop([x for x in loop_global_idxs+loop_local_idxs if x.expr not in self.loop_uops], 1)
     if self.global_size is not None: self.global_size += [1]*(3-len(self.global_size))
     if self.local_size is not None: self.local_size += [1]*(3-len(self.local_size))
 
@@ -444,8 +446,8 @@ class Linearizer(Kernel):
       return [self.uops.add(UOps.BITCAST if x.op is UnaryOps.BITCAST else UOps.CAST,
                             self.get_base_dtype(x.arg), (u,)) for u in self.ast_parse(x.src[0], accs, offs, loaded_buffers)]
     if x.op in ReduceOps and reduce_acc is None:
-      assert offs is None, "not available if we aren't doing reduce"
-      return accs[x]
+      # a reduceop used inside a later reduce is broadcast along the reduce axes
+      return accs[x] if offs is None else [accs[x][off] for off in offs]
 
     values = [self.ast_parse(v, accs, offs, loaded_buffers, cache=cache) for v in x.src]
     ops = {ReduceOps.SUM:BinaryOps.ADD, ReduceOps.MAX:BinaryOps.MAX}
@@ -469,7 +471,10 @@ class Linearizer(Kernel):
     src = self.opts.render(to_function_name(self.name), self.uops)
     if getenv("RUN_PROCESS_REPLAY"): diskcache_put("process_replay", "".join(map(str,[self.ast,self.applied_opts])), self)
     ops, mem = self.uops.flops_mem()
+    # count the whole outermost loop, not a slice
+    if self.thread_vars is not None:
+      ops, mem = [x.substitute({self.thread_vars[1]:NumNode(self.thread_vars[1].max)}) if isinstance(x, Node) else x for x in (ops, mem)]
     run_count = prod((self.global_size if self.global_size else []) + (self.local_size if self.local_size else []))
     # NOTE: we use min here to ignore the indexing FLOPS
     return Program(self.name, src, self.opts.device, self.global_size, self.local_size,
-                   self.uops, min(info.flops, ops * run_count), min(info.mem_estimate, mem * run_count))
+                   self.uops, min(info.flops, ops * run_count), min(info.mem_estimate, mem * run_count), self.thread_vars)
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Iterator, Optional, Tuple, Any, Dict, List, DefaultDict, Set, Callable, Union, cast, TypeVar
+from typing import Iterator, Optional, Tuple, Any, Dict, List, DefaultDict, Set, Callable, Union, cast, TypeVar, FrozenSet
 import functools, itertools, heapq
 from collections import defaultdict
 from enum import Enum, auto
@@ -7,7 +7,7 @@ from dataclasses import dataclass, field
 from tinygrad.dtype import dtypes, DType
 from tinygrad.shape.symbolic import sint, Variable
 from tinygrad.ops import UnaryOps, BinaryOps, TernaryOps, exec_alu
-from tinygrad.helpers import prod, DEBUG, getenv
+from tinygrad.helpers import prod, flatten, DEBUG, getenv
 
 # the order of these UOps controls the order of the toposort
 class UOps(Enum):
@@ -26,18 +26,20 @@ class UOps(Enum):
   # these two are not graph nodes
   ENDRANGE = auto(); ENDIF = auto() # noqa: E702
 
-@dataclass(eq=False)
 class UOp:
-  uop: UOps
-  dtype: Optional[DType] = None
-  vin: Tuple[UOp, ...] = tuple()
-  arg: Any = None
+  __slots__ = ("uop", "dtype", "vin", "arg", "_cmp_tuple", "_parents", "_loops")
+  def __init__(self, uop:UOps, dtype:Optional[DType]=None, vin:Tuple[UOp, ...]=tuple(), arg:Any=None):
+    self.uop, self.dtype, self.vin, self.arg = uop, dtype, vin, arg
   def tuple(self): return (self.uop, self.dtype, self.vin, self.arg)
-  @functools.cached_property
+  # cached by hand in slots, cached_property needs a __dict__
+  @property
   def cmp_tuple(self):
+    try: return self._cmp_tuple
+    except AttributeError: pass
     # NOTE: this sort of DEFINE_VAR shouldn't have to be here. only for PTX
-    return (self.uop.value, (self.arg if self.uop is not UOps.DEFINE_VAR else self.arg.expr) if self.uop is not UOps.ALU else \
-            (type(self.uop), self.uop.value), self.dtype, self.vin)
+    self._cmp_tuple = (self.uop.value, (self.arg if self.uop is not UOps.DEFINE_VAR else self.arg.expr) if self.uop is not UOps.ALU else \
+                       (type(self.uop), self.uop.value), self.dtype, self.vin)
+    return self._cmp_tuple
   def __lt__(self, x:UOp): return self.cmp_tuple < x.cmp_tuple
   def __repr__(self):
     return f"{str(self.uop):20s}: {str(self.dtype) if self.dtype is not None else '':25s} {str([x.uop for x in self.vin]):32s} {self.arg}"
@@ -54,8 +56,21 @@ class UOp:
   def const(dtype, val): return UOp(UOps.CONST, dtype, arg=dtypes.as_const(val, dtype))
   @staticmethod
   def alu(arg, *vin:UOp): return UOp(UOps.ALU, dtypes.bool if arg in {BinaryOps.CMPLT, BinaryOps.CMPNE} else vin[-1].dtype, vin, arg)
-  @functools.cached_property
-  def parents(self) -> Set[UOp]: return set.union(set(self.vin), *[x.parents for x in self.vin])
+  @property
+  def parents(self) -> Set[UOp]:
+    try: return self._parents
+    except AttributeError: pass
+    self._parents: Set[UOp] = set.union(set(self.vin), *[x.parents for x in self.vin])
+    return self._parents
+  # the RANGEs this depends on. without recursion, chains of index math can be deeper than the recursion limit
+  @property
+  def loops(self) -> FrozenSet[UOp]:
+    stack = [self]
+    while stack:
+      if hasattr(u:=stack[-1], "_loops"): stack.pop()
+      elif todo:=[x for x in u.vin if not hasattr(x, "_loops")]: stack.extend(todo)
+      else: u._loops = frozenset().union(*[x._loops for x in u.vin], [u] if u.uop is UOps.RANGE else [])
+    return self._loops
 
 def uop_alu_resolve(u:UOp) -> sint:
   if u.uop is UOps.CONST: return u.arg
@@ -102,6 +117,61 @@ def _match(uop:UOp, pat:UPat, store:Dict[str, UOp]) -> bool:
       return True
   return False
 
+# *** compiled matchers ***
+# a UPat is compiled to a python function doing the same as _match, the vin tuples are unrolled into it. a list vin keeps its own function to
+# try the permutations on a copy of the store, allow_len goes through _match
+
+def _compile_upat(pat:UPat) -> Callable[[UOp, Dict[str, UOp]], bool]:
+  consts: Dict[str, Any] = {"_match": _match, "_perms": _perms}
+  def const(x) -> str:
+    consts[name:=f"k{len(consts)}"] = x
+    return name
+  lines: List[str] = []
+  def emit(pat:UPat, var:str, ind:str):
+    conds = []
+    if pat.uop is not None: conds.append(f"{var}.uop not in {const(pat.uop)}" if isinstance(pat.uop, set) else f"{var}.uop is not {const(pat.uop)}")
+    if pat.arg is not None: conds.append(f"{var}.arg not in {const(pat.arg)}" if isinstance(pat.arg, set) else f"{var}.arg != {const(pat.arg)}")
+    if pat.dtype is not None:
+      conds.append(f"({var}.dtype is not None and {var}.dtype {'not in' if isinstance(pat.dtype, set) else '!='} {const(pat.dtype)})")
+    if pat.name is not None: conds.append(f"({pat.name!r} in s and s[{pat.name!r}] is not {var})")
+    if conds: lines.append(f"{ind}if {' or '.join(conds)}: return False")
+    if pat.name is not None: lines.append(f"{ind}s[{pat.name!r}] = {var}")
+    if pat.vin is None: return
+    if pat.allow_len: lines.append(f"{ind}if not _match({var}, {const(UPat(vin=pat.vin, allow_len=pat.allow_len))}, s): return False")
+    elif isinstance(pat.vin, list): lines.append(f"{ind}if not _perms({var}, {const([_compile_upat(x) for x in pat.vin])}, s): return False")
+    elif isinstance(pat.vin, tuple):
+      lines.append(f"{ind}if len({var}.vin) != {len(pat.vin)}: return False")
+      for i,x in enumerate(pat.vin):
+        if x == UPat(): continue
+        lines.append(f"{ind}{var}_{i} = {var}.vin[{i}]")
+        emit(x, f"{var}_{i}", ind)
+    else:
+      lines.append(f"{ind}for {var}_ in {var}.vin:")
+      emit(pat.vin, f"{var}_", ind+"  ")
+      if lines[-1].endswith(":"): lines.append(f"{ind}  pass")
+  emit(pat, "u", "  ")
+  exec("\n".join(["def match(u, s):", *lines, "  return True"]), consts)
+  return consts["match"]
+
+def _perms(uop:UOp, vin:List[Callable[[UOp, Dict[str, UOp]], bool]], store:Dict[str, UOp]) -> bool:
+  if len(uop.vin) != len(vin): return False
+  for vp in itertools.permutations(vin):
+    new_store = store.copy()
+    if all(m(uu, new_store) for uu, m in zip(uop.vin, vp)):
+      store.update(new_store)
+      return True
+  return False
+
+def _could_match(pat:UPat, dtype:Optional[DType], uops:Tuple[UOps, ...]) -> bool:
+  # the checks on the dtype and the uops of the vin, done once for each shape of UOp
+  def ok(p:UPat, uop:UOps): return p.uop is None or not __unmatch(p.uop, uop)
+  if pat.dtype is not None and dtype is not None and __unmatch(pat.dtype, dtype): return False
+  if pat.vin is None: return True
+  if isinstance(pat.vin, UPat): return all(ok(pat.vin, u) for u in uops)
+  if len(uops) != len(pat.vin) and len(uops) not in pat.allow_len: return False
+  if isinstance(pat.vin, tuple): return all(ok(p, u) for p,u in zip(pat.vin, uops))
+  return any(all(ok(p, u) for p,u in zip(vp, uops)) for vp in itertools.permutations(pat.vin))
+
 class PatternMatcher:
   def __init__(self, patterns:List[Tuple[UPat, Callable]]):
     self.patterns = patterns
@@ -113,11 +183,22 @@ class PatternMatcher:
         for uop in p.uop: self.pdict[(uop, p.arg)].append((p, fxn))
       else:
         self.pdict[(p.uop, p.arg)].append((p, fxn))
+    self.matchers = {id(p):_compile_upat(p) for p,_ in self.patterns}
+    # the arg is only part of the dispatch when a pattern matches on it, so CONST and DEFINE_VAR args don't grow the dispatch
+    self.arg_uops = {uop for uop,arg in self.pdict if arg is not None}
+    self.dispatch: Dict[Tuple, List[Tuple[Callable, Callable]]] = {}
+
+  def candidates(self, uop:UOps, arg:Any, dtype:Optional[DType], vin:Tuple[UOps, ...]) -> List[Tuple[Callable, Callable]]:
+    pats = self.pdict.get((uop, None), []) if arg is None else self.pdict.get((uop, arg), []) + self.pdict.get((uop, None), [])
+    return [(self.matchers[id(p)], fxn) for p,fxn in pats if _could_match(p, dtype, vin)]
 
   def rewrite(self, uop:UOp) -> Optional[UOp]:
-    for p,fxn in itertools.chain(self.pdict[(uop.uop, uop.arg)], self.pdict[(uop.uop, None)]):
+    arg = uop.arg if uop.uop in self.arg_uops and (uop.uop, uop.arg) in self.pdict else None
+    key = (uop.uop, arg, uop.dtype, tuple(x.uop for x in uop.vin))
+    if (matchers:=self.dispatch.get(key)) is None: matchers = self.dispatch[key] = self.candidates(*key)
+    for match,fxn in matchers:
       store: Dict[str, UOp] = {}
-      if _match(uop, p, store): return fxn(**store)
+      if match(uop, store): return fxn(**store)
     return None
 
 def sum_collapse(phi_input, loop, val1, val2):
@@ -128,6 +209,12 @@ def sum_collapse(phi_input, loop, val1, val2):
       return UOp(UOps.PHI, phi_input.dtype, (phi_input, v2))+ret
   return None
 
+# (x+y)+z -> (x+z)+y if x+z is in fewer loops, the toposort places it outside the loops of y. ints only, floats don't reassociate
+def loop_invariant_add(x:UOp, y:UOp, z:UOp):
+  # a const added last is free in the address, accumulators stay where the reduce patterns look for them
+  if z.uop is UOps.CONST or any(u.uop in {UOps.DEFINE_ACC, UOps.PHI} for u in (x, y, z)): return None
+  return (x+z)+y if x.loops | z.loops < x.loops | y.loops else None
+
 def loop_collapse(loop_start, loop_end, compval, idx, mval, multconst):
   if mval.arg >= 0 or loop_start.arg != 0:
     # TODO: support and test this with other mvals and loop_starts
@@ -205,18 +292,14 @@ constant_folder = PatternMatcher([
   (UPat(UOps.STORE, vin=(UPat(name="buf"), UPat(name="idx"), UPat(UOps.ALU, TernaryOps.WHERE,
                         (UPat(name="gate"), UPat(name="alt"), UPat(UOps.LOAD, vin=(UPat(name="buf"), UPat(name="idx"))))))),
     lambda buf, idx, gate, alt: UOp(UOps.STORE, None, (buf, idx, alt, gate))),
-  # store float4/float2 directly (remove CAST/GEP)
-  (UPat(UOps.STORE, vin=(UPat(name="buf"), UPat(name="idx"), UPat(UOps.CAST, vin=
-                                tuple(UPat(UOps.GEP, i, vin=(UPat(name="val"),)) for i in range(4))))),
-   lambda buf,idx,val: UOp(UOps.STORE, None, (buf, idx, val))),
-  (UPat(UOps.STORE, vin=(UPat(name="buf"), UPat(name="idx"), UPat(UOps.CAST, vin=
-                                tuple(UPat(UOps.GEP, i, vin=(UPat(name="val"),)) for i in range(2))))),
-   lambda buf,idx,val: UOp(UOps.STORE, None, (buf, idx, val))),
+  # store vectors directly (remove CAST/GEP)
+  *[(UPat(UOps.STORE, vin=(UPat(name="buf"), UPat(name="idx"), UPat(UOps.CAST, vin=
+                                 tuple(UPat(UOps.GEP, i, vin=(UPat(name="val"),)) for i in range(sz))))),
+    lambda buf,idx,val: UOp(UOps.STORE, None, (buf, idx, val))) for sz in (16, 8, 4, 2)],
   # CAST-PHI-GEP -> PHI-CAST
-  (UPat(UOps.CAST, name="root", vin=tuple(UPat(UOps.PHI, vin=(UPat(UOps.GEP, i, vin=(UPat(name="val"),)), UPat(name=f"v{i}"))) for i in range(4))),
-    lambda root, val, v0, v1, v2, v3: UOp(UOps.PHI, root.dtype, (val, UOp(UOps.CAST, val.dtype, (v0, v1, v2, v3))))),
-  (UPat(UOps.CAST, name="root", vin=tuple(UPat(UOps.PHI, vin=(UPat(UOps.GEP, i, vin=(UPat(name="val"),)), UPat(name=f"v{i}"))) for i in range(2))),
-    lambda root, val, v0, v1: UOp(UOps.PHI, root.dtype, (val, UOp(UOps.CAST, val.dtype, (v0, v1))))),
+  *[(UPat(UOps.CAST, name="root", vin=tuple(UPat(UOps.PHI, vin=(UPat(UOps.GEP, i, vin=(UPat(name="val"),)), UPat(name=f"v{i}"))) for i in range(sz))),
+    lambda root, val, **vs: UOp(UOps.PHI, root.dtype, (val, UOp(UOps.CAST, val.dtype, tuple(vs[f"v{i}"] for i in range(len(vs)))))))
+    for sz in (16, 8, 4, 2)],
   # NEG/CMPLT -> CMPLT
   (UPat(UOps.ALU, BinaryOps.CMPLT, (UPat(UOps.ALU, UnaryOps.NEG, (UPat(name="x"),)), UPat(UOps.CONST, name="c", dtype=dtypes.int))),
     lambda c,x: UOp(UOps.ALU, dtypes.bool, (UOp.const(c.dtype, -c.arg), x), BinaryOps.CMPLT)),
@@ -224,6 +307,12 @@ constant_folder = PatternMatcher([
   (UPat(UOps.CAST, name="root"), lambda root: root.vin[0] if str(root.dtype) == str(root.vin[0].dtype) else None),
 ])
 
+# loop invariant code motion, on its own so it doesn't hide the constant folding of an int ADD that it doesn't rewrite
+loop_invariant = PatternMatcher([
+  (UPat(UOps.ALU, BinaryOps.ADD, dtype=set(dt for dt in dtypes.fields().values() if dtypes.is_int(dt)),
+        vin=[UPat(UOps.ALU, BinaryOps.ADD, vin=[UPat(name="x"), UPat(name="y")]), UPat(name="z")]), loop_invariant_add),
+])
+
 # *** uop graph ***
 
 class UOpGraph:
@@ -250,37 +339,55 @@ class UOpGraph:
     for i,u in enumerate(self):
       print(f"{i:4d} {str(u.uop):20s}: {str(u.dtype) if u.dtype is not None else '':25s} " f"{str([self.uops.index(x) for x in u.vin]):32s} {u.arg}")
 
-  def graph_rewrite(self, sink, pm):
-    # recursive rewrite
-    changed = getenv("UOPS_REWRITE", 1)
-    run_cnt = 0
-    while changed:
-      changed = 0
-      @functools.lru_cache
-      def rewrite(u:UOp) -> UOp:
-        nonlocal changed
-        recurse_cnt = 0
-        up = u
-        # locally recursively rewrite
-        while (rewritten := pm.rewrite(up)):
-          assert recurse_cnt < 100, f"recursive_rewrite looped {up} <--> {rewritten}"
-          up = rewritten
-          recurse_cnt += 1
-        changed += recurse_cnt
-        # NOTE: this changes UOp, so we have to delete caches
-        up.vin = tuple(rewrite(x) for x in up.vin)
-        try: del up.parents
-        except AttributeError: pass
-        try: del up.cmp_tuple
-        except AttributeError: pass
-        # replace with cached nodes
-        if found:=self.nodes.get(key:=up.tuple()): return found
-        self.nodes[key] = up
-        return up
-      sink = rewrite(sink)
-      run_cnt += 1
-      assert run_cnt < 100, "exceeded 100 rewrite loops!"
-    return sink
+  def _dedup(self, sink:UOp) -> UOp:
+    # the linearizer builds many copies of the same UOp, they are merged through self.nodes
+    canon: Dict[UOp, UOp] = {}
+    stack: List[Tuple[UOp, bool]] = [(sink, False)]
+    while stack:
+      u, expanded = stack.pop()
+      if u in canon: continue
+      if not expanded:
+        stack.append((u, True))
+        stack.extend((x, False) for x in u.vin if x not in canon)
+        continue
+      vin = tuple(canon[x] for x in u.vin)
+      canon[u] = self.nodes.setdefault((u.uop, u.dtype, vin, u.arg), u if vin == u.vin else UOp(u.uop, u.dtype, vin, u.arg))
+    return canon[sink]
+
+  def graph_rewrite(self, sink:UOp, pm:PatternMatcher) -> UOp:
+    # worklist: a node is matched on the way down (some patterns, like arange folding, need its inputs as they are) and again once its
+    # inputs are final if they changed. only the nodes built by a rewrite are visited again, not the whole graph until nothing changes
+    # UOps aren't changed, a node with new inputs is a new UOp, deduped through self.nodes
+    replace: Dict[UOp, UOp] = {}
+    # (node, inputs are final, the node it was rewritten to, rewrites before it)
+    stack: List[Tuple[UOp, bool, Optional[UOp], int]] = [(sink:=self._dedup(sink), False, None, 0)]
+    while stack:
+      u, expanded, rewritten, cnt = stack.pop()
+      if u in replace: continue
+      if rewritten is not None:
+        replace[u] = replace[rewritten]
+        continue
+      if expanded:
+        if (vin:=tuple(replace[x] for x in u.vin)) == u.vin:
+          replace[u] = self.nodes.setdefault(u.tuple(), u)
+          continue
+        up = UOp(u.uop, u.dtype, vin, u.arg)
+      else: up = u
+      # the rewrites build many copies of the same UOp too
+      if (found:=self.nodes.get(up.tuple())) is not None and found is not u and found in replace:
+        replace[u] = replace[found]
+        continue
+      if (new:=pm.rewrite(up)) is not None:
+        assert cnt < 100, f"recursive_rewrite looped {up} <--> {new}"
+        stack.extend([(u, True, new, cnt), (new, False, None, cnt+1)])
+      elif not expanded:
+        stack.append((u, True, None, cnt))
+        stack.extend((x, False, None, 0) for x in u.vin if x not in replace)
+      else: replace[u] = self.nodes.setdefault(up.tuple(), up)
+    # drop the nodes that were rewritten, a relinearize starts from the STOREs left
+    live = set(replace.values())
+    self.nodes = {k:v for k,v in self.nodes.items() if v in live}
+    return replace[sink]
 
   def linearize(self, extra_pm:Optional[PatternMatcher]=None, type_verify=True):
     # NOTE: relinearizering should be okay
@@ -295,64 +402,77 @@ class UOpGraph:
     del _sinks
 
     sink = self.graph_rewrite(sink, constant_folder)
+    sink = self.graph_rewrite(sink, loop_invariant)
     if extra_pm: sink = self.graph_rewrite(sink, PatternMatcher(constant_folder.patterns+extra_pm.patterns))
 
     # filter nodes that don't link to a sink
     # BFS toposort
     graph: DefaultDict[UOp, List[UOp]] = defaultdict(list)
-    in_degree: DefaultDict[UOp, int] = defaultdict(int)
-    loops = []
-    ifs = []
+    in_degree: Dict[UOp, int] = {}
+    loops: List[UOp] = []
+    ifs: List[UOp] = []
     nodes: Dict[UOp, None] = {}
-    def add_parents(u:UOp):
-      if u in nodes: return
-      nodes[u] = None
-      for x in u.vin:
-        add_parents(x)
-        in_degree[u] += 1
-        graph[x].append(u)
-      if u.uop is UOps.RANGE: loops.append(u)
-      if u.uop is UOps.IF: ifs.append(u)
+    order: List[UOp] = []  # a uop after its inputs
+    # depth first with an explicit stack, the edges are added in the same order as a recursive walk would
     sink = UOp(UOps.SINK, None, tuple(x for x in sink.vin if x.uop is not UOps.NOOP))
-    add_parents(sink)
-
-    @functools.lru_cache(None)
-    def get_recursive_children(x:UOp, include_self=False) -> Set[UOp]:
-      if x.uop is UOps.SINK: return set()
-      return set.union(set((x,)) if include_self else set(), *([get_recursive_children(u, True) for u in graph[x]] if x.uop is not UOps.PHI else []))
-    loops_children = {l:get_recursive_children(l) for l in loops[::-1]}
+    nodes[sink], stack = None, [(sink, iter(sink.vin))]
+    while stack:
+      u, vin = stack[-1]
+      for x in vin:
+        if x not in nodes:
+          nodes[x] = None
+          stack.append((x, iter(x.vin)))
+          break
+        graph[x].append(u)
+      else:
+        stack.pop()
+        in_degree[u] = len(u.vin)
+        if u.uop is UOps.RANGE: loops.append(u)
+        if u.uop is UOps.IF: ifs.append(u)
+        order.append(u)
+        if stack: graph[u].append(stack[-1][0])
+
+    # a uop is in the loops of the RANGEs it depends on, not through a PHI. the few distinct sets of loops are shared
+    loop_order = {l:i for i,l in enumerate(loops[::-1])}
+    in_loops: Dict[UOp, FrozenSet[UOp]] = {sink: frozenset()}
+    loop_sets: Dict[FrozenSet[UOp], Tuple[int, Tuple[UOp, ...]]] = {}
+    loop_left: DefaultDict[UOp, int] = defaultdict(int)
+    for u in order[:-1]:
+      ls = frozenset().union(*[in_loops[x] | ({x} if x.uop is UOps.RANGE else set()) for x in u.vin if x.uop is not UOps.PHI])
+      in_loops[u] = ls
+      # prefer uops that are loop children, the ENDRANGEs are checked in the order of loop_order
+      if ls not in loop_sets: loop_sets[ls] = (-sum(l.arg[0]*1000 + l.arg[1] for l in ls), tuple(sorted(ls, key=loop_order.get)))
+      for l in ls: loop_left[l] += 1
+    loop_sets[frozenset()] = (0, ())
 
     queue: List = []
-    def push(u):
-      priority = 0
-      # prefer uops that are loop children
-      for l, ss in loops_children.items():
-        if u in ss: priority -= l.arg[0]*1000 + l.arg[1]
-      heapq.heappush(queue, (priority, u))
+    def push(u): heapq.heappush(queue, (loop_sets[in_loops[u]][0], u))
 
     for u in nodes:
       if in_degree[u] == 0: push(u)
 
     if getenv("FUZZ_UOPS", 0):
       from test.external.fuzz_uops import fuzz_uops
-      self.fuzz_paths = fuzz_uops(graph, in_degree.copy(), loops_children)
+      self.fuzz_paths = fuzz_uops(graph, defaultdict(int, in_degree), {l:{u for u in nodes if l in in_loops[u]} for l in loops[::-1]})
 
-    self._uops = []
+    # a DEFINE_ACC goes right before the first of its loops, after the ones already there
+    before: DefaultDict[UOp, List[UOp]] = defaultdict(list)
+    placed: Dict[UOp, int] = {}
+    _uops: List[UOp] = []
     while queue:
       p,x = heapq.heappop(queue)
       if DEBUG >= 7: print(p,x)
-      if x.uop is UOps.DEFINE_ACC and len(x.vin):
-        idx = min([self._uops.index(l) for l in x.vin])
-        self._uops.insert(idx, x)
+      if x.uop is UOps.DEFINE_ACC and len(x.vin): before[min(x.vin, key=lambda l: placed[l])].append(x)
       else:
-        self._uops.append(x)
-      for u, ss in loops_children.items():
-        if x in ss:
-          ss.remove(x)
-          if len(ss) == 0: self._uops.append(UOp(UOps.ENDRANGE, None, (u,)))
+        placed[x] = len(_uops)
+        _uops.append(x)
+      for l in loop_sets[in_loops[x]][1]:
+        loop_left[l] -= 1
+        if loop_left[l] == 0: _uops.append(UOp(UOps.ENDRANGE, None, (l,)))
       for u in graph[x]:
         in_degree[u] -= 1
         if in_degree[u] == 0: push(u)
+    self._uops = flatten([before[u] + [u] if u in before else [u] for u in _uops])
 
     assert self._uops[-1].uop is UOps.SINK, f"didn't end with SINK, ended with {self._uops[-1]}"
     self._uops = self._uops[:-1]
@@ -1,4 +1,4 @@
-import os, atexit, functools
+import os, atexit, functools, weakref
 from collections import defaultdict
 from typing import List, Any, DefaultDict
 from tinygrad.ops import UnaryOps, BinaryOps, ReduceOps, LoadOps, BufferOps, TernaryOps, LazyOp
@@ -33,11 +33,12 @@ def init_graph():
   atexit.register(functools.partial(save_graph, G, GRAPHPATH)) # -Gnslimit=100 can make it finish, but you won't like results
 
 counts: DefaultDict[type, int] = defaultdict(int)
+node_ids: weakref.WeakKeyDictionary[Any, int] = weakref.WeakKeyDictionary()  # LazyBuffer has __slots__
 def nm(x):
-  if not hasattr(x, 'node_id'):
-    setattr(x, 'node_id', counts[type(x)])
+  if x not in node_ids:
+    node_ids[x] = counts[type(x)]
     counts[type(x)] += 1
-  return x.node_id
+  return node_ids[x]
 
 def realized_lazybuffer(lb:'LazyBuffer', num):
   init_graph()
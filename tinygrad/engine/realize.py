@@ -1,13 +1,16 @@
-from typing import List, Dict, Optional, cast, Generator, Tuple
-import time
+from typing import List, Dict, Optional, cast, Generator, Tuple, Deque, Callable, Any, DefaultDict
+import time, os, multiprocessing, threading
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 from dataclasses import dataclass, replace
-from tinygrad.helpers import colored, getenv, DEBUG, GlobalCounters, ansilen, BEAM, NOOPT, all_int
+from tinygrad.helpers import colored, getenv, DEBUG, GlobalCounters, ansilen, BEAM, NOOPT, RUN_THREADS, COMPILE_AHEAD, ContextVar, Timing, all_int
+from tinygrad.helpers import dedup, cpu_time_execution, CPU_THREADS, CPU_THREAD_WORK, diskcache_get, diskcache_put
 from tinygrad.ops import BufferOps, LoadOps, LazyOp
-from tinygrad.device import Device, Buffer
+from tinygrad.device import Device, Buffer, Compiler
 from tinygrad.shape.symbolic import Variable, sym_infer, sint
 from tinygrad.renderer import Renderer, Program
 from tinygrad.codegen.linearizer import Linearizer
-from tinygrad.engine.schedule import ScheduleItem
+from tinygrad.engine.schedule import ScheduleItem, schedule_dag, THREADED_DEVICES
 
 # **************** Program Creation ****************
 
@@ -66,11 +69,8 @@ class CompiledRunner(Runner):
   def __call__(self, rawbufs:List[Buffer], var_vals:Dict[Variable, int], wait=False) -> Optional[float]:
     global_size, local_size = self.p.launch_dims(var_vals)
     if global_size is not None and local_size is None and all_int(self.p.global_size): # type: ignore[arg-type]
-      # TODO: this is copied from get_program
-      from tinygrad.engine.search import optimize_local_size
-      local_size = optimize_local_size(self.clprg, global_size, rawbufs)
-      global_size = [g//l if g%l == 0 else g/l for g,l in zip(global_size, local_size)]
-      self.p = replace(self.p, global_size=global_size, local_size=local_size)
+      self.tune_local_size(rawbufs)
+      global_size, local_size = self.p.launch_dims(var_vals)
     lra = {}
     if global_size:
       lra['global_size'] = global_size
@@ -78,7 +78,49 @@ class CompiledRunner(Runner):
     if local_size:
       lra['local_size'] = local_size
       assert len(local_size) == 3, "local size must have len 3"
-    return self.clprg(*[x._buf for x in rawbufs], **lra, vals=tuple(var_vals[k] for k in self.p.vars), wait=wait)
+    if self.p.thread_vars is None: return self.clprg(*[x._buf for x in rawbufs], **lra, vals=tuple(var_vals[k] for k in self.p.vars), wait=wait)
+    # split the outermost loop over the threads, this thread runs the first slice
+    # NOTE: the vals come after the bufs, unused bufs aren't in the function signature
+    start, end = self.p.thread_vars
+    if len(rawbufs) != len(self.p.globals): rawbufs = [rawbufs[i] for i,_ in self.p.globals]
+    bufs, threads = [x._buf for x in rawbufs], self.threads(var_vals)
+    slices = [tuple({**var_vals, start:end.max*i//threads, end:end.max*(i+1)//threads}[k] for k in self.p.vars) for i in range(threads)]
+    if threads == 1: return self.clprg(*bufs, vals=slices[0], wait=wait)
+    def run_slices():
+      futures = [_cpu_submit(self.clprg, *bufs, vals=vals) for vals in slices[1:]]
+      self.clprg(*bufs, vals=slices[0])
+      for f in futures: f.result()
+    return cpu_time_execution(run_slices, enable=wait)
+
+  def tune_local_size(self, rawbufs:List[Buffer]):
+    """Times the local sizes for a program that doesn't set one and keeps the fastest, it's in the disk cache by source, global size and device."""
+    # the fastest local size depends on the GPU, not just the backend
+    dev = Device[self.dname]
+    key = {"src": self.p.src, "global_size": str(global_size:=cast(List[int], self.p.global_size)), "device": self.dname.split(":")[0],
+           "suffix": dev.renderer.suffix, "arch": getattr(dev, "arch", getattr(dev, "device_name", ""))}
+    if (local_size:=diskcache_get("optimize_local_size", key)) is None:
+      from tinygrad.engine.search import optimize_local_size
+      local_size = diskcache_put("optimize_local_size", key, optimize_local_size(self.clprg, global_size, rawbufs))
+    self.p = replace(self.p, global_size=[g//l if g%l == 0 else g/l for g,l in zip(global_size, local_size)], local_size=local_size)
+
+  def threads(self, var_vals:Dict[Variable, int]) -> int:
+    """The number of CPU threads to run on, tiny kernels stay on one thread."""
+    if self.p.thread_vars is None: return 1
+    work = sym_infer(self.p.op_estimate, var_vals) + sym_infer(self.p.mem_estimate, var_vals)
+    return max(1, min(CPU_THREADS.value, self.p.thread_vars[1].max, int(work) // max(1, CPU_THREAD_WORK.value)))
+
+_cpu_threads: Optional[ThreadPoolExecutor] = None
+_cpu_threads_size, _cpu_lock = 0, threading.Lock()
+def _cpu_submit(fxn:Callable, *args, **kwargs) -> Future:
+  # the kernels release the GIL, the threads are kept between calls
+  global _cpu_threads, _cpu_threads_size
+  with _cpu_lock:
+    if _cpu_threads is None or _cpu_threads_size < CPU_THREADS.value - 1:
+      # slices already queued on the old pool still run
+      if _cpu_threads is not None: _cpu_threads.shutdown(wait=False)
+      _cpu_threads_size = max(1, CPU_THREADS.value - 1)
+      _cpu_threads = ThreadPoolExecutor(_cpu_threads_size, thread_name_prefix="tinygrad_cpu")
+    return _cpu_threads.submit(fxn, *args, **kwargs)
 
 class CustomOp(Runner):
   def __init__(self, fxn):
@@ -141,6 +183,87 @@ def get_runner(dname:str, ast:Tuple[LazyOp, ...]) -> CompiledRunner:
     method_cache[ckey] = method_cache[bkey] = ret = CompiledRunner(replace(prg, dname=dname))
   return ret
 
+# **************** ahead of time compilation ****************
+
+def _init_compile_worker(context:Dict[str, Any]):
+  import signal
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  # spawned workers only see the environment, set the ContextVars of the parent
+  for k,v in context.items():
+    if k in ContextVar._cache: ContextVar._cache[k].value = v
+
+def _compile_asts(x:Tuple[List[Tuple[LazyOp, ...]], Renderer, Compiler]) -> List[Tuple[Program, bytes]]:
+  asts, renderer, compiler = x
+  prgs = [get_linearizer(renderer, ast).to_program() for ast in asts]
+  # a compiler that can put many kernels in one lib is only called once
+  srcs = dedup([p.src for p in prgs])
+  if hasattr(compiler, "compile_batch") and len(srcs) > 1 and len(set(p.function_name for p in prgs)) == len(srcs):
+    lib = compiler.compile_batch(srcs)
+    return [(p, lib) for p in prgs]
+  return [(p, compiler.compile_cached(p.src)) for p in prgs]
+
+def precompile_schedule(schedule:List[ScheduleItem], workers:Optional[int]=None, batch:Optional[int]=None, tune=False) -> int:
+  """
+  Linearizes and compiles the kernels in the schedule on a process pool, filling the method_cache and the disk cache.
+  Compilers with a `compile_batch` method compile up to `batch` kernels into one lib.
+  With `tune`, the kernels without a local size get theirs now, on scratch buffers, instead of on their first run.
+  Returns the number of kernels that were compiled.
+  """
+  cnt = _compile_schedule(schedule, workers, batch)
+  if tune:
+    for si in schedule:
+      if si.ast[0].op is not BufferOps.STORE: continue
+      runner = get_runner(si.outputs[0].device, si.ast)
+      if runner.p.global_size is not None and runner.p.local_size is None and all_int(runner.p.global_size):
+        runner.tune_local_size([Buffer(b.device, b.size, b.dtype).allocate() for b in (si.bufs[i] for i,_ in runner.p.globals)])
+  return cnt
+
+def _compile_schedule(schedule:List[ScheduleItem], workers:Optional[int], batch:Optional[int]) -> int:
+  todo: DefaultDict[str, Dict[Tuple[LazyOp, ...], None]] = defaultdict(dict)
+  for si in schedule:
+    if si.ast[0].op is not BufferOps.STORE: continue
+    dname = si.outputs[0].device
+    if (dname, si.ast, BEAM.value, False) in method_cache: continue
+    # already compiled for another device of the same type
+    if (dname.split(":")[0], si.ast, BEAM.value, True) in method_cache: get_runner(dname, si.ast)
+    elif not any(si.ast in asts for d,asts in todo.items() if d.split(":")[0] == dname.split(":")[0]): todo[dname][si.ast] = None
+  if (cnt:=sum(len(asts) for asts in todo.values())) == 0: return 0
+  # BEAM searches on its own pool
+  if BEAM >= 1:
+    for dname,asts in todo.items():
+      for ast in asts: get_runner(dname, ast)
+    return cnt
+  if workers is None: workers = getenv("PARALLEL", multiprocessing.cpu_count())
+  if batch is None: batch = getenv("COMPILE_BATCH", 64)
+  # split the kernels in chunks so every worker gets some
+  chunks: List[Tuple[List[Tuple[LazyOp, ...]], str]] = []
+  for dname,asts in todo.items():
+    size = max(1, min(batch, -(-len(asts)//max(workers, 1))))
+    chunks += [(list(asts)[i:i+size], dname) for i in range(0, len(asts), size)]
+  args = [(asts, Device[dname].renderer, Device[dname].compiler) for asts,dname in chunks]
+  with Timing(f"compiled {cnt} kernels in {len(chunks)} chunks on {workers} workers in ", enabled=DEBUG>=1):
+    pool = multiprocessing.get_context("spawn").Pool(workers, _init_compile_worker, ({k:v.value for k,v in ContextVar._cache.items()},)) \
+      if workers > 1 and len(chunks) > 1 else None
+    try:
+      for (asts,dname),compiled in zip(chunks, pool.imap(_compile_asts, args) if pool is not None else map(_compile_asts, args)):
+        for ast,(prg,lib) in zip(asts, compiled):
+          method_cache[(dname, ast, BEAM.value, False)] = method_cache[(dname.split(":")[0], ast, BEAM.value, True)] = \
+            CompiledRunner(replace(prg, dname=dname), lib)
+    finally:
+      if pool is not None: pool.terminate()
+  return cnt
+
+def precompile(fxn:Callable, *args, workers:Optional[int]=None, batch:Optional[int]=None, tune=False, **kwargs) -> int:
+  """
+  Precompiles the kernels of fxn(*args, **kwargs) without running them, see `precompile_schedule`.
+  The Tensor inputs are realized first. fxn shouldn't assign to Tensors, the scheduled assigns would never run.
+  """
+  from tinygrad.tensor import Tensor
+  if len(ins:=[x for x in list(args)+list(kwargs.values()) if isinstance(x, Tensor)]): Tensor.realize(*ins)
+  outs = fxn(*args, **kwargs)
+  outs = [x for x in (outs if isinstance(outs, (list, tuple)) else [outs]) if isinstance(x, Tensor)]
+  return precompile_schedule(Tensor.schedule(*outs) if len(outs) else [], workers, batch, tune)
+
 # **************** lowering functions ****************
 
 @dataclass(frozen=True)
@@ -150,17 +273,18 @@ class ExecItem:
   def run(self, var_vals:Optional[Dict[Variable, int]]=None, wait=False, jit=False, do_update_stats=True) -> Optional[float]:
     bufs = [cast(Buffer, x) for x in self.bufs] if jit else [cast(Buffer, x).ensure_allocated() for x in self.bufs]
     et = self.prg(bufs, var_vals if var_vals is not None else {}, wait=wait or DEBUG >= 2)
-    if do_update_stats:
-      GlobalCounters.kernel_count += 1
-      GlobalCounters.global_ops += (op_estimate:=sym_infer(self.prg.op_estimate, var_vals))
-      GlobalCounters.global_mem += (mem_estimate:=sym_infer(self.prg.mem_estimate, var_vals))
-      if et is not None: GlobalCounters.time_sum_s += et
-      if DEBUG >= 2:
-        ptm = (colored(f"{et*1e3:9.2f}ms", "yellow") if et > 0.01 else f"{et*1e6:9.2f}us") if et is not None else ""
-        print(f"{colored(f'*** {self.prg.dname[:7]:7s} {GlobalCounters.kernel_count:4d}', 'magenta' if jit else ('green' if self.prg.first_run else None))} {self.prg.display_name+' '*(38-ansilen(self.prg.display_name))} arg {len(self.bufs):3d} mem {GlobalCounters.mem_used/1e9:5.2f} GB " +  # noqa: E501
-              (str() if et is None else f"tm {ptm}/{GlobalCounters.time_sum_s*1e3:9.2f}ms ({op_estimate/((et or 1e-20)*1e9):8.2f} GFLOPS, {mem_estimate/((et or 1e-20)*1e9):7.2f} GB/s)"))  # noqa: E501
-      self.prg.first_run = False
+    if do_update_stats: self.update_stats(et, var_vals, jit)
     return et
+  def update_stats(self, et:Optional[float], var_vals:Optional[Dict[Variable, int]]=None, jit=False):
+    GlobalCounters.kernel_count += 1
+    GlobalCounters.global_ops += (op_estimate:=sym_infer(self.prg.op_estimate, var_vals))
+    GlobalCounters.global_mem += (mem_estimate:=sym_infer(self.prg.mem_estimate, var_vals))
+    if et is not None: GlobalCounters.time_sum_s += et
+    if DEBUG >= 2:
+      ptm = (colored(f"{et*1e3:9.2f}ms", "yellow") if et > 0.01 else f"{et*1e6:9.2f}us") if et is not None else ""
+      print(f"{colored(f'*** {self.prg.dname[:7]:7s} {GlobalCounters.kernel_count:4d}', 'magenta' if jit else ('green' if self.prg.first_run else None))} {self.prg.display_name+' '*(38-ansilen(self.prg.display_name))} arg {len(self.bufs):3d} mem {GlobalCounters.mem_used/1e9:5.2f} GB " +  # noqa: E501
+            (str() if et is None else f"tm {ptm}/{GlobalCounters.time_sum_s*1e3:9.2f}ms ({op_estimate/((et or 1e-20)*1e9):8.2f} GFLOPS, {mem_estimate/((et or 1e-20)*1e9):7.2f} GB/s)"))  # noqa: E501
+    self.prg.first_run = False
 
 def lower_schedule_item(si:ScheduleItem) -> ExecItem:
   assert len(set(x.device for x in si.bufs)) == 1 or si.ast[0].op is LoadOps.COPY or getenv("USE_COPY_KERNEL")
@@ -179,13 +303,48 @@ def lower_schedule_item(si:ScheduleItem) -> ExecItem:
   raise RuntimeError(f"don't know how to lower {ast}")
 
 def lower_schedule(schedule:List[ScheduleItem]) -> Generator[ExecItem, None, None]:
+  # BEAM, the method_cache and the GPU compilers aren't thread safe, only the CPU compilers lower ahead
+  if COMPILE_AHEAD > 0 and len(schedule) > 1 and BEAM == 0 and all(b.device.split(":")[0] in THREADED_DEVICES for si in schedule for b in si.bufs):
+    yield from _lower_schedule_ahead(schedule, COMPILE_AHEAD.value)
   while len(schedule): yield lower_schedule_item(schedule.pop(0))
 
+def _lower_schedule_ahead(schedule:List[ScheduleItem], lookahead:int) -> Generator[ExecItem, None, None]:
+  """lower up to lookahead items ahead of the one being run on a thread pool, the compilers run outside the GIL"""
+  with ThreadPoolExecutor(min(lookahead, os.cpu_count() or 1)) as pool:
+    lowering: Deque[Future] = deque()
+    while len(schedule) or len(lowering):
+      while len(schedule) and len(lowering) < lookahead:
+        si = schedule.pop(0)
+        # open the devices here, creating them isn't thread safe
+        for b in si.bufs: Device[b.device]
+        lowering.append(pool.submit(lower_schedule_item, si))
+      yield lowering.popleft().result()
+
 # **************** main run function ****************
 
 capturing: List = []  # put classes with an add method in here
 
+def _run_schedule_threaded(schedule:List[ScheduleItem], var_vals:Optional[Dict[Variable, int]], do_update_stats:bool, threads:int):
+  dag = schedule_dag(schedule)
+  # compiling and allocating aren't thread safe, do them in order first
+  eis = list(lower_schedule(schedule))
+  for ei in eis:
+    for b in ei.bufs: cast(Buffer, b).ensure_allocated()
+  in_degree = [len(d) for d in dag.deps]
+  with ThreadPoolExecutor(threads) as pool:
+    running: Dict[Future, int] = {pool.submit(eis[i].run, var_vals, jit=True, do_update_stats=False):i for i,d in enumerate(in_degree) if d == 0}
+    while running:
+      done, _ = wait(running, return_when=FIRST_COMPLETED)
+      for fut in done:
+        i, et = running.pop(fut), fut.result()
+        if do_update_stats: eis[i].update_stats(et, var_vals)
+        for c in dag.children[i]:
+          in_degree[c] -= 1
+          if in_degree[c] == 0: running[pool.submit(eis[c].run, var_vals, jit=True, do_update_stats=False)] = c
+
 def run_schedule(schedule:List[ScheduleItem], var_vals:Optional[Dict[Variable, int]]=None, do_update_stats=True):
+  if RUN_THREADS > 1 and not len(capturing) and all(b.device.split(":")[0] in THREADED_DEVICES for si in schedule for b in si.bufs):
+    return _run_schedule_threaded(schedule, var_vals, do_update_stats, RUN_THREADS.value)
   for ei in lower_schedule(schedule):
     if len(capturing): capturing[0].add(ei)
     ei.run(var_vals, do_update_stats=do_update_stats)
@@ -1,11 +1,12 @@
-import sys, pickle, atexit
+import sys, pickle, atexit, functools
 from collections import defaultdict, deque
 from dataclasses import dataclass
 from typing import Tuple, List, Dict, Optional, Set, DefaultDict, Union, get_args
-from tinygrad.ops import LoadOps, BufferOps, LazyOp, ReduceOps, ConstBuffer, MemBuffer, UNSAFE_PAD_OPS, UnaryOps
+from tinygrad.ops import LoadOps, BufferOps, LazyOp, ReduceOps, ConstBuffer, MemBuffer, UNSAFE_PAD_OPS, UnaryOps, get_lazyop_info
 from tinygrad.engine.graph import log_lazybuffer, realized_lazybuffer
-from tinygrad.helpers import GRAPH, DEBUG, MULTIOUTPUT, SAVE_SCHEDULE, GlobalCounters, colored, prod, dedup, all_int, merge_dicts, getenv
-from tinygrad.shape.symbolic import Variable
+from tinygrad.helpers import GRAPH, DEBUG, MULTIOUTPUT, MULTIREDUCE, FUSE_HORIZONTAL, FUSE_HORIZONTAL_MAX_BUFS, FLOP_COST, LAUNCH_COST, \
+  RUN_THREADS, SAVE_SCHEDULE, GlobalCounters, colored, prod, dedup, all_int, merge_dicts, getenv
+from tinygrad.shape.symbolic import Variable, sint
 from tinygrad.dtype import ConstType, ImageDType, dtypes, DType
 from tinygrad.lazy import LazyBuffer
 from tinygrad.shape.shapetracker import ShapeTracker
@@ -92,7 +93,7 @@ def _recursive_lazyop(buf:LazyBuffer, inputs:List[LazyBuffer], outputs:Tuple[Laz
 
   # if it's a reduce, we have to change the shapetracker
   if buf.op in ReduceOps:
-    assert st.contiguous, "ReduceOps late fusion must be contiguous"
+    assert st.contiguous or _is_reduce_broadcast(buf, st), "ReduceOps late fusion must be contiguous or broadcast into a reduce on the same axes"
     st = ShapeTracker.from_shape(buf.srcs[0].shape)
 
   # otherwise we fuse it like normal
@@ -100,6 +101,13 @@ def _recursive_lazyop(buf:LazyBuffer, inputs:List[LazyBuffer], outputs:Tuple[Laz
     LazyOp(buf.op, tuple(_recursive_lazyop(x, inputs, outputs, var_vals, st, realizes, assign_targets, cache) for x in buf.srcs), buf.arg)
   return ret
 
+def _is_broadcast(shape:Tuple[sint, ...], st:ShapeTracker) -> bool:
+  """check if st is only an expand of a contiguous buffer with this shape"""
+  if len(st.shape) != len(shape) or st.shape == shape or not all(s == 1 or s == n for s,n in zip(shape, st.shape)): return False
+  return st.simplify() == ShapeTracker.from_shape(shape).expand(st.shape)
+
+def _is_reduce_broadcast(buf:LazyBuffer, st:ShapeTracker) -> bool: return st.shape == buf.srcs[0].shape and _is_broadcast(buf.shape, st)
+
 def _schedule_group(outs:Tuple[LazyBuffer, ...], realizes:Dict[LazyBuffer, None], reduce_for_op: Dict[LazyBuffer, LazyBuffer]) -> _LBScheduleItem:
   """create a schedule item from a list of outputs"""
   inputs: List[LazyBuffer] = []
@@ -127,9 +135,9 @@ def _schedule_group(outs:Tuple[LazyBuffer, ...], realizes:Dict[LazyBuffer, None]
 
 # *** DAG creation: decide which LazyBuffers should realize ***
 
-def _recurse_lb(buf:LazyBuffer, realizes:Dict[LazyBuffer, None], allbufs:Dict[LazyBuffer, None],
-                simple_pads:Set[LazyBuffer], children:DefaultDict[LazyBuffer, Dict[LazyBuffer, None]], scheduled=False):
-  """recursively search the entire graph for all LazyBuffers, insert realizes after expands"""
+def _recurse_lb(buf:LazyBuffer, realizes:Dict[LazyBuffer, None], allbufs:Dict[LazyBuffer, None], simple_pads:Set[LazyBuffer],
+                children:DefaultDict[LazyBuffer, Dict[LazyBuffer, None]], expands:DefaultDict[LazyBuffer, Dict[LazyBuffer, None]], scheduled=False):
+  """recursively search the entire graph for all LazyBuffers, collect the expands"""
   if buf in allbufs or buf.base.realized is not None: return
   if GRAPH: log_lazybuffer(buf, scheduled)
   # view
@@ -138,13 +146,13 @@ def _recurse_lb(buf:LazyBuffer, realizes:Dict[LazyBuffer, None], allbufs:Dict[La
     if len(buf.st.views) == 1 and buf.st.views[-1].mask is not None and all_int(buf.base.st.shape) and \
         prod(buf.base.st.shape) >= prod([y-x for x,y in buf.st.views[-1].mask]):
       simple_pads.add(buf.base)
-    # realize all expands
+    # expands are realized or recomputed by _realize_expand
     elif prod(buf.base.st.shape) < prod(buf.st.shape):
       if buf.base.op is UnaryOps.CAST and isinstance(buf.base.srcs[0].dtype, ImageDType) and isinstance(buf.base.arg, ImageDType):
         pass # don't realize image to image casts. this is part of a larger problem
       else:
-        realizes[buf.base] = None
-    return _recurse_lb(buf.base, realizes, allbufs, simple_pads, children)
+        expands[buf.base][buf] = None
+    return _recurse_lb(buf.base, realizes, allbufs, simple_pads, children, expands)
   # base
   allbufs[buf] = None
   if buf.forced_realize: realizes[buf] = None
@@ -155,7 +163,52 @@ def _recurse_lb(buf:LazyBuffer, realizes:Dict[LazyBuffer, None], allbufs:Dict[La
   if buf.op is LoadOps.VIEW: realizes[buf.srcs[0].base] = None
   for x in buf.srcs:
     children[x.base][buf] = None
-    _recurse_lb(x, realizes, allbufs, simple_pads, children)
+    _recurse_lb(x, realizes, allbufs, simple_pads, children, expands)
+
+# *** cost model: realize an expanded buffer or recompute it in the consumers ***
+
+# estimated in bytes of memory traffic. a flop costs FLOP_COST bytes, launching a kernel costs LAUNCH_COST bytes
+@dataclass(frozen=True)
+class ExpandCost:
+  realize: float
+  recompute: float
+  flops: int
+  mem: int
+  def __str__(self): return f"realize {self.realize:10.0f} recompute {self.recompute:10.0f}, {self.flops} flops {self.mem} bytes per realize"
+
+def _expand_cost(buf:LazyBuffer, views:Dict[LazyBuffer, None], consumers:int, realizes:Dict[LazyBuffer, None]) -> Optional[ExpandCost]:
+  """the cost of realizing buf once and loading it in the consumers, vs recomputing it for every element the consumers load"""
+  if not all_int(buf.shape) or not all(all_int(v.shape) for v in views) or isinstance(buf.dtype, ImageDType): return None
+  info = get_lazyop_info(LazyOp(BufferOps.STORE, (_recursive_lazyop(buf, [], (buf,), {}, ShapeTracker.from_shape(buf.shape), realizes, {}, {}),),
+                                MemBuffer(0, buf.dtype, ShapeTracker.from_shape(buf.shape))))
+  # recomputing reads the inputs and does the flops for every element loaded, the other consumers recompute it with no expand
+  loaded = sum(prod(v.shape) for v in views) + (consumers - len(views)) * prod(buf.shape)
+  flops, in_bytes = info.flops, info.mem_estimate - buf.size*buf.dtype.itemsize
+  recompute = (flops * FLOP_COST.value + in_bytes) * loaded / prod(buf.shape)
+  realize = LAUNCH_COST.value + flops * FLOP_COST.value + info.mem_estimate + consumers * buf.size*buf.dtype.itemsize
+  return ExpandCost(realize, recompute, flops, info.mem_estimate)
+
+def _realize_expand(buf:LazyBuffer, expands:DefaultDict[LazyBuffer, Dict[LazyBuffer, None]], realizes:Dict[LazyBuffer, None],
+                    children:DefaultDict[LazyBuffer, Dict[LazyBuffer, None]], decided:Set[LazyBuffer]):
+  """realize the expanded buffer if it's cheaper than recomputing it"""
+  if buf in decided: return
+  decided.add(buf)
+  # decide the expands that feed into this buffer first, they are loads if they get realized
+  stack, elementwise = list(buf.srcs), buf.op not in ReduceOps
+  while stack:
+    if (x:=stack.pop().base) in realizes or x.realized is not None: continue
+    if x in expands: _realize_expand(x, expands, realizes, children, decided)
+    if x not in realizes:
+      # only recompute elementwise ops
+      elementwise = elementwise and x.op not in ReduceOps and x.op not in LoadOps
+      stack.extend(x.srcs)
+  if buf in realizes: return
+  # children are the direct consumers, an expanded view and its base are consumed by the same child
+  cost = _expand_cost(buf, expands[buf], len(children[buf]), realizes) if elementwise else None
+  if cost is None or cost.realize <= cost.recompute: realizes[buf] = None
+  if DEBUG >= 3:
+    print(f"{colored('realize  ', 'green') if buf in realizes else colored('recompute', 'yellow')} {str(buf.op):20s} {str(buf.shape):20s}",
+          f"expanded to {', '.join(str(v.shape) for v in expands[buf]):30s} {cost if cost is not None else 'not elementwise'}")
 
 def _is_padding_okay(buf:LazyBuffer, realizes:Dict[LazyBuffer, None]) -> bool:
   if buf in realizes or buf.realized is not None: return True
@@ -179,6 +232,55 @@ def _recursive_group(tr:LazyBuffer, st:ShapeTracker, r:LazyBuffer, children:Defa
       if len(st_childs:=dedup(s for s in tr_next.srcs if s.base == tr)) > 1: return group.add(r)
       _recursive_group(tr_next, st+st_childs[0].st, r, children, realizes, reduce_for_op, group)
 
+def _find_broadcast_loads(buf:LazyBuffer, st:ShapeTracker, outs:List[LazyBuffer], realizes:Dict[LazyBuffer, None],
+                          loads:Dict[LazyBuffer, bool], cache:Set[Tuple[LazyBuffer, ShapeTracker]]):
+  """walk the kernel like _recursive_lazyop, for each buffer it loads record if all the loads are broadcasts"""
+  if buf != buf.base:
+    st = buf.st + st
+    buf = buf.base
+  if (buf, st) in cache or buf.op is LoadOps.CONST: return
+  cache.add((buf, st))
+  if buf.realized is not None or (buf in realizes and buf not in outs):
+    loads[buf] = loads.get(buf, True) and buf.realized is None and _is_broadcast(buf.shape, st)
+    return
+  if buf.op in ReduceOps: st = ShapeTracker.from_shape(buf.srcs[0].shape)
+  for x in buf.srcs: _find_broadcast_loads(x, st, outs, realizes, loads, cache)
+
+def _depends_on(buf:LazyBuffer, targets:Set[LazyBuffer], visited:Set[LazyBuffer], kernels:Dict[LazyBuffer, List[LazyBuffer]]) -> bool:
+  if buf in targets: return True
+  if buf in visited or buf.realized is not None: return False
+  visited.add(buf)
+  # a buffer stored by a kernel depends on everything that kernel loads
+  return any(_depends_on(x.base, targets, visited, kernels) for out in kernels.get(buf, [buf]) for x in out.srcs)
+
+def _chain_reduces(output_groups:DefaultDict[LazyBuffer, List[LazyBuffer]], realizes:Dict[LazyBuffer, None],
+                   reduce_for_op:Dict[LazyBuffer, LazyBuffer]):
+  """merge the kernel of a reduce into the kernel of a later reduce over the same axes, the kernel renders both reduce loops"""
+  def can_chain(r:LazyBuffer, rb:LazyBuffer, loads:Dict[LazyBuffer, bool], kernels:Dict[LazyBuffer, List[LazyBuffer]]) -> bool:
+    if rb not in output_groups or rb.op not in ReduceOps or rb.shape != r.shape or rb.srcs[0].shape != r.srcs[0].shape: return False
+    group = output_groups[rb]
+    if any(x.op in LoadOps or isinstance(x.dtype, ImageDType) or x.device != r.device or not loads.get(x, True) for x in group): return False
+    # the loads of either kernel can't depend on the outputs of the other one
+    visited: Set[LazyBuffer] = set()
+    if any(_depends_on(x, set(group), visited, kernels) for x in loads if x not in group): return False
+    rb_loads: Dict[LazyBuffer, bool] = {}
+    cache: Set[Tuple[LazyBuffer, ShapeTracker]] = set()
+    for out in group: _find_broadcast_loads(out, ShapeTracker.from_shape(rb.shape), group, realizes, rb_loads, cache)
+    visited = set()
+    return not any(_depends_on(x, set(output_groups[r]), visited, kernels) for x in rb_loads)
+  for r in list(output_groups):
+    while r in output_groups and r.op in ReduceOps:
+      outs = output_groups[r]
+      if any(x.op in LoadOps or isinstance(x.dtype, ImageDType) for x in outs): break
+      loads: Dict[LazyBuffer, bool] = {}
+      cache: Set[Tuple[LazyBuffer, ShapeTracker]] = set()
+      for out in outs: _find_broadcast_loads(out, ShapeTracker.from_shape(r.shape), outs, realizes, loads, cache)
+      kernels = {out:group for group in output_groups.values() for out in group}
+      candidates = (x for b,broadcast in loads.items() if broadcast and can_chain(r, x:=reduce_for_op.get(b, b), loads, kernels))
+      if (rb:=next(candidates, None)) is None: break
+      reduce_for_op.update((x, r) for x in output_groups[rb])
+      outs.extend(output_groups.pop(rb))
+
 def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> Tuple[DefaultDict[LazyBuffer, List[LazyBuffer]], DefaultDict[LazyBuffer, int],
                                                                     Dict[LazyBuffer, _LBScheduleItem]]:
   """create a graph for realizing the outputs"""
@@ -187,7 +289,10 @@ def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> Tuple[Defaul
   allbufs: Dict[LazyBuffer, None] = {}
   simple_pads: Set[LazyBuffer] = set()
   children: DefaultDict[LazyBuffer, Dict[LazyBuffer, None]] = defaultdict(dict)
-  for out in outs: _recurse_lb(out.base, realizes, allbufs, simple_pads, children, scheduled=True)
+  expands: DefaultDict[LazyBuffer, Dict[LazyBuffer, None]] = defaultdict(dict)
+  for out in outs: _recurse_lb(out.base, realizes, allbufs, simple_pads, children, expands, scheduled=True)
+  decided: Set[LazyBuffer] = set()
+  for buf in expands: _realize_expand(buf, expands, realizes, children, decided)
   assign_targets = {x.srcs[1]:x for x in realizes if x.op is LoadOps.ASSIGN and x not in seen and x.realized is None}
 
   # check if we have to realize pads
@@ -266,10 +371,19 @@ def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> Tuple[Defaul
         buf.buffer.dtype = dtypes.float32
         buf.buffer.options = None
 
+  # a reduce output that is only broadcast into a later reduce on the same axes joins its kernel
+  if MULTIOUTPUT and MULTIREDUCE: _chain_reduces(output_groups, realizes, reduce_for_op)
+
   # preschedule all buffers in realizes
   prescheduled = {group[0]:_schedule_group(tuple(group), realizes, reduce_for_op) for group in output_groups.values()}
-  schedule_targets = {out:ps for ps in prescheduled.values() for out in ps.outputs}
+  if MULTIOUTPUT and FUSE_HORIZONTAL: prescheduled = _fuse_horizontal(prescheduled, reduce_for_op, assign_targets)
+  graph, in_degree = _schedule_graph(prescheduled, assign_targets)
+  return graph, in_degree, prescheduled
 
+def _schedule_graph(prescheduled:Dict[LazyBuffer, _LBScheduleItem], assign_targets:Dict[LazyBuffer, LazyBuffer]) -> \
+    Tuple[DefaultDict[LazyBuffer, List[LazyBuffer]], DefaultDict[LazyBuffer, int]]:
+  """create the dependency edges between the prescheduled items"""
+  schedule_targets = {out:ps for ps in prescheduled.values() for out in ps.outputs}
   graph: DefaultDict[LazyBuffer, List[LazyBuffer]] = defaultdict(list)
   in_degree: DefaultDict[LazyBuffer, int] = defaultdict(int)
   for key, lsi in prescheduled.items():
@@ -284,8 +398,66 @@ def _graph_schedule(outs:List[LazyBuffer], seen:Set[LazyBuffer]) -> Tuple[Defaul
     for assign in parents_assigns:
       graph[key].append(assign)
       in_degree[assign] += 1
+  return graph, in_degree
 
-  return graph, in_degree, prescheduled
+def _remap_bufs(op:LazyOp, idxs:Dict[int, int], cache:Dict[int, LazyOp]) -> LazyOp:
+  if id(op) in cache: return cache[id(op)]
+  arg = MemBuffer(idxs[op.arg.idx], op.arg.dtype, op.arg.st) if op.op in {BufferOps.LOAD, BufferOps.STORE} else op.arg
+  cache[id(op)] = ret = LazyOp(op.op, tuple(_remap_bufs(x, idxs, cache) for x in op.src), arg)
+  return ret
+
+def _merge_items(lsis:List[_LBScheduleItem]) -> _LBScheduleItem:
+  """merge independent schedule items into one multi output item by renumbering the buffers in their ASTs"""
+  outputs = tuple(out for lsi in lsis for out in lsi.outputs)
+  inputs = tuple(dedup(x for lsi in lsis for x in lsi.inputs))
+  new_idx = {buf:i for i,buf in enumerate(outputs+inputs)}
+  ast: List[LazyOp] = []
+  for lsi in lsis:
+    idxs = {i:new_idx[buf] for i,buf in enumerate(lsi.outputs+lsi.inputs)}
+    cache: Dict[int, LazyOp] = {}
+    ast.extend(_remap_bufs(op, idxs, cache) for op in lsi.ast)
+  return _LBScheduleItem(tuple(ast), outputs, inputs, merge_dicts([lsi.var_vals for lsi in lsis]))
+
+def _fuse_horizontal(prescheduled:Dict[LazyBuffer, _LBScheduleItem], reduce_for_op:Dict[LazyBuffer, LazyBuffer],
+                     assign_targets:Dict[LazyBuffer, LazyBuffer]) -> Dict[LazyBuffer, _LBScheduleItem]:
+  """merge independent elementwise kernels with the same shape into multi output kernels"""
+  graph, in_degree = _schedule_graph(prescheduled, assign_targets)
+  order: List[LazyBuffer] = []
+  queue = deque(key for key in prescheduled if in_degree[key] == 0)
+  while queue:
+    order.append(key:=queue.popleft())
+    for x in graph[key]:
+      in_degree[x] -= 1
+      if in_degree[x] == 0: queue.append(x)
+  # if there's a cycle we leave it to create_schedule to complain about it
+  if len(order) != len(prescheduled): return prescheduled
+  # the height of a kernel is the longest path from it to the end of the schedule. every edge goes to a lower height, so kernels with the same
+  # height can't depend on each other and merging them doesn't create a cycle. this runs optimizer updates (with no children) in the same kernels
+  height: Dict[LazyBuffer, int] = {}
+  for key in reversed(order): height[key] = max((height[x]+1 for x in graph[key]), default=0)
+  fusable: DefaultDict[Tuple, List[LazyBuffer]] = defaultdict(list)
+  for key, lsi in prescheduled.items():
+    if lsi.ast[0].op is not BufferOps.STORE or any(x in reduce_for_op or x.op in ReduceOps for x in lsi.outputs): continue
+    if any(isinstance(x.dtype, ImageDType) or x.size == 0 for x in lsi.outputs): continue
+    fusable[(height[key], key.device, key.shape)].append(key)
+  ret: Dict[LazyBuffer, _LBScheduleItem] = {}
+  merged: Set[LazyBuffer] = set()
+  for keys in fusable.values():
+    if len(keys) < 2: continue
+    # cap the number of buffers in a kernel, some backends have a limit on kernel arguments
+    groups: List[List[LazyBuffer]] = [[]]
+    bufs: Set[LazyBuffer] = set()
+    for key in keys:
+      key_bufs = set(prescheduled[key].outputs + prescheduled[key].inputs)
+      if groups[-1] and len(bufs | key_bufs) > FUSE_HORIZONTAL_MAX_BUFS.value: groups, bufs = groups+[[]], set()
+      groups[-1].append(key)
+      bufs |= key_bufs
+    for group in groups:
+      if len(group) < 2: continue
+      ret[group[0]] = _merge_items([prescheduled[key] for key in group])
+      merged.update(group)
+  if DEBUG >= 3 and merged: print(f"horizontally fused {len(merged)} kernels into {len(ret)}")
+  return {**{key:lsi for key,lsi in prescheduled.items() if key not in merged}, **ret}
 
 # *** DAG ordering: breadth first search ***
 
@@ -328,6 +500,49 @@ def create_schedule(outs:List[LazyBuffer], seen:Optional[Set[LazyBuffer]]=None)
   assert len(var_vals) == 0
   return schedule
 
+# *** schedule DAG: the dependencies between ScheduleItems, for running them concurrently ***
+
+@dataclass(frozen=True)
+class ScheduleDAG:
+  items: Tuple[ScheduleItem, ...]
+  deps: Tuple[Tuple[int, ...], ...]
+  """deps[i] are the indexes of the items that have to run before items[i]. items is in a valid run order."""
+  @functools.cached_property
+  def children(self) -> Tuple[Tuple[int, ...], ...]:
+    children: List[List[int]] = [[] for _ in self.items]
+    for i,d in enumerate(self.deps):
+      for j in d: children[j].append(i)
+    return tuple(tuple(x) for x in children)
+  @functools.cached_property
+  def depths(self) -> Tuple[int, ...]:
+    """The number of items on the longest dependency chain ending in each item."""
+    depths: List[int] = []
+    for d in self.deps: depths.append(1 + max((depths[j] for j in d), default=0))
+    return tuple(depths)
+  @property
+  def critical_path(self) -> int:
+    """The number of items on the longest dependency chain, the least number of steps to run the schedule with unlimited concurrency."""
+    return max(self.depths, default=0)
+
+def schedule_dag(schedule:List[ScheduleItem]) -> ScheduleDAG:
+  """derive the dependencies of a schedule from the buffers each item reads and writes"""
+  deps: List[Tuple[int, ...]] = []
+  writer: Dict[Buffer, int] = {}
+  readers: DefaultDict[Buffer, List[int]] = defaultdict(list)
+  for i,si in enumerate(schedule):
+    dep: Set[int] = set()
+    # views of the same base can overlap, so track the base
+    for buf in dedup(x.base for x in si.inputs):
+      if buf in writer: dep.add(writer[buf])
+      readers[buf].append(i)
+    for buf in dedup(x.base for x in si.outputs):
+      if buf in writer: dep.add(writer[buf])
+      dep.update(readers.pop(buf, []))
+      writer[buf] = i
+    dep.discard(i)
+    deps.append(tuple(sorted(dep)))
+  return ScheduleDAG(tuple(schedule), tuple(deps))
+
 # *** memory planning ***
 
 def _internal_memory_planner(buffers:List[Union[List[Buffer], Tuple[Buffer, ...]]], debug_prefix="") -> Dict[Buffer, Buffer]:
@@ -363,6 +578,11 @@ def _internal_memory_planner(buffers:List[Union[List[Buffer], Tuple[Buffer, ...]
           f"{len(ak)} -> {len(av)} bufs")
   return assigned
 
+# kernels on these devices are called through ctypes, which releases the GIL
+THREADED_DEVICES = {"CLANG", "LLVM", "NPY"}
+
 def memory_planner(schedule:List[ScheduleItem]) -> List[ScheduleItem]:
+  # reusing a buffer orders the items using it, that would serialize the threaded run_schedule
+  if RUN_THREADS > 1 and all(b.device.split(":")[0] in THREADED_DEVICES for si in schedule for b in si.bufs): return schedule
   assigned = _internal_memory_planner([si.bufs for si in schedule])
   return [ScheduleItem(si.ast, tuple(assigned.get(x, x) for x in si.bufs)) for si in schedule]
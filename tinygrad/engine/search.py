@@ -1,16 +1,17 @@
-from typing import Dict, List, cast, DefaultDict, Optional, Tuple, Callable
-import itertools, functools, random, math, time, multiprocessing, traceback, signal
+from typing import Dict, List, cast, DefaultDict, Optional, Tuple, Callable, Set, Protocol
+import itertools, functools, random, math, time, multiprocessing, traceback, signal, contextlib, os, atexit
+import numpy as np
 from collections import defaultdict
-from dataclasses import replace
+from dataclasses import replace, dataclass
 from tinygrad.device import Device, Buffer, Compiler
 from tinygrad.ops import MemBuffer
-from tinygrad.helpers import prod, flatten, DEBUG, CACHELEVEL, diskcache_get, diskcache_put, getenv, Context, colored, to_function_name
+from tinygrad.helpers import prod, flatten, DEBUG, CACHELEVEL, diskcache_get, diskcache_put, getenv, Context, colored, to_function_name, ansilen
 from tinygrad.dtype import ImageDType
 from tinygrad.codegen.linearizer import Linearizer
 from tinygrad.codegen.kernel import Opt, OptOps, KernelOptError
 from tinygrad.codegen.uops import UOpGraph
 from tinygrad.tensor import Tensor
-from tinygrad.shape.symbolic import sym_infer
+from tinygrad.shape.symbolic import sym_infer, Variable
 from tinygrad.engine.realize import CompiledRunner
 from tinygrad.renderer import Program
 
@@ -77,8 +78,35 @@ def _try_compile_linearized_w_idx(x:Tuple[int,Linearizer], compiler:Compiler) ->
     signal.alarm(0)
   return x[0], ret
 
-# workers should ignore ctrl c
-def _init_worker(): signal.signal(signal.SIGINT, signal.SIG_IGN)
+# workers should ignore ctrl c, and stay off the core that times on CPU devices
+def _init_worker(cores:Optional[Set[int]]=None):
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+  if cores: os.sched_setaffinity(0, cores)
+
+def _cpu_cores() -> Set[int]: return os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set()
+
+@contextlib.contextmanager
+def _pinned(core:Optional[int]):
+  # time on one core, with one thread, so the compile workers don't perturb it
+  if core is None: yield
+  else:
+    cores = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, {core})
+    try:
+      with Context(CPU_THREADS=1): yield
+    finally: os.sched_setaffinity(0, cores)
+
+@dataclass
+class BeamStats:
+  candidates: int = 0
+  compiled: int = 0
+  timed: int = 0
+  pruned: int = 0
+  compile_tm: float = 0.0  # summed over the compiles, they can run in parallel
+  time_tm: float = 0.0
+  def __str__(self):
+    return f"compiled {self.compiled:4d}/{self.candidates:4d} candidates in {self.compile_tm:7.2f}s " \
+           f"({self.compile_tm/max(1, self.compiled)*1e3:6.2f} ms each), timed {self.timed:4d} in {self.time_tm:7.2f}s, {self.pruned:4d} pruned"
 
 def _ensure_buffer_alloc(bufs:List[Buffer]) -> List[Buffer]: return [buf.ensure_allocated() for buf in bufs]
 
@@ -114,21 +142,100 @@ def get_linearizer_actions(lin:Linearizer, include_0=True) -> Dict[int, Lineariz
     except KernelOptError: pass
   return acted_lins
 
-beam_pool, BEAM_DEBUG = None, getenv("BEAM_DEBUG")
+@dataclass
+class BeamResult:
+  shape: str
+  search_tm: float  # including the runs this one resumed
+  start_tm: float
+  best_tm: float
+  complete: bool
+
+beam_results: List[BeamResult] = []
+def print_beam_summary():
+  print(f"BEAM_SEARCH: {len(beam_results)} kernels")
+  for r in sorted(beam_results, key=lambda r: -r.search_tm):
+    print(f"{r.search_tm:8.2f}s {r.start_tm*1e6:10.2f} -> {r.best_tm*1e6:10.2f} us {r.start_tm/r.best_tm:6.2f}x "
+          f"{r.shape}{' '*max(0, 60-ansilen(r.shape))} {'' if r.complete else 'out of time'}")
+  saved = sum(r.start_tm-r.best_tm for r in beam_results if r.start_tm < math.inf)
+  print(f"{sum(r.search_tm for r in beam_results):8.2f}s searched, {saved*1e6:.2f} us saved per run")
+
+def _apply_opts(lin:Linearizer, opts:List[Opt]) -> Linearizer:
+  ret = lin.copy()
+  for o in opts[len(lin.applied_opts):]: ret.apply_opt(o)
+  return ret
+
+# *** cost model ***
+
+def lin_features(lin:Linearizer, var_vals:Dict[Variable, int]) -> List[float]:
+  # log2 sizes of the parts of the shape and what the opts did, they don't need the kernel linearized
+  shape, out = [sym_infer(s, var_vals) for s in lin.full_shape], [sym_infer(s, var_vals) for s in lin.output_shape]
+  up, strides = range(lin.shape_len-lin.upcasted, lin.shape_len), [st.real_strides() for st in lin.sts]
+  group = lin.first_reduce+lin.group_for_reduces
+  # the elements of each buffer an upcasted tile loads and how many of them are contiguous
+  loads = [prod(shape[i] for i in up if st[i] != 0) for st in strides]
+  vector = [prod(shape[i] for i in up if st[i] == 1) for st in strides]
+  sizes = [prod(shape[:lin.global_dims]), prod(shape[lin.global_dims:lin.first_reduce]), prod(shape[lin.first_reduce:group]),
+           prod(shape[group:lin.shape_len-lin.upcasted]), prod(shape[i] for i in up), prod(shape[i] for i in up if shape[i] != out[i]),
+           sum(loads), sum(vector), max(loads), max(vector)]
+  return [math.log2(max(1, x)) for x in sizes] + [float(lin.tensor_core is not None), float(any(o.op is OptOps.PADTO for o in lin.applied_opts))]
+
+class CostModel(Protocol):
+  # predicts log2 of the time of a candidate relative to the unoptimized kernel from its lin_features
+  def fit(self, samples:List[Tuple[List[float], float]]): ...
+  def predict(self, features:List[List[float]]) -> List[float]: ...
+
+class RidgeCostModel:
+  # quadratic in the features, the sizes interact (an upcast is only fast if it's contiguous and fits in registers)
+  def __init__(self, l2:float=0.1): self.l2, self.w = l2, np.zeros(0)
+  def _expand(self, x:List[List[float]]) -> np.ndarray:
+    X = np.array(x, dtype=np.float64).reshape(len(x), -1)
+    i, j = np.triu_indices(X.shape[1])
+    return np.hstack([np.ones((len(X), 1)), X, X[:, i] * X[:, j]])
+  def fit(self, samples:List[Tuple[List[float], float]]):
+    X = self._expand([x for x,_ in samples])
+    self.w = np.linalg.solve(X.T @ X + self.l2 * np.eye(X.shape[1]), X.T @ np.array([y for _,y in samples], dtype=np.float64))
+  def predict(self, features:List[List[float]]) -> List[float]: return (self._expand(features) @ self.w).tolist()
+
+# set to a fitted CostModel to use it, by default a RidgeCostModel is fit once per search to the candidates timed by earlier searches on the device
+cost_model: Optional[CostModel] = None
+def get_cost_model(device:str, suffix:str) -> Optional[CostModel]:
+  if cost_model is not None: return cost_model
+  if len(samples:=diskcache_get("beam_cost_samples", {"device": device, "suffix": suffix}) or []) < getenv("BEAM_COST_MIN_SAMPLES", 512): return None
+  (model:=RidgeCostModel()).fit(samples)
+  return model
+
+def _record_cost_samples(device:str, suffix:str, new_samples:List[Tuple[List[float], float]]):
+  if CACHELEVEL < 1 or not new_samples: return
+  key = {"device": device, "suffix": suffix}
+  diskcache_put("beam_cost_samples", key, ((diskcache_get("beam_cost_samples", key) or []) + new_samples)[-getenv("BEAM_COST_SAMPLES", 8192):])
+
+beam_pool, beam_stats, BEAM_DEBUG = None, BeamStats(), getenv("BEAM_DEBUG")
 def beam_search(lin:Linearizer, rawbufs:List[Buffer], amt:int, allow_test_size=True) -> Linearizer:
-  global beam_pool
+  global beam_pool, beam_stats
   key = {"ast": lin.ast[0].key, "amt": amt, "allow_test_size": allow_test_size, "device": lin.opts.device, "suffix": lin.opts.suffix}
-  if (val:=diskcache_get("beam_search", key)) is not None and not getenv("IGNORE_BEAM_CACHE") and CACHELEVEL >= 1:
-    ret = lin.copy()
-    for o in val[len(lin.applied_opts):]: ret.apply_opt(o)
-    return ret
+  if (val:=diskcache_get("beam_search", key)) is not None and not getenv("IGNORE_BEAM_CACHE") and CACHELEVEL >= 1: return _apply_opts(lin, val)
 
+  # anytime search: out of BEAM_KERNEL_BUDGET seconds for this kernel or BEAM_TOTAL_BUDGET for all of them, the best so far is returned
+  # every round is checkpointed, a search that ran out of time or was interrupted resumes from its last round
+  kernel_budget, total_budget = getenv("BEAM_KERNEL_BUDGET", 0.0), getenv("BEAM_TOTAL_BUDGET", 0.0)
+  if total_budget and sum(r.search_tm for r in beam_results) >= total_budget: return lin
   beam: List[Tuple[Linearizer, float]] = [(lin, float("inf"))]
+  start_tm, prev_tm = None, 0.0
+  if (ckpt:=diskcache_get("beam_search_checkpoint", key)) is not None and not getenv("IGNORE_BEAM_CACHE") and CACHELEVEL >= 1:
+    beam, start_tm, prev_tm = [(_apply_opts(lin, opts), tm) for opts,tm in ckpt["beam"]], ckpt["start_tm"], ckpt["search_tm"]
+    if DEBUG >= 2: print(f"BEAM_SEARCH: resuming after {prev_tm:.2f}s at {beam[0][1]*1e6:.2f} us")
   seen_libs = set()
+  if not beam_results and (BEAM_DEBUG or DEBUG >= 2 or getenv("BEAM_SUMMARY")): atexit.register(print_beam_summary)
 
-  default_parallel = multiprocessing.cpu_count() if lin.opts.device in {"CUDA", "HSA", "AMD", "NV"} else 0
+  # on CPU devices, one core (BEAM_TIMING_CORE, the last one by default) is kept for timing and the others compile
+  cores, timing_core = _cpu_cores(), None
+  if lin.opts.cpu is not None and len(cores) > 1: timing_core = getenv("BEAM_TIMING_CORE", max(cores))
+  if lin.opts.device in {"CUDA", "HSA", "AMD", "NV"}: default_parallel = multiprocessing.cpu_count()
+  else: default_parallel = len(cores)-1 if timing_core is not None else 0
   if beam_pool is None and (workers := getenv("PARALLEL", default_parallel)):
-    beam_pool = multiprocessing.get_context("spawn").Pool(workers, _init_worker, (), getenv("BEAM_MAX_TASKS_PER_CHILD", 16))
+    beam_pool = multiprocessing.get_context("spawn").Pool(workers, _init_worker, (cores - {timing_core} if timing_core is not None else None,),
+                                                          getenv("BEAM_MAX_TASKS_PER_CHILD", 16))
+  beam_stats = BeamStats()
 
   min_progress = getenv("BEAM_MIN_PROGRESS", 0.01)/1e6
   if BEAM_DEBUG: print(f"BEAM_SEARCH:\n{lin.ast}")
@@ -137,36 +244,75 @@ def beam_search(lin:Linearizer, rawbufs:List[Buffer], amt:int, allow_test_size=T
   try:
     rawbufs = _ensure_buffer_alloc(rawbufs)
     var_vals = {k:(k.max+k.min)//2 for k in lin.ast[0].vars()}
-    exiting, st = False, time.perf_counter()
+    exiting, out_of_time, st = False, False, time.perf_counter()
+    spent = sum(r.search_tm for r in beam_results)
+    def over_budget(): return (0 < kernel_budget < time.perf_counter()-st+prev_tm) or (0 < total_budget < time.perf_counter()-st+spent)
     dev = Device[lin.opts.device]
+    _compile_fn = functools.partial(_try_compile_linearized_w_idx, compiler=dev.compiler)
+    if start_tm is None:
+      # the time without a search, for the summary
+      start_tm = math.inf
+      if (proc:=_compile_fn((0, lin.copy()))[1]) is not None:
+        with _pinned(timing_core): start_tm = min(_time_program(proc[0], proc[1], var_vals, rawbufs))
+    top, cost_samples = getenv("BEAM_COST_TOP", 0.1), cast(List[Tuple[List[float], float]], [])
+    model = get_cost_model(lin.opts.device, lin.opts.suffix)
     while not exiting:
       acted_lins: List[Linearizer] = flatten([get_linearizer_actions(lin, include_0=False).values() for lin,_ in beam])
       timed_lins: List[Tuple[Linearizer, float]] = []
-      _compile_fn = functools.partial(_try_compile_linearized_w_idx, compiler=dev.compiler)
-      for i,proc in (map(_compile_fn, enumerate(acted_lins)) if beam_pool is None else beam_pool.imap_unordered(_compile_fn, enumerate(acted_lins))):
-        if proc is None: continue
-        p, lib, compile_et = proc
-        if lib in seen_libs: continue
-        #print(acted_lins[i].colored_shape(), acted_lins[i].applied_opts)  # for debugging BEAMs that segfault
-        seen_libs.add(lib)
-        try: tms = _time_program(p, lib, var_vals, rawbufs, early_stop=beam[0][1]*3 if len(beam) else 1.0)
-        except RuntimeError: continue # for runtime issues
-        timed_lins.append((acted_lins[i], min(tms)))
-        if BEAM_DEBUG > 1: print(f"{time.perf_counter() - st:7.2f}s: {i:5d} {len(cast(UOpGraph, p.uops).uops):5d} uops {compile_et*1e6:12.2f} us compile/{timed_lins[-1][1]*1e6:12.2f} us run       {len(timed_lins):4d}/{len(acted_lins):4d}         {timed_lins[-1][0].colored_shape()}")  # noqa: E501
-        elif DEBUG >= 2: print(f"\r{time.perf_counter() - st:7.2f}s: {timed_lins[-1][1]*1e6:12.2f} us       {len(timed_lins):4d}/{len(acted_lins):4d}         {timed_lins[-1][0].colored_shape()}\033[K", end="")  # noqa: E501
+      beam_stats.candidates += len(acted_lins)
+      # with a cost model, the candidates are compiled and timed in chunks of the BEAM_COST_TOP fraction predicted fastest
+      # the next chunk only if the last one beat the chunk before it, or the beam for the first chunk
+      feats, chunks, prev_best = [lin_features(l, var_vals) for l in acted_lins], [list(range(len(acted_lins)))], min(beam[0][1], start_tm)
+      if model is not None and len(acted_lins) > (keep:=max(amt, math.ceil(len(acted_lins)*top))):
+        scores = model.predict(feats)
+        order = sorted(range(len(acted_lins)), key=lambda j: scores[j])
+        chunks = [order[j:j+keep] for j in range(0, len(order), keep)]
+      for ci,chunk in enumerate(chunks):
+        todo, chunk_best = [(j, acted_lins[j]) for j in chunk], math.inf
+        for i,proc in (map(_compile_fn, todo) if beam_pool is None else beam_pool.imap_unordered(_compile_fn, todo)):
+          if proc is None: continue
+          p, lib, compile_et = proc
+          beam_stats.compiled, beam_stats.compile_tm = beam_stats.compiled + 1, beam_stats.compile_tm + compile_et
+          if lib in seen_libs: continue
+          #print(acted_lins[i].colored_shape(), acted_lins[i].applied_opts)  # for debugging BEAMs that segfault
+          seen_libs.add(lib)
+          tst = time.perf_counter()
+          try:
+            with _pinned(timing_core): tms = _time_program(p, lib, var_vals, rawbufs, early_stop=beam[0][1]*3 if len(beam) else 1.0)
+          except RuntimeError: continue # for runtime issues
+          finally: beam_stats.time_tm += time.perf_counter() - tst
+          beam_stats.timed += 1
+          timed_lins.append((acted_lins[i], min(tms)))
+          chunk_best = min(chunk_best, min(tms))
+          if start_tm < math.inf and 0 < min(tms) < math.inf: cost_samples.append((feats[i], math.log2(min(tms)/start_tm)))
+          if BEAM_DEBUG > 1: print(f"{time.perf_counter() - st:7.2f}s: {i:5d} {len(cast(UOpGraph, p.uops).uops):5d} uops {compile_et*1e6:12.2f} us compile/{timed_lins[-1][1]*1e6:12.2f} us run       {len(timed_lins):4d}/{len(acted_lins):4d}         {timed_lins[-1][0].colored_shape()}")  # noqa: E501
+          elif DEBUG >= 2: print(f"\r{time.perf_counter() - st:7.2f}s: {timed_lins[-1][1]*1e6:12.2f} us       {len(timed_lins):4d}/{len(acted_lins):4d}         {timed_lins[-1][0].colored_shape()}\033[K", end="")  # noqa: E501
+          if (out_of_time:=over_budget()): break
+        if out_of_time or chunk_best >= prev_best:
+          beam_stats.pruned += sum(len(c) for c in chunks[ci+1:])
+          break
+        prev_best = chunk_best
 
       # done
       opts = sorted(timed_lins, key=lambda x: x[1])
-      exiting = len(opts) == 0 or (opts[0][1] < min_progress) or (len(beam) > 0 and ((beam[0][1]-opts[0][1]) < min_progress))
-      if not exiting: beam = opts[:amt]
+      exiting = out_of_time or len(opts) == 0 or (opts[0][1] < min_progress) or (len(beam) > 0 and ((beam[0][1]-opts[0][1]) < min_progress))
+      if out_of_time: beam = sorted([x for x in beam if x[1] < math.inf] + opts + [(lin, start_tm)], key=lambda x: x[1])[:amt]
+      elif not exiting: beam = opts[:amt]
       elif len(opts) > 0 and opts[0][1] < beam[0][1]: beam = opts[:1]
+      if CACHELEVEL >= 1 and (not exiting or out_of_time):
+        diskcache_put("beam_search_checkpoint", key, {"beam": [(l.applied_opts, tm) for l,tm in beam], "start_tm": start_tm,
+                                                      "search_tm": prev_tm + time.perf_counter() - st})
       if DEBUG >= 2: print(f"\r{time.perf_counter() - st:7.2f}s:", colored(f"{beam[0][1]*1e6:12.2f} us", "green" if exiting else None), f"from {len(acted_lins):3d} -> {len(opts):3d} actions\033[K", beam[0][0].colored_shape())  # noqa: E501
   except KeyboardInterrupt as e:
     if beam_pool is not None: beam_pool.terminate()
     raise e
 
-  if CACHELEVEL >= 1: diskcache_put("beam_search", key, beam[0][0].applied_opts)
+  _record_cost_samples(lin.opts.device, lin.opts.suffix, cost_samples)
+  # a search that ran out of time isn't final, the next one resumes it from the checkpoint
+  if CACHELEVEL >= 1 and not out_of_time: diskcache_put("beam_search", key, beam[0][0].applied_opts)
+  beam_results.append(BeamResult(lin.colored_shape(), prev_tm + time.perf_counter() - st, start_tm, beam[0][1], not out_of_time))
   if BEAM_DEBUG: print(f"BEAM_SEARCH: final tm={beam[0][1]*1e6:0.2f} us, applied_opts={beam[0][0].applied_opts}")
+  if BEAM_DEBUG or DEBUG >= 2: print(f"BEAM_SEARCH: {beam_stats}")
   return beam[0][0]
 
 def optimize_local_size(clprg:Callable, global_size:List[int], rawbufs:List[Buffer]) -> List[int]:
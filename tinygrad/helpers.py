@@ -1,6 +1,6 @@
 from __future__ import annotations
 import os, functools, platform, time, re, contextlib, operator, hashlib, pickle, sqlite3, cProfile, pstats, tempfile, pathlib, string, ctypes
-import itertools, urllib.request, subprocess
+import itertools, urllib.request, subprocess, threading
 from tqdm import tqdm
 from typing import Dict, Tuple, Union, List, ClassVar, Optional, Iterable, Any, TypeVar, TYPE_CHECKING, Callable, Sequence
 if TYPE_CHECKING:  # TODO: remove this and import TypeGuard from typing once minimum python supported version is 3.10
@@ -63,9 +63,25 @@ def get_contraction(old_shape:Tuple[sint, ...], new_shape:Tuple[sint, ...]) -> O
   except ValueError: return None
   return [list(range(st,ed)) for st,ed in zip([0]+split[:-1], split[:-1]+[len(old_shape)])]
 
-@functools.lru_cache(maxsize=None)
+# *** bounded caches ***
+# lru_caches that are registered by name, to report their sizes and hit rates and to all be emptied between workloads
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 1<<14))
+caches: Dict[str, functools._lru_cache_wrapper] = {}
+def cache(maxsize:Optional[int]=CACHE_MAXSIZE):
+  def decorator(fxn):
+    caches[f"{fxn.__module__}.{fxn.__qualname__}"] = ret = functools.lru_cache(maxsize=maxsize)(fxn)
+    return ret
+  return decorator
+def cache_stats() -> Dict[str, functools._CacheInfo]: return {name:c.cache_info() for name,c in caches.items()}
+def print_cache_stats():
+  for name,(hits,misses,maxsize,size) in sorted(cache_stats().items(), key=lambda x: -x[1].currsize):
+    print(f"{name:50s} {size:8d}/{str(maxsize):>8s} entries, {hits:10d} hits, {misses:10d} misses, {hits/max(1, hits+misses)*100:6.2f}% hit rate")
+def clear_caches():
+  for c in caches.values(): c.cache_clear()
+
+@cache()
 def to_function_name(s:str): return ''.join([c if c in (string.ascii_letters+string.digits+'_') else f'{ord(c):02X}' for c in ansistrip(s)])
-@functools.lru_cache(maxsize=None)
+@cache()
 def getenv(key:str, default=0): return type(default)(os.getenv(key, default))
 def temp(x:str) -> str: return (pathlib.Path(tempfile.gettempdir()) / x).as_posix()
 
@@ -98,7 +114,11 @@ class ContextVar:
 DEBUG, IMAGE, BEAM, NOOPT, JIT = ContextVar("DEBUG", 0), ContextVar("IMAGE", 0), ContextVar("BEAM", 0), ContextVar("NOOPT", 0), ContextVar("JIT", 1)
 WINO, THREEFRY, CACHECOLLECTING = ContextVar("WINO", 0), ContextVar("THREEFRY", 0), ContextVar("CACHECOLLECTING", 1)
 GRAPH, GRAPHPATH, SAVE_SCHEDULE, RING = ContextVar("GRAPH", 0), getenv("GRAPHPATH", "/tmp/net"), ContextVar("SAVE_SCHEDULE", 0), ContextVar("RING", 1)
-MULTIOUTPUT = ContextVar("MULTIOUTPUT", 1)
+MULTIOUTPUT, MULTIREDUCE = ContextVar("MULTIOUTPUT", 1), ContextVar("MULTIREDUCE", 1)
+FUSE_HORIZONTAL, FUSE_HORIZONTAL_MAX_BUFS = ContextVar("FUSE_HORIZONTAL", 1), ContextVar("FUSE_HORIZONTAL_MAX_BUFS", 31)
+FLOP_COST, LAUNCH_COST = ContextVar("FLOP_COST", 1.0), ContextVar("LAUNCH_COST", 2**16)
+RUN_THREADS, COMPILE_AHEAD = ContextVar("RUN_THREADS", 0), ContextVar("COMPILE_AHEAD", 0)
+CPU_THREADS, CPU_THREAD_WORK = ContextVar("CPU_THREADS", 1), ContextVar("CPU_THREAD_WORK", 2**17)
 
 # **************** global state Counters ****************
 
@@ -146,12 +166,13 @@ CACHEDB: str = getenv("CACHEDB", os.path.abspath(os.path.join(_cache_dir, "tinyg
 CACHELEVEL = getenv("CACHELEVEL", 2)
 
 VERSION = 16
-_db_connection = None
+# the connection is shared by the threads that compile in the background, _db_lock serializes them
+_db_connection, _db_lock = None, threading.RLock()
 def db_connection():
   global _db_connection
   if _db_connection is None:
     os.makedirs(CACHEDB.rsplit(os.sep, 1)[0], exist_ok=True)
-    _db_connection = sqlite3.connect(CACHEDB)
+    _db_connection = sqlite3.connect(CACHEDB, check_same_thread=False)
     if DEBUG >= 7: _db_connection.set_trace_callback(print)
   return _db_connection
 
@@ -163,29 +184,31 @@ def diskcache_clear():
 def diskcache_get(table:str, key:Union[Dict, str, int]) -> Any:
   if CACHELEVEL == 0: return None
   if isinstance(key, (str,int)): key = {"key": key}
-  conn = db_connection()
-  cur = conn.cursor()
-  try:
-    res = cur.execute(f"SELECT val FROM '{table}_{VERSION}' WHERE {' AND '.join([f'{x}=?' for x in key.keys()])}", tuple(key.values()))
-  except sqlite3.OperationalError:
-    return None  # table doesn't exist
-  if (val:=res.fetchone()) is not None: return pickle.loads(val[0])
+  with _db_lock:
+    conn = db_connection()
+    cur = conn.cursor()
+    try:
+      res = cur.execute(f"SELECT val FROM '{table}_{VERSION}' WHERE {' AND '.join([f'{x}=?' for x in key.keys()])}", tuple(key.values()))
+    except sqlite3.OperationalError:
+      return None  # table doesn't exist
+    if (val:=res.fetchone()) is not None: return pickle.loads(val[0])
   return None
 
 _db_tables = set()
 def diskcache_put(table:str, key:Union[Dict, str, int], val:Any):
   if CACHELEVEL == 0: return val
   if isinstance(key, (str,int)): key = {"key": key}
-  conn = db_connection()
-  cur = conn.cursor()
-  if table not in _db_tables:
-    TYPES = {str: "text", bool: "integer", int: "integer", float: "numeric", bytes: "blob"}
-    ltypes = ', '.join(f"{k} {TYPES[type(key[k])]}" for k in key.keys())
-    cur.execute(f"CREATE TABLE IF NOT EXISTS '{table}_{VERSION}' ({ltypes}, val blob, PRIMARY KEY ({', '.join(key.keys())}))")
-    _db_tables.add(table)
-  cur.execute(f"REPLACE INTO '{table}_{VERSION}' ({', '.join(key.keys())}, val) VALUES ({', '.join(['?']*len(key.keys()))}, ?)", tuple(key.values()) + (pickle.dumps(val), ))  # noqa: E501
-  conn.commit()
-  cur.close()
+  with _db_lock:
+    conn = db_connection()
+    cur = conn.cursor()
+    if table not in _db_tables:
+      TYPES = {str: "text", bool: "integer", int: "integer", float: "numeric", bytes: "blob"}
+      ltypes = ', '.join(f"{k} {TYPES[type(key[k])]}" for k in key.keys())
+      cur.execute(f"CREATE TABLE IF NOT EXISTS '{table}_{VERSION}' ({ltypes}, val blob, PRIMARY KEY ({', '.join(key.keys())}))")
+      _db_tables.add(table)
+    cur.execute(f"REPLACE INTO '{table}_{VERSION}' ({', '.join(key.keys())}, val) VALUES ({', '.join(['?']*len(key.keys()))}, ?)", tuple(key.values()) + (pickle.dumps(val), ))  # noqa: E501
+    conn.commit()
+    cur.close()
   return val
 
 def diskcache(func):
@@ -1,9 +1,9 @@
 from __future__ import annotations
 from typing import Union, Tuple, Any, List, Dict, Callable
-import functools, hashlib, math, operator, ctypes
+import functools, hashlib, math, operator, ctypes, weakref
 from enum import Enum, auto
 from dataclasses import dataclass
-from tinygrad.helpers import prod, dedup
+from tinygrad.helpers import prod, dedup, cache
 from tinygrad.dtype import dtypes, DType, ConstType
 from tinygrad.shape.symbolic import Variable, sint
 from tinygrad.shape.shapetracker import ShapeTracker
@@ -45,18 +45,24 @@ class ConstBuffer:
   dtype: DType
   st: ShapeTracker
 
+# LazyOps are interned, an identical (op, src, arg) is the same LazyOp. so equality is identity and a cached hash is cheap
+class LazyOpMetaClass(type):
+  lcache: weakref.WeakValueDictionary[Tuple, LazyOp] = weakref.WeakValueDictionary()
+  def __call__(cls, op:Op, src:Tuple[LazyOp, ...]=(), arg:Any=None):
+    # 0.0 == -0.0, the str of the const keeps them apart
+    key = (op, src:=tuple(src), arg, str(arg.val) if op is BufferOps.CONST else None)
+    try:
+      if (ret:=LazyOpMetaClass.lcache.get(key)) is not None: return ret
+    except TypeError: return super().__call__(op, src, arg)  # unhashable args aren't interned
+    LazyOpMetaClass.lcache[key] = ret = super().__call__(op, src, arg)
+    return ret
+
 @dataclass(frozen=True, eq=False)
-class LazyOp:
+class LazyOp(metaclass=LazyOpMetaClass):
   op: Op
   src: Tuple[LazyOp, ...] = ()
   arg: Any = None
-  def cached_compare(self, x, context):
-    if id(self) == id(x): return True
-    if self.op != x.op or self.arg != x.arg or len(self.src) != len(x.src): return False
-    if (key := (id(self), id(x))) in context: return context[key]
-    ret = context[key] = all(a.cached_compare(b, context) for a,b in zip(self.src, x.src))
-    return ret
-  def __eq__(self, x): return self.cached_compare(x, context={})
+  def __reduce__(self): return LazyOp, (self.op, self.src, self.arg)
   def __repr__(self): return f"LazyOp(op={self.op}, src={self.src}, arg={self.arg})"
   @functools.cached_property
   def dtype(self) -> DType:
@@ -101,7 +107,7 @@ InterpretedFlopCounter: Dict[Op, Callable] = {
   **{op:lambda self,axis: FlopCounter(tuple(1 if i in axis else s for i,s in enumerate(self.shape)), self.consume_flops() + prod(self.shape), self.mem) for op in ReduceOps},  # noqa: E501
   TernaryOps.WHERE: lambda self,y,z: FlopCounter(self.shape, self.consume_flops() + y.consume_flops() + z.consume_flops() + prod(self.shape), {**self.mem, **y.mem, **z.mem})}  # noqa: E501
 
-@functools.lru_cache(None)
+@cache()
 def get_lazyop_info(ast:LazyOp) -> FlopCounter:
   @functools.lru_cache(None) # NOTE: this cache needs to be recreated for new ASTs
   def run_ast(ast): return InterpretedFlopCounter[ast.op](*([run_ast(x) for x in ast.src]+([ast.arg] if ast.arg is not None else [])))
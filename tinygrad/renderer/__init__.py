@@ -1,7 +1,8 @@
+from __future__ import annotations
 from typing import Optional, List, Tuple, Dict
-import functools
+import functools, platform, pathlib
 from dataclasses import dataclass
-from tinygrad.helpers import to_function_name
+from tinygrad.helpers import to_function_name, getenv
 from tinygrad.codegen.uops import UOpGraph
 from tinygrad.shape.symbolic import sym_infer, sint, Variable
 from tinygrad.dtype import DType
@@ -27,6 +28,7 @@ class Program:
   uops:Optional[UOpGraph]=None
   op_estimate:sint=0
   mem_estimate:sint=0
+  thread_vars:Optional[Tuple[Variable, Variable]]=None # the slice of the outermost global loop a CPU thread runs
 
   @functools.cached_property
   def vars(self) -> List[Variable]: return [] if self.uops is None else self.uops.vars()
@@ -45,13 +47,37 @@ class Program:
     local_size = [sym_infer(sz, var_vals) for sz in self.local_size] if self.local_size is not None else None
     return global_size, local_size
 
+@dataclass(frozen=True)
+class CPUInfo:
+  vector_width: int # floats in a vector register
+  registers: int    # vector registers
+  l1_size: int      # bytes of L1 data cache
+  l2_size: int      # bytes of L2 cache
+
+  @staticmethod
+  @functools.lru_cache(None)
+  def host() -> CPUInfo:
+    # AVX-512 has 32 registers of 16 floats, AVX/AVX2 16 of 8, SSE 16 of 4, NEON 32 of 4
+    try: flags = next((l.split(":")[1].split() for l in open("/proc/cpuinfo") if l.startswith("flags")), [])
+    except OSError: flags = []
+    width = getenv("CPU_VECTOR_WIDTH", 16 if "avx512f" in flags else 8 if "avx" in flags else 4)
+    registers = 32 if "avx512f" in flags or platform.machine() in {"arm64", "aarch64"} else 16
+    caches: Dict[Tuple[str, str], int] = {}
+    for d in pathlib.Path("/sys/devices/system/cpu/cpu0/cache").glob("index*"):
+      try: caches[((d/"level").read_text().strip(), (d/"type").read_text().strip())] = int((d/"size").read_text().strip().rstrip("K"))*1024
+      except (OSError, ValueError): pass
+    return CPUInfo(width, registers, caches.get(("1", "Data"), 32768), caches.get(("2", "Unified"), 1048576))
+
 class Renderer:
   device: str = ""
   suffix: str = ""
   # TODO: make this generic with a list of supported types
   supports_float4: bool = True
+  vector_widths: Tuple[int, ...] = (4, 2) # the sizes of the float4 loads and stores
   has_local: bool = True
   has_shared: bool = True
+  has_threads: bool = False
+  cpu: Optional[CPUInfo] = None # the CPU the code runs on
   # NOTE: these two should be in z,y,x(reversed) order for cstyle backends, they are flipped when kernel is rendered
   global_max: Optional[List[int]] = None
   local_max: Optional[List[int]] = None
@@ -3,10 +3,10 @@ import os, math
 from collections import defaultdict, Counter
 from tinygrad.codegen.linearizer import UOps, UOp
 from tinygrad.ops import UnaryOps, BinaryOps, TernaryOps
-from tinygrad.helpers import strip_parens, getenv, prod
+from tinygrad.helpers import strip_parens, getenv, prod, dedup
 from tinygrad.dtype import ImageDType, dtypes, DType, PtrDType, ConstType
 from tinygrad.codegen.uops import UOpGraph
-from tinygrad.renderer import Renderer, TensorCore
+from tinygrad.renderer import Renderer, TensorCore, CPUInfo
 
 class CStyleLanguage(Renderer):
   kernel_prefix: str = ""
@@ -176,14 +176,31 @@ class CStyleLanguage(Renderer):
 
 class ClangRenderer(CStyleLanguage):
   device = "CLANG"
-  supports_float4 = False
   has_local = False
+  has_threads = True
+  # clang compiles with -march=native, the vectors are as wide as the host's
+  def __init__(self):
+    self.cpu = CPUInfo.host()
+    self.vector_widths = tuple(w for w in (16, 8, 4, 2) if w <= self.cpu.vector_width)
 
   # language options
   buffer_suffix = " restrict"
   type_map = {dtypes.bool:"_Bool", dtypes.half:"__fp16"}
   code_for_op = {**CStyleLanguage().code_for_op, BinaryOps.MAX: lambda a,b,dtype: f"(({a}>{b})?{a}:{b})"}
 
+  def render_dtype(self, var_dtype:DType) -> str:
+    return f"{self.render_dtype(var_dtype.scalar())}{var_dtype.count}" if var_dtype.count > 1 else super().render_dtype(var_dtype)
+
+  def render_cast(self, x:List[str], var_dtype:DType, bitcast=False) -> str:
+    return f"({self.render_dtype(var_dtype)}){{{','.join(x)}}}" if len(x) > 1 else super().render_cast(x, var_dtype, bitcast)
+
+  def render_kernel(self, function_name, kernel, bufs, uops, prefix=None) -> str:
+    # vectors are aligned like their scalars, the loads and stores don't have to be aligned to the vector size
+    prefix = [f"typedef {self.render_dtype(dt.scalar())} {self.render_dtype(dt)} "
+              f"__attribute__((ext_vector_type({dt.count}),aligned({dt.scalar().itemsize})));"
+              for dt in dedup(u.dtype for u in uops if u.dtype is not None and u.dtype.count > 1)]
+    return super().render_kernel(function_name, kernel, bufs, uops, prefix or None)
+
 class OpenCLRenderer(CStyleLanguage):
   device = "GPU"
 
@@ -4,9 +4,10 @@ from tinygrad.codegen.linearizer import UOps, UOp
 from tinygrad.dtype import DType, PtrDType, dtypes
 from tinygrad.ops import Op, UnaryOps, BinaryOps, TernaryOps
 from tinygrad.codegen.uops import UOpGraph
-from tinygrad.renderer import Renderer
+from tinygrad.renderer import Renderer, CPUInfo
 
-MFLAGS = ('nsz', 'arcp', 'contract', 'afn', 'reassoc') # All from fast math, but nnan and ninf
+MFLAGS = ('nsz', 'arcp', 'afn') # From fast math, but nnan, ninf and the ones that change how a reduce rounds
+RFLAGS = ('contract', 'reassoc') # FMA contraction and reassociation of reduces, opt-in with fastmath
 
 def is_bool_or_unsigned(dtype: DType): return dtype == dtypes.bool or dtypes.is_unsigned(dtype)
 
@@ -64,13 +65,28 @@ def cast(bb, val, input_type, output_type, bitcast=False):
 
   raise NotImplementedError(f"cast from {input_type} -> {output_type} not implemented")
 
-def const(args, dtype): return ir.Constant(dtype_to_llvm_dtype[dtype], args)
+def llvm_dtype(dtype:DType): return ir.VectorType(dtype_to_llvm_dtype[dtype.scalar()], dtype.count) if dtype.count > 1 else dtype_to_llvm_dtype[dtype]
+def const(args, dtype): return ir.Constant(llvm_dtype(dtype), [args]*dtype.count if dtype.count > 1 else args)
+def vector_ptr(bb, buf, idx, dtype:DType): # vectors are only aligned to their scalars
+  ptr = bb[-1].gep(buf, [idx], inbounds=True)
+  return (bb[-1].bitcast(ptr, llvm_dtype(dtype).as_pointer()) if dtype.count > 1 else ptr), dtype.scalar().itemsize
+
+def fastmath_reduce(val):
+  # the chain of accumulates can be reassociated to vectorize the reduce loop, and contracted with the multiplies it consumes to FMAs
+  if not isinstance(val, ir.Instruction) or val.opname not in {"fadd", "fmul"} or "reassoc" in val.flags: return
+  val.flags += [f for f in RFLAGS if f not in val.flags]
+  for x in val.operands:
+    if isinstance(x, ir.Instruction) and x.opname == "fadd": fastmath_reduce(x)
+    elif isinstance(x, ir.Instruction) and x.opname == "fmul" and "contract" not in x.flags: x.flags.append("contract")
 
 class LLVMRenderer(Renderer):
   device = "LLVM"
-  supports_float4=False
   has_local=False
   has_shared=False
+  has_threads=True
+  def __init__(self, fastmath:bool=False):
+    self.fastmath, self.cpu = fastmath, CPUInfo.host()
+    self.vector_widths = tuple(w for w in (16, 8, 4, 2) if w <= self.cpu.vector_width)
 
   def render(self, name:str, uops:UOpGraph) -> str:
     # all llvm stuff goes into a module
@@ -102,12 +118,14 @@ class LLVMRenderer(Renderer):
     for u in uops:
       uop,dtype,vin,args = u.uop,u.dtype,u.vin,u.arg
       if uop is UOps.STORE:
-        element = cast(bb, lvars[vin[2]], vin[2].dtype, vin[0].dtype)
+        element = lvars[vin[2]] if vin[2].dtype.count > 1 else cast(bb, lvars[vin[2]], vin[2].dtype, vin[0].dtype)
         if len(vin) > 3:
-          with bb[-1].if_then(lvars[vin[3]]):
-            bb[-1].store(element, bb[-1].gep(lvars[vin[0]], [lvars[vin[1]]], inbounds=True))
+          with bb[-1].if_then(cast(bb, lvars[vin[3]], vin[3].dtype, dtypes.bool)):
+            ptr, align = vector_ptr(bb, lvars[vin[0]], lvars[vin[1]], vin[2].dtype)
+            bb[-1].store(element, ptr, align=align)
         else:
-          bb[-1].store(element, bb[-1].gep(lvars[vin[0]], [lvars[vin[1]]], inbounds=True))
+          ptr, align = vector_ptr(bb, lvars[vin[0]], lvars[vin[1]], vin[2].dtype)
+          bb[-1].store(element, ptr, align=align)
       elif uop is UOps.ENDRANGE:
         loop_entry_bb, phis = loop_blocks.pop()
         idx_p1 = bb[-1].add(lvars[vin[0]], ir.Constant(ir.IntType(32), 1))
@@ -124,7 +142,7 @@ class LLVMRenderer(Renderer):
           phis = []
           for rp in reduce_phis:
             incoming = lvars[rp]
-            lvars[rp] = bb[-1].phi(dtype_to_llvm_dtype[rp.dtype])
+            lvars[rp] = bb[-1].phi(llvm_dtype(rp.dtype))
             lvars[rp].add_incoming(incoming, bb[-2].block)
             phis.append((rp, lvars[rp]))
 
@@ -137,20 +155,32 @@ class LLVMRenderer(Renderer):
         elif uop is UOps.LOAD:
           if len(vin) > 2:
             aug_idx = bb[-1].select(lvars[vin[2]], lvars[vin[1]], ir.Constant(ir.IntType(32), 0))
-            val = bb[-1].load(bb[-1].gep(lvars[vin[0]], [aug_idx], inbounds=True))
+            ptr, align = vector_ptr(bb, lvars[vin[0]], aug_idx, dtype)
+            val = bb[-1].load(ptr, align=align)
             val = bb[-1].select(lvars[vin[2]], val, lvars[vin[3]])
           else:
-            val = bb[-1].load(bb[-1].gep(lvars[vin[0]], [lvars[vin[1]]], inbounds=True))
+            ptr, align = vector_ptr(bb, lvars[vin[0]], lvars[vin[1]], dtype)
+            val = bb[-1].load(ptr, align=align)
           lvars[u] = val
         elif uop is UOps.PHI:
           lvars[u] = lvars[vin[1]]
+          if self.fastmath: fastmath_reduce(lvars[u])
           # PHI UOps can link to other PHI Uops, backtrace this to DEFINE_ACC
           backward = vin[0]
           while backward.uop is UOps.PHI: backward = backward.vin[0]
-          lvars[backward] = lvars[u]
+          # a PHI of one element of a vector acc updates that element
+          if backward.uop is UOps.GEP:
+            acc = backward.vin[0]
+            lvars[acc] = bb[-1].insert_element(lvars[acc], lvars[u], ir.Constant(ir.IntType(32), backward.arg))
+          else: lvars[backward] = lvars[u]
         elif uop is UOps.ALU:
           lvars[u] = code_for_op[args](bb[-1], *[lvars[x] for x in vin], dtype if args not in (BinaryOps.CMPLT, BinaryOps.CMPNE) else vin[0].dtype)
+        elif uop is UOps.CAST and dtype.count > 1:
+          lvars[u] = ir.Constant(llvm_dtype(dtype), ir.Undefined)
+          for i,x in enumerate(vin):
+            lvars[u] = bb[-1].insert_element(lvars[u], cast(bb, lvars[x], x.dtype, dtype.scalar()), ir.Constant(ir.IntType(32), i))
         elif uop in {UOps.CAST, UOps.BITCAST}: lvars[u] = cast(bb, lvars[vin[0]], vin[0].dtype, dtype, bitcast=uop is UOps.BITCAST)
+        elif uop is UOps.GEP: lvars[u] = bb[-1].extract_element(lvars[vin[0]], ir.Constant(ir.IntType(32), args))
         elif uop in {UOps.DEFINE_GLOBAL, UOps.DEFINE_VAR}: lvars[u] = func.args[buf_index[args]]
         elif uop is UOps.SPECIAL: lvars[u] = lvars[args.expr]
         elif uop is UOps.CONST: lvars[u] = const(args, dtype)
@@ -13,21 +13,24 @@ class ClangGraph(GraphRunner):
   def __init__(self, jit_cache: List[ExecItem], input_rawbuffers: List[Buffer], var_vals: Dict[Variable, int]):
     super().__init__(jit_cache, input_rawbuffers, var_vals)
     if not all(isinstance(ji.prg, CompiledRunner) for ji in jit_cache): raise GraphException
+    # the batched function is single threaded
+    if any(cast(CompiledRunner, ji.prg).threads(var_vals) > 1 for ji in jit_cache): raise GraphException
 
     prgs = '\n'.join(dedup([cast(CompiledRunner, ji.prg).p.src for ji in jit_cache]))
     args = [f"{render_dtype(x.dtype)}* arg{i}" for i,x in enumerate(input_rawbuffers)]
     args += [f"int {v.expr}" for v in var_vals]
     code = ["void batched("+','.join(args)+") {"]
     for ji in jit_cache:
-      args = []
-      for buf in ji.bufs:
+      args, p = [], cast(CompiledRunner, ji.prg).p
+      for buf in [ji.bufs[i] for i,_ in p.globals]:
         assert buf is not None
         if buf in input_rawbuffers:
           args.append(f"arg{input_rawbuffers.index(buf)}")
         else:
           args.append(f"({render_dtype(buf.dtype)}*)0x{ctypes.addressof(buf._buf):X}")
-      args += [x.expr for x in cast(CompiledRunner, ji.prg).p.vars]
-      code.append(f"  {cast(CompiledRunner, ji.prg).p.function_name}({','.join(args)});")
+      thread_vals = {} if p.thread_vars is None else dict(zip(p.thread_vars, ("0", str(p.thread_vars[1].max))))
+      args += [thread_vals.get(x, x.expr) for x in p.vars]
+      code.append(f"  {p.function_name}({','.join(args)});")
     code.append("}")
     if DEBUG >= 4: print("\n".join(code))
     compiler = Device["CLANG"].compiler
@@ -1,6 +1,7 @@
-import ctypes, subprocess, pathlib, tempfile
+from typing import List, Optional
+import ctypes, _ctypes, subprocess, pathlib, tempfile, itertools, hashlib, weakref, os
 from tinygrad.device import Compiled, Compiler, MallocAllocator
-from tinygrad.helpers import cpu_time_execution, DEBUG, cpu_objdump
+from tinygrad.helpers import cpu_time_execution, DEBUG, cpu_objdump, diskcache_put
 from tinygrad.renderer.cstyle import ClangRenderer
 
 class ClangCompiler(Compiler):
@@ -10,15 +11,53 @@ class ClangCompiler(Compiler):
       subprocess.check_output(['clang', '-include', 'tgmath.h', '-shared', '-march=native', '-O2', '-Wall', '-Werror', '-x', 'c', '-fPIC', '-',
                                '-o', str(output_file.name)], input=src.encode('utf-8'))
       return pathlib.Path(output_file.name).read_bytes()
+  # one clang call and one shared object for many kernels, the function names must be unique
+  def compile_batch(self, srcs:List[str]) -> bytes:
+    lib = self.compile_cached("\n".join(srcs))
+    # each kernel is also cached on its own source, so loading it later doesn't compile it again
+    if self.cachekey is not None:
+      for src in srcs: diskcache_put(self.cachekey, src, lib)
+    return lib
+
+class ClangLib:
+  """A loaded shared object, it's unloaded when the last ClangProgram using it is gone."""
+  cnt = itertools.count()
+  def __init__(self, lib:bytes):
+    # dlopen gives back the already loaded lib for a path it has seen, so the path of every loaded lib must be unique.
+    # a memfd stays open while its lib is loaded, so no other lib gets its /proc/self/fd path
+    self.fd: Optional[int] = os.memfd_create("tinygrad_clang") if hasattr(os, "memfd_create") else None
+    if self.fd is not None:
+      try:
+        with open(self.fd, "wb", closefd=False) as f: f.write(lib)
+        self.dll = ctypes.CDLL(f"/proc/self/fd/{self.fd}")
+        return
+      except OSError: # no /proc
+        os.close(self.fd)
+        self.fd = None
+    fd, path = tempfile.mkstemp(prefix=f"tinygrad_clang_{next(ClangLib.cnt)}_", suffix=".so")
+    try:
+      with os.fdopen(fd, "wb") as f: f.write(lib)
+      self.dll = ctypes.CDLL(path)
+    finally: os.unlink(path)
+  # the functions are bound here, at exit the module globals may already be gone
+  def __del__(self, dlclose=_ctypes.dlclose, close=os.close):
+    # unload before the fd can be reused
+    if hasattr(self, "dll"): dlclose(self.dll._handle)
+    if self.fd is not None: close(self.fd)
+
+# programs compiled in one batch share the lib
+_libs: "weakref.WeakValueDictionary[bytes, ClangLib]" = weakref.WeakValueDictionary()
+def _load_lib(lib:bytes) -> ClangLib:
+  if (ret:=_libs.get(key:=hashlib.sha256(lib).digest())) is None: _libs[key] = ret = ClangLib(lib)
+  return ret
 
 class ClangProgram:
   def __init__(self, name:str, lib:bytes):
     if DEBUG >= 6: cpu_objdump(lib)
     self.name, self.lib = name, lib
-    # write to disk so we can load it
-    with tempfile.NamedTemporaryFile(delete=True) as cached_file_path:
-      pathlib.Path(cached_file_path.name).write_bytes(lib)
-      self.fxn = ctypes.CDLL(str(cached_file_path.name))[name]
+    # the ClangLib is kept so the function stays loaded
+    self.clib = _load_lib(lib)
+    self.fxn = self.clib.dll[name]
 
   def __call__(self, *bufs, vals=(), wait=False): return cpu_time_execution(lambda: self.fxn(*bufs, *vals), enable=wait)
 
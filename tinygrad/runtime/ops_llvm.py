@@ -1,21 +1,37 @@
 from __future__ import annotations
-import ctypes, functools
+import ctypes, functools, hashlib
 from typing import Tuple
 from tinygrad.device import Compiled, Compiler, MallocAllocator
-from tinygrad.helpers import DEBUG, cpu_time_execution, cpu_objdump
+from tinygrad.helpers import DEBUG, cpu_time_execution, cpu_objdump, getenv
 from tinygrad.renderer.llvmir import LLVMRenderer
 import llvmlite.binding as llvm
 
 class LLVMCompiler(Compiler):
-  def __init__(self, device:LLVMDevice):
-    self.device = device
-    super().__init__("compile_llvm")
+  def __init__(self, opt:int, cpu:str, features:str):
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    llvm.initialize_native_asmparser()
+    self.opt, self.cpu, self.features = opt, cpu, features
+    self.optimizer: llvm.passmanagers.ModulePassManager = llvm.create_module_pass_manager()
+    self.target_machine: llvm.targets.TargetMachine = \
+      llvm.Target.from_triple(llvm.get_process_triple()).create_target_machine(cpu=cpu, features=features, opt=opt)
+    self.target_machine.add_analysis_passes(self.optimizer)
+    with llvm.create_pass_manager_builder() as pmb:
+      pmb.opt_level, pmb.loop_vectorize, pmb.slp_vectorize = opt, opt >= 2, opt >= 2
+      pmb.populate(self.optimizer)
+    self.target_machine.set_asm_verbosity(True)
+    # the object code depends on the target machine too, not only on the source
+    super().__init__(f"compile_llvm_{opt}_{cpu}_{hashlib.md5(features.encode()).hexdigest()[:8]}")
+  # the target machine can't be pickled, a worker process (like the BEAM ones) makes its own
+  def __reduce__(self): return LLVMCompiler, (self.opt, self.cpu, self.features)
   def compile(self, src:str) -> bytes:
     mod = llvm.parse_assembly(src)
+    mod.triple, mod.data_layout = llvm.get_process_triple(), str(self.target_machine.target_data)
     mod.verify()
-    self.device.optimizer.run(mod)
-    if DEBUG >= 5: print(self.device.target_machine.emit_assembly(mod))
-    return self.device.target_machine.emit_object(mod)
+    self.optimizer.run(mod)
+    if DEBUG >= 5: print(self.target_machine.emit_assembly(mod))
+    return self.target_machine.emit_object(mod)
 
 class LLVMProgram:
   def __init__(self, device:LLVMDevice, name:str, lib:bytes):
@@ -33,14 +49,11 @@ class LLVMDevice(Compiled):
   def __init__(self, device:str):
     llvm.initialize()
     llvm.initialize_native_target()
-    llvm.initialize_native_asmprinter()
-    llvm.initialize_native_asmparser()
-    self.optimizer: llvm.passmanagers.ModulePassManager = llvm.create_module_pass_manager()
-    # this opt actually can change things. ex: opt=3 means no FMA, opt=2 means FMA
-    self.target_machine: llvm.targets.TargetMachine = llvm.Target.from_triple(llvm.get_process_triple()).create_target_machine(opt=2)
-    self.target_machine.add_analysis_passes(self.optimizer)
-    self.target_machine.set_asm_verbosity(True)
+    # LLVMOPT is the optimization level, LLVM_CPU and LLVM_FEATURES the target. they default to the host, "" and "" is a generic CPU
+    compiler = LLVMCompiler(getenv("LLVMOPT", 2), getenv("LLVM_CPU", llvm.get_host_cpu_name()),
+                            getenv("LLVM_FEATURES", llvm.get_host_cpu_features().flatten()))
     backing_mod = llvm.parse_assembly(str())
     backing_mod.triple = llvm.get_process_triple()
-    self.engine: llvm.executionengine.ExecutionEngine = llvm.create_mcjit_compiler(backing_mod, self.target_machine)
-    super().__init__(device, MallocAllocator, LLVMRenderer(), LLVMCompiler(self), functools.partial(LLVMProgram, self))
+    self.engine: llvm.executionengine.ExecutionEngine = llvm.create_mcjit_compiler(backing_mod, compiler.target_machine)
+    # LLVM_FASTMATH=1 lets reduces contract to FMAs and reassociate
+    super().__init__(device, MallocAllocator, LLVMRenderer(fastmath=getenv("LLVM_FASTMATH")), compiler, functools.partial(LLVMProgram, self))
@@ -3,11 +3,12 @@
 # this is the (living) definition of uops
 from typing import Tuple, List, Optional, Any, Dict
 import pickle, base64, itertools, time, struct
+import numpy as np
 from tinygrad.dtype import DType, dtypes, ImageDType
 from tinygrad.helpers import all_same, getenv, flatten
 from tinygrad.device import Compiled, Compiler, Allocator
 from tinygrad.codegen.uops import UOpGraph, UOps
-from tinygrad.ops import BinaryOps, TernaryOps, exec_alu
+from tinygrad.ops import UnaryOps, BinaryOps, TernaryOps, exec_alu, truncate
 from tinygrad.renderer import Renderer
 from tinygrad.renderer.cstyle import CUDARenderer, MetalRenderer, HIPRenderer
 
@@ -23,11 +24,148 @@ def _store(m, i, v):
   if i < 0 or i >= len(m): raise IndexError(f"store out of bounds, size is {len(m)}, access is {i}, value is {v}")
   m[i] = v
 
+# **************** vectorized emulator ****************
+
+# every uop is evaluated on all the threads of a launch at once, a value is a numpy array with one element per thread
+# the values are kept in the same precision as the python emulator: the truncated dtypes in their own numpy dtype, the rest as float64
+def _np_dtype(dtype:DType): return np.dtype(dtype.np) if dtype in truncate else np.dtype(np.float64)
+
+# DIV and MOD on ints round toward zero like C, abs is taken in int64 so the smallest int doesn't overflow
+def _div(x, y):
+  if x.dtype.kind == "u": return x // y
+  if x.dtype.kind == "i": return np.where((x < 0) != (y < 0), -1, 1) * (np.abs(x.astype(np.int64)) // np.abs(y.astype(np.int64)))
+  return np.where(y != 0, x / y, x * np.inf)
+def _mod(x, y):
+  if x.dtype.kind == "u": return x % y
+  x, y = (np.trunc(x), np.trunc(y)) if x.dtype.kind == "f" else (x.astype(np.int64), y.astype(np.int64))
+  return np.where(x < 0, -1, 1) * (np.abs(x) % np.abs(y))
+
+numpy_alu = {
+  UnaryOps.LOG2: np.log2, UnaryOps.EXP2: np.exp2, UnaryOps.SQRT: np.sqrt, UnaryOps.SIN: np.sin,
+  UnaryOps.NEG: lambda x: np.logical_not(x) if x.dtype == np.bool_ else np.negative(x),
+  BinaryOps.SHR: np.right_shift, BinaryOps.SHL: np.left_shift,
+  BinaryOps.MUL: np.multiply, BinaryOps.ADD: np.add, BinaryOps.SUB: np.subtract, BinaryOps.XOR: np.bitwise_xor,
+  BinaryOps.MAX: lambda x,y: np.where(y > x, y, x), BinaryOps.CMPNE: np.not_equal, BinaryOps.CMPLT: np.less, BinaryOps.MOD: _mod, BinaryOps.DIV: _div,
+  TernaryOps.WHERE: np.where}
+
+def exec_alu_np(op, dtype:DType, operands):
+  # like python floats, float math is done in float64 and rounded to the dtype after
+  if op not in {BinaryOps.CMPNE, BinaryOps.CMPLT, TernaryOps.WHERE}:
+    if dtypes.is_float(dtype): operands = [x.astype(np.float64) for x in operands]
+    elif dtype == dtypes.bool and op in {BinaryOps.ADD, BinaryOps.SUB, BinaryOps.MUL}: operands = [x.astype(np.int64) for x in operands]
+  with np.errstate(all="ignore"): return numpy_alu[op](*operands).astype(_np_dtype(dtype))
+
+def cast_np(x, dtype:DType):
+  if dtype == dtypes.bool: return x != 0
+  if dtypes.is_int(dtype):
+    with np.errstate(all="ignore"): return (np.trunc(x) if x.dtype.kind == "f" else x).astype(np.int64).astype(dtype.np)
+  return x.astype(dtype.np).astype(_np_dtype(dtype))
+
+class Buf:
+  # a buffer seen by all threads, a local buffer has a copy per workgroup that is stride elements apart
+  def __init__(self, m:np.ndarray, offset:Optional[np.ndarray]=None, stride:int=0): self.m, self.offset, self.stride = m, offset, stride
+  def idx(self, i:np.ndarray, gate:Optional[np.ndarray], op:str):
+    oob = (i < 0) | (i >= (sz:=len(self.m) if self.offset is None else self.stride))
+    if (oob:=oob if gate is None else oob & gate).any(): raise IndexError(f"{op} out of bounds, size is {sz} and access is {i[oob][0]}")
+    return i if self.offset is None else i + self.offset
+  def load(self, i:np.ndarray, gate:Optional[np.ndarray], default, dtype:DType):
+    i = self.idx(i, gate, "load")
+    if gate is None: return self.m[i].astype(_np_dtype(dtype))
+    return np.where(gate, self.m[np.where(gate, i, 0)], default).astype(_np_dtype(dtype))
+  def store(self, i:np.ndarray, v:np.ndarray, gate:Optional[np.ndarray]):
+    i = self.idx(i, gate, "store")
+    if gate is None: self.m[i] = v
+    else: self.m[i[gate]] = v[gate]
+
+def run_vectorized(uops:List[Tuple[UOps, Optional[DType], List[int], Any]], bufs, global_size:Tuple[int,int,int], local_size:Tuple[int,int,int],
+                   vals:Tuple[int, ...]):
+  warp, gids = np.indices(local_size[::-1]).reshape(3, -1), np.indices(global_size[::-1]).reshape(3, -1)
+  warp_size = warp.shape[1]
+  # workgroups don't see each other, so they run in chunks that keep the arrays small
+  groups = max(1, getenv("PYTHON_THREADS", 65536) // warp_size)
+  for g0 in range(0, gids.shape[1], groups):
+    idxs = gids[:, g0:g0+groups]
+    group, lane = np.arange(threads:=idxs.shape[1]*warp_size) // warp_size, np.tile(np.arange(warp_size), idxs.shape[1])
+    ul: Dict[int, Any] = {}
+    pbufs: List[memoryview] = list(bufs)
+    pvals: List[int] = list(vals)
+    i = 0
+    loop_ends: Dict[int, int] = {}
+    while i < len(uops):
+      uop, dtype, idp, arg = uops[i]
+      void_ops = {UOps.STORE, UOps.ENDRANGE, UOps.BARRIER, UOps.IF, UOps.ENDIF}
+      inp = [ul[v] for v in idp if uops[v][0] not in void_ops] if uop is not UOps.DEFINE_ACC else []
+      dtp = [uops[v][1] for v in idp if uops[v][0] not in void_ops]
+      if getenv("TRACE"): print(i, uop, dtype, arg, inp, dtp)
+      if uop is UOps.STORE:
+        gate = inp[3] if len(inp) == 4 else None
+        if dtp[2].count > 1:
+          for j,val in enumerate(inp[2]): inp[0].store(inp[1]+j, val, gate)
+        else: inp[0].store(inp[1], inp[2], gate)
+        i += 1
+        continue
+      elif uop is UOps.ENDRANGE:
+        loop_ends[idp[0]] = i
+        i = idp[0]
+        continue
+      elif uop in (UOps.BARRIER, UOps.IF, UOps.ENDIF):
+        i += 1
+        continue
+      assert dtype is not None, f"{uop} is missing a dtype"
+      if uop is UOps.DEFINE_GLOBAL:
+        assert dtype.fmt is not None
+        ul[i] = Buf(np.frombuffer(pbufs.pop(0), dtype=np.dtype(dtype.fmt)))
+      elif uop is UOps.DEFINE_LOCAL:
+        assert dtype.fmt is not None
+        ul[i] = Buf(np.zeros(idxs.shape[1]*arg[1], dtype=np.dtype(dtype.fmt)), group*arg[1], arg[1])
+      elif uop is UOps.DEFINE_VAR:
+        ul[i] = np.full(threads, pvals.pop(0), dtype=_np_dtype(dtype))
+      elif uop is UOps.SPECIAL:
+        if arg[1][0] == 'g': ul[i] = idxs[2-arg[0]][group].astype(_np_dtype(dtype))
+        elif arg[1][0] == 'l': ul[i] = warp[2-arg[0]][lane].astype(_np_dtype(dtype))
+        elif arg[1][0] == 'i': ul[i] = (idxs[2-arg[0]][group]*local_size[arg[0]] + warp[2-arg[0]][lane]).astype(_np_dtype(dtype))
+      elif uop in {UOps.CONST, UOps.DEFINE_ACC}:
+        # like in the python emulator, float consts aren't rounded to the dtype
+        val, cdt = arg[0] if uop is UOps.DEFINE_ACC else arg, np.float64 if dtypes.is_float(dtype) else _np_dtype(dtype.scalar())
+        ul[i] = [np.full(threads, val, dtype=cdt) for _ in range(dtype.count)] if dtype.count > 1 else np.full(threads, val, dtype=cdt)
+      elif uop is UOps.RANGE:
+        if i not in ul: ul[i] = np.full(threads, inp[0][0], dtype=_np_dtype(dtype))
+        else:
+          ul[i] += 1
+          if ul[i][0] == inp[1][0]:
+            del ul[i]
+            i = loop_ends[i] + 1
+            continue
+      elif uop in {UOps.CAST, UOps.BITCAST}:
+        if dtype.count > 1: ul[i] = inp
+        elif uop is UOps.BITCAST: ul[i] = inp[0].astype(dtp[0].np).view(dtype.np).astype(_np_dtype(dtype))
+        else: ul[i] = cast_np(inp[0], dtype)
+      elif uop is UOps.LOAD:
+        gate, default = (inp[2], inp[3]) if len(inp) == 4 else (None, None)
+        if dtype.count > 1:
+          ul[i] = [inp[0].load(inp[1]+j, gate, default[j] if dtp[-1].count > 1 else default, dtype.scalar()) for j in range(dtype.count)]
+        else: ul[i] = inp[0].load(inp[1], gate, default, dtype)
+      elif uop is UOps.PHI:
+        inp[0][:] = inp[1]
+        ul[i] = inp[0]
+      elif uop is UOps.GEP:
+        ul[i] = inp[0][arg]
+      elif uop is UOps.ALU:
+        assert all_same([dtype] + dtp) or arg in {BinaryOps.CMPNE, BinaryOps.CMPLT, TernaryOps.WHERE}, f"dtype mismatch on {arg}"
+        ul[i] = exec_alu_np(arg, dtype, inp)
+      assert i in ul, (uop, dtype, idp, arg)
+      i += 1
+
 class PythonProgram:
   def __init__(self, name:str, lib:bytes):
     self.uops: List[Tuple[UOps, Optional[DType], List[int], Any]] = pickle.loads(lib)
+    # the tensor cores and images only run in the python emulator
+    self.vectorized = getenv("PYTHON_NUMPY", 1) and not any(u is UOps.WMMA or isinstance(d, ImageDType) for u,d,_,_ in self.uops)
   def __call__(self, *bufs, global_size:Tuple[int,int,int]=(1,1,1), local_size:Tuple[int,int,int]=(1,1,1), vals:Tuple[int, ...]=(), wait=False):
     st = time.perf_counter()
+    if self.vectorized:
+      run_vectorized(self.uops, bufs, global_size, local_size, vals)
+      return time.perf_counter() - st
     warp = list(itertools.product(*[range(x) for x in local_size[::-1]]))
     warp_size = len(warp)
     for idxs in itertools.product(*[range(x) for x in global_size[::-1]]):
@@ -86,6 +224,8 @@ class PythonProgram:
             ul[i] = [idxs[2-arg[0]]] * warp_size
           elif arg[1][0] == 'l':
             ul[i] = [x[2-arg[0]] for x in warp]
+          elif arg[1][0] == 'i':
+            ul[i] = [idxs[2-arg[0]]*local_size[arg[0]] + x[2-arg[0]] for x in warp]
         elif uop is UOps.CONST:
           ul[i] = [[arg] * warp_size for _ in range(dtype.count)] if dtype.count > 1 else [arg] * warp_size
         elif uop is UOps.DEFINE_ACC:
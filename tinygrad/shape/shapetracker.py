@@ -18,6 +18,8 @@ def _expr_view(view:View, idxs:List[Node], valid:Optional[Node]=None) -> Tuple[N
 @dataclass(frozen=True)
 class ShapeTracker:
   views: Tuple[View, ...]
+  __slots__ = ("views",)
+  def __reduce__(self): return ShapeTracker, (self.views,)
 
   def __add__(self, st:ShapeTracker) -> ShapeTracker:
     ret = self
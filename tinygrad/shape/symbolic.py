@@ -1,18 +1,20 @@
 from __future__ import annotations
-import functools
+import functools, sys
 from math import gcd
-from tinygrad.helpers import partition
+from tinygrad.helpers import partition, cache
 from typing import List, Dict, Callable, Tuple, Type, Union, Optional, Any, Set, Mapping
 
 # NOTE: Python has different behavior for negative mod and floor div than c
 # symbolic matches the Python behavior, but the code output is agnostic, and will never have negative numbers in div or mod
 
 class Node:
+  __slots__ = ("min", "max", "_key", "_hash", "_bound")
   b: Union[Node, int]
   min: int
   max: sint
   def render(self, ops=None, ctx=None) -> Any:
     if ops is None: ops = render_python
+    if ctx == "DEBUG" and ops is render_python: return self.key
     assert self.__class__ in (Variable, NumNode) or self.min != self.max
     return ops[type(self)](self, ops, ctx)
   def vars(self) -> Set[Variable]: return set()
@@ -20,17 +22,34 @@ class Node:
   def substitute(self, var_vals: Mapping[Variable, Union[NumNode, Variable]]) -> Node: raise RuntimeError(self.__class__.__name__)
   def unbind(self) -> Tuple[Node, Optional[int]]: return self.substitute({v: v.unbind()[0] for v in self.vars() if v.val is not None}), None
 
-  @functools.cached_property
-  def key(self) -> str: return self.render(ctx="DEBUG")
-  @functools.cached_property
-  def hash(self) -> int: return hash(self.key)
+  # the DEBUG render is the key, it's built from the keys of the children so each node renders once. cached by hand, cached_property locks
+  @property
+  def key(self) -> str:
+    try: return self._key
+    except AttributeError: pass
+    assert self.__class__ in (Variable, NumNode) or self.min != self.max
+    self._key: str = sys.intern(render_python[type(self)](self, render_python, "DEBUG"))
+    return self._key
+  # a bound Variable has its value in the key, "=" isn't in the render of anything else
+  @property
+  def bound(self) -> bool:
+    try: return self._bound
+    except AttributeError: pass
+    self._bound: bool = "=" in self.key
+    return self._bound
+  @property
+  def hash(self) -> int:
+    try: return self._hash
+    except AttributeError: pass
+    self._hash: int = hash(self.key)
+    return self._hash
   def __repr__(self): return self.render(ctx="REPR")
   def __str__(self): return "<"+self.key+">"
   def __hash__(self): return self.hash
   def __bool__(self): return not (self.max == self.min == 0)
   def __eq__(self, other:object) -> bool:
     if not isinstance(other, Node): return NotImplemented
-    return self.key == other.key
+    return self is other or self.key == other.key
   def __neg__(self): return self*-1
   def __add__(self, b:Union[Node,int]): return Node.sum([self, NumNode(b) if isinstance(b, int) else b])
   def __radd__(self, b:int): return self+b
@@ -86,6 +105,13 @@ class Node:
     nodes = [x for x in nodes if x.max or x.min]
     if not nodes: return NumNode(0)
     if len(nodes) == 1: return nodes[0]
+    # bind changes a Variable in place after it's in the cache, sums with bound Variables aren't memoized
+    if any(x.bound for x in nodes): return Node._sum.__wrapped__(tuple(nodes))
+    return Node._sum(tuple(nodes))
+
+  @staticmethod
+  @cache()
+  def _sum(nodes:Tuple[Node, ...]) -> Node:
 
     mul_groups: Dict[Node, int] = {}
     num_node_sum = 0
@@ -110,6 +136,7 @@ class Node:
 # 4 basic node types
 
 class Variable(Node):
+  __slots__ = ("expr", "_val")
   def __new__(cls, *args):
     expr, nmin, nmax = args
     assert nmin >= 0 and nmin <= nmax, f"invalid Variable {expr=} {nmin=} {nmax=}"
@@ -117,6 +144,9 @@ class Variable(Node):
     return super().__new__(cls)
 
   def __getnewargs__(self): return (self.expr, self.min, self.max)  # args passed to __new__ when unpickling
+  # the key has the bound value, the hash doesn't so it's the same after a bind
+  @property
+  def hash(self) -> int: return hash((self.expr, self.min, self.max))
 
   def __init__(self, expr:str, nmin:int, nmax:sint):
     self.expr, self.min, self.max = expr, nmin, nmax
@@ -128,6 +158,8 @@ class Variable(Node):
   def bind(self, val):
     assert self._val is None and self.min<=val<=self.max, f"cannot bind {val} to {self}"
     self._val = val
+    if hasattr(self, "_key"): del self._key
+    if hasattr(self, "_bound"): del self._bound
     return self
   def unbind(self) -> Tuple[Variable, int]:
     assert self.val is not None, f"cannot unbind {self}"
@@ -136,6 +168,7 @@ class Variable(Node):
   def substitute(self, var_vals: Mapping[Variable, Union[NumNode, Variable]]) -> Node: return var_vals.get(self, self)
 
 class NumNode(Node):
+  __slots__ = ("b",)
   def __init__(self, num:int):
     assert isinstance(num, int), f"{num} is not an int"
     self.b:int = num
@@ -182,6 +215,7 @@ def create_lt_node(lhs:Node, b:Union[Node, int]):
 def create_ge_node(lhs:Node, b:Union[Node, int]): return create_lt_node(-lhs, -b+1)
 
 class OpNode(Node):
+  __slots__ = ("a", "b")
   def __init__(self, a:Node, b:Union[Node, int]):
     self.a, self.b = a, b
     self.min, self.max = self.get_bounds()
@@ -189,6 +223,7 @@ class OpNode(Node):
   def get_bounds(self) -> Tuple[int, sint]: raise NotImplementedError("must be implemented")
 
 class LtNode(OpNode):
+  __slots__ = ()
   def get_bounds(self) -> Tuple[int, int]:
     if self.a == self.b: return (0, 0)
     if isinstance(self.b, int): return (1, 1) if self.a.max < self.b else (0, 0) if self.a.min >= self.b else (0, 1)
@@ -197,6 +232,7 @@ class LtNode(OpNode):
     return create_lt_node(self.a.substitute(var_vals), (self.b if isinstance(self.b, int) else self.b.substitute(var_vals)))
 
 class MulNode(OpNode):
+  __slots__ = ()
   def __mul__(self, b: Union[Node, int]): return self.a*(self.b*b) # two muls in one mul
   def __floordiv__(self, b: Union[Node, int], factoring_allowed=False): # NOTE: mod negative isn't handled right
     if self.b % b == 0: return self.a*(self.b//b)
@@ -211,6 +247,7 @@ class MulNode(OpNode):
     return self.a.substitute(var_vals) * (self.b if isinstance(self.b, int) else self.b.substitute(var_vals))
 
 class DivNode(OpNode):
+  __slots__ = ()
   def __floordiv__(self, b: Union[Node, int], _=False): return self.a//(self.b*b) # two divs is one div
   def get_bounds(self) -> Tuple[int, sint]:
     assert self.a.min >= 0 and isinstance(self.b, int)
@@ -218,6 +255,7 @@ class DivNode(OpNode):
   def substitute(self, var_vals: Mapping[Variable, Union[NumNode, Variable]]) -> Node: return self.a.substitute(var_vals) // self.b
 
 class ModNode(OpNode):
+  __slots__ = ()
   def __mod__(self, b: Union[Node, int]):
     if isinstance(b, int) and isinstance(self.b, int) and self.b % b == 0: return self.a % b
     return Node.__mod__(self, b)
@@ -230,6 +268,7 @@ class ModNode(OpNode):
   def substitute(self, var_vals: Mapping[Variable, Union[NumNode, Variable]]) -> Node: return self.a.substitute(var_vals) % self.b
 
 class RedNode(Node):
+  __slots__ = ("nodes",)
   def __init__(self, nodes:List[Node]):
     self.nodes = nodes
     self.min, self.max = self.get_bounds()
@@ -237,10 +276,11 @@ class RedNode(Node):
   def get_bounds(self) -> Tuple[int, sint]: raise NotImplementedError("must be implemented")
 
 class SumNode(RedNode):
+  __slots__ = ()
   def get_bounds(self) -> Tuple[int, sint]: return sum([x.min for x in self.nodes]), sum([x.max for x in self.nodes])
-  @functools.lru_cache(maxsize=None)  # pylint: disable=method-cache-max-size-none
+  @cache()
   def __mul__(self, b: Union[Node, int]): return Node.sum([x*b for x in self.nodes]) # distribute mul into sum
-  @functools.lru_cache(maxsize=None)  # pylint: disable=method-cache-max-size-none
+  @cache()
   def __floordiv__(self, b: Union[Node, sint], factoring_allowed=True):
     if self == b: return NumNode(1)
     fully_divided: List[Node] = []
@@ -275,7 +315,7 @@ class SumNode(RedNode):
     if divisor > 1: return Node.sum(fully_divided) + Node.sum(rest).__floordiv__(divisor) // (b//divisor)
     return Node.sum(fully_divided) + Node.__floordiv__(Node.sum(rest), b)
 
-  @functools.lru_cache(maxsize=None)  # pylint: disable=method-cache-max-size-none
+  @cache()
   def __mod__(self, b: Union[Node, int]):
     if self == b: return NumNode(0)
     if isinstance(b, Node) and (b - self).min > 0: return self # b - self simplifies the node
@@ -291,6 +331,7 @@ class SumNode(RedNode):
   def flat_components(self): return [y for x in self.nodes for y in (x.flat_components if isinstance(x, SumNode) else [x])]
 
 class AndNode(RedNode):
+  __slots__ = ()
   def get_bounds(self) -> Tuple[int, sint]: return min([x.min for x in self.nodes]), max([x.max for x in self.nodes])
   def substitute(self, var_vals: Mapping[Variable, Union[NumNode, Variable]]) -> Node:
     subed = []